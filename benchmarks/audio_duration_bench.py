@@ -0,0 +1,110 @@
+# benchmarks/audio_duration_bench.py
+"""
+音声セグメントの長さの取得にかかる時間を計測するベンチマーク。
+ヘッダから求める方法 (modules.audio_metadata) と、従来の AudioFileClip を開いて .duration を読む方法
+（ffmpegのプロセスを起動する）を、WAV（VOICEVOX）とMP3（Google Cloud TTS）で比較する。
+MP3のサンプルはffmpeg（imageio-ffmpeg同梱のものを含む）で作成するため、ffmpegがない場合はWAVだけを計測する。
+
+例:
+    python benchmarks/audio_duration_bench.py --runs 20 --seconds 4
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import statistics
+import subprocess
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.fake_services import make_wav  # noqa: E402
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="音声の長さの取得方法のベンチマーク")
+    parser.add_argument("--runs", type=int, default=20, help="1つの方法あたりの計測回数")
+    parser.add_argument("--seconds", type=float, default=4.0, help="サンプル音声の長さ(秒)")
+    parser.add_argument("--json", type=str, default=None, help="結果をJSONで書き出すパス")
+    return parser.parse_args(argv)
+
+def _ffmpeg():
+    path = shutil.which("ffmpeg")
+    if path:
+        return path
+    try:
+        import imageio_ffmpeg
+        return imageio_ffmpeg.get_ffmpeg_exe()
+    except Exception:
+        return None
+
+def make_samples(workdir, seconds):
+    """計測に使う音声ファイル {形式: パス} を作成する"""
+    samples = {}
+    wav_path = os.path.join(workdir, "segment.wav")
+    with open(wav_path, "wb") as f:
+        f.write(make_wav(seconds))
+    samples["wav"] = wav_path
+    ffmpeg = _ffmpeg()
+    if ffmpeg:
+        mp3_path = os.path.join(workdir, "segment.mp3")
+        result = subprocess.run([ffmpeg, "-y", "-loglevel", "error", "-i", wav_path, "-b:a", "32k", mp3_path])
+        if result.returncode == 0:
+            samples["mp3"] = mp3_path
+    return samples
+
+def _audio_file_clip_duration(path):
+    """従来の方法（AudioFileClipを開いて長さを読む）"""
+    from moviepy.audio.io.AudioFileClip import AudioFileClip
+    clip = AudioFileClip(path)
+    duration = clip.duration
+    clip.close()
+    return duration
+
+def measure(fn, path, runs):
+    """1回あたりの所要時間（秒）の中央値と、得られた長さを返す"""
+    timings = []
+    result = None
+    for _ in range(runs):
+        start = time.perf_counter()
+        result = fn(path)
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings), result
+
+def run_benchmark(args):
+    from modules import audio_metadata
+
+    workdir = tempfile.mkdtemp(prefix="audio_duration_bench_")
+    report = {}
+    for fmt, path in make_samples(workdir, args.seconds).items():
+        header_seconds, header_duration = measure(audio_metadata.duration, path, args.runs)
+        clip_seconds, clip_duration = measure(_audio_file_clip_duration, path, args.runs)
+        report[fmt] = {
+            "header_us": header_seconds * 1_000_000,
+            "audio_file_clip_ms": clip_seconds * 1000,
+            "speedup": clip_seconds / header_seconds if header_seconds else None,
+            "header_duration": header_duration,
+            "audio_file_clip_duration": clip_duration,
+        }
+    return report
+
+def format_report(report):
+    lines = [f"{'format':<6} {'header(us)':>11} {'AudioFileClip(ms)':>18} {'speedup':>9} {'duration (header / clip)':>26}"]
+    for fmt, r in report.items():
+        lines.append(
+            f"{fmt:<6} {r['header_us']:>11.1f} {r['audio_file_clip_ms']:>18.1f} {r['speedup']:>8.0f}x "
+            f"{r['header_duration']:>12.3f} / {r['audio_file_clip_duration']:.3f}"
+        )
+    return "\n".join(lines)
+
+def main(argv=None):
+    args = parse_args(argv)
+    report = run_benchmark(args)
+    print(format_report(report))
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+if __name__ == "__main__":
+    main()
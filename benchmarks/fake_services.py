@@ -0,0 +1,328 @@
+# benchmarks/fake_services.py
+"""
+ベンチマーク用のローカル代替サービス。
+Stable Diffusion (A1111) の txt2img、VOICEVOX の audio_query/synthesis、
+YouTube の resumable upload をHTTPサーバーとして、Gemini を GenerativeModel のスタブとして提供する。
+いずれも遅延とペイロードサイズを設定できる。
+"""
+import io
+import re
+import json
+import time
+import uuid
+import wave
+import zlib
+import base64
+import struct
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+def make_png(width, height, padding_bytes=0, color=(40, 80, 160)):
+    """単色のPNGを生成する。padding_bytesを指定すると補助チャンクでサイズを水増しする"""
+    def chunk(tag, data):
+        body = tag + data
+        return struct.pack(">I", len(data)) + body + struct.pack(">I", zlib.crc32(body) & 0xffffffff)
+
+    row = b"\x00" + bytes(color) * width
+    raw = zlib.compress(row * height, 6)
+    png = b"\x89PNG\r\n\x1a\n"
+    png += chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0))
+    if padding_bytes:
+        # 小文字始まりのチャンクは補助チャンクとしてデコーダに無視される
+        png += chunk(b"bnCh", b"\x00" * padding_bytes)
+    png += chunk(b"IDAT", raw)
+    png += chunk(b"IEND", b"")
+    return png
+
+def make_wav(duration, sampling_rate=24000):
+    """指定秒数の無音WAV (16bit モノラル) を生成する"""
+    buf = io.BytesIO()
+    with wave.open(buf, "wb") as w:
+        w.setnchannels(1)
+        w.setsampwidth(2)
+        w.setframerate(sampling_rate)
+        w.writeframes(b"\x00\x00" * int(duration * sampling_rate))
+    return buf.getvalue()
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass  # ベンチマーク出力を汚さない
+
+    def _read_body(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        return self.rfile.read(length) if length else b""
+
+    def _send(self, status, body=b"", content_type="application/json", headers=None):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_json(self, data, status=200, headers=None):
+        self._send(status, json.dumps(data).encode("utf-8"), headers=headers)
+
+    def do_GET(self):
+        self.server.owner.handle(self, "GET")
+
+    def do_POST(self):
+        self.server.owner.handle(self, "POST")
+
+    def do_PUT(self):
+        self.server.owner.handle(self, "PUT")
+
+class FakeServer:
+    """
+    ルーティングだけを共通化した簡易HTTPサーバー。
+    サブクラスは routes に (メソッド, パス) -> ハンドラ を登録する。
+    """
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.request_count = 0
+        self.bytes_sent = 0
+        self._lock = threading.Lock()
+        self._httpd = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+        self._httpd.daemon_threads = True
+        self._httpd.owner = self
+        self._thread = None
+        self.routes = {}
+
+    @property
+    def url(self):
+        host, port = self._httpd.server_address
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def handle(self, handler, method):
+        parsed = urlparse(handler.path)
+        route = self.routes.get((method, parsed.path))
+        if route is None:
+            for (m, prefix), fn in self.routes.items():
+                if m == method and prefix.endswith("/") and parsed.path.startswith(prefix):
+                    route = fn
+                    break
+        if route is None:
+            handler._send_json({"detail": "Not Found"}, status=404)
+            return
+        with self._lock:
+            self.request_count += 1
+        route(handler, parsed, parse_qs(parsed.query))
+
+    def sleep(self, seconds=None):
+        delay = self.latency if seconds is None else seconds
+        if delay:
+            time.sleep(delay)
+
+    def count_bytes(self, n):
+        with self._lock:
+            self.bytes_sent += n
+
+class FakeStableDiffusion(FakeServer):
+    """
+    A1111 WebUI API (/sdapi/v1/txt2img) の代替。
+    latency_per_megapixel を指定すると、要求された画素数に比例した待ち時間を加える。
+    gpus を指定すると、同時に処理するリクエストをその数に制限する（GPUの台数を模擬する）。
+    payload_bytes_per_megapixel を指定すると、画像のサイズを画素数に比例させる（実際のPNGに近づける）。
+    """
+
+    def __init__(self, latency=0.0, latency_per_megapixel=0.0, payload_bytes=0, gpus=None, payload_bytes_per_megapixel=0):
+        super().__init__(latency)
+        self.latency_per_megapixel = latency_per_megapixel
+        self.payload_bytes = payload_bytes
+        self.payload_bytes_per_megapixel = payload_bytes_per_megapixel
+        self.pixels_rendered = 0
+        self.gpu_seconds = 0.0
+        self._gpus = threading.Semaphore(gpus) if gpus else None
+        self.routes = {
+            ("POST", "/sdapi/v1/txt2img"): self._txt2img,
+            ("GET", "/sdapi/v1/options"): lambda h, p, q: h._send_json({}),
+            ("GET", "/internal/ping"): lambda h, p, q: h._send_json({}),
+        }
+
+    def _txt2img(self, handler, parsed, query):
+        payload = json.loads(handler._read_body() or b"{}")
+        width = int(payload.get("width", 512))
+        height = int(payload.get("height", 512))
+        count = max(1, int(payload.get("batch_size", 1))) * max(1, int(payload.get("n_iter", 1)))
+        with self._lock:
+            self.pixels_rendered += width * height * count
+        delay = self.latency + self.latency_per_megapixel * width * height * count / 1_000_000
+        with self._lock:
+            self.gpu_seconds += delay
+        if self._gpus:
+            with self._gpus:
+                self.sleep(delay)
+        else:
+            self.sleep(delay)
+        png = make_png(width, height, self.payload_bytes + int(self.payload_bytes_per_megapixel * width * height / 1_000_000))
+        images = [base64.b64encode(png).decode("ascii")] * count
+        body = json.dumps({"images": images, "parameters": payload, "info": "{}"}).encode("utf-8")
+        self.count_bytes(len(body))
+        handler._send(200, body)
+
+class FakeVoicevox(FakeServer):
+    """VOICEVOX Engine (/audio_query, /synthesis) の代替。文字数に比例した長さの無音WAVを返す"""
+
+    def __init__(self, latency=0.0, seconds_per_char=0.15):
+        super().__init__(latency)
+        self.seconds_per_char = seconds_per_char
+        self.routes = {
+            ("POST", "/audio_query"): self._audio_query,
+            ("POST", "/synthesis"): self._synthesis,
+            ("GET", "/version"): lambda h, p, q: h._send_json("0.0.0-fake"),
+        }
+
+    def _audio_query(self, handler, parsed, query):
+        handler._read_body()
+        self.sleep()
+        text = query.get("text", [""])[0]
+        handler._send_json({
+            "accent_phrases": [],
+            "speedScale": 1.0,
+            "pitchScale": 0.0,
+            "intonationScale": 1.0,
+            "volumeScale": 1.0,
+            "prePhonemeLength": 0.1,
+            "postPhonemeLength": 0.1,
+            "outputSamplingRate": 24000,
+            "outputStereo": False,
+            "kana": text,
+        })
+
+    def _synthesis(self, handler, parsed, query):
+        query_data = json.loads(handler._read_body() or b"{}")
+        self.sleep()
+        sampling_rate = int(query.get("outputSamplingRate", [24000])[0])
+        text = query_data.get("kana", "")
+        wav = make_wav(max(0.2, len(text) * self.seconds_per_char), sampling_rate)
+        self.count_bytes(len(wav))
+        handler._send(200, wav, content_type="audio/wav")
+
+class FakeYouTubeUpload(FakeServer):
+    """YouTube Data API の resumable upload の代替"""
+
+    def __init__(self, latency=0.0):
+        super().__init__(latency)
+        self.sessions = {}
+        self.completed = []
+        self.routes = {
+            ("POST", "/upload/youtube/v3/videos"): self._start,
+            ("PUT", "/upload/session/"): self._put,
+        }
+
+    def _start(self, handler, parsed, query):
+        metadata = json.loads(handler._read_body() or b"{}")
+        session_id = uuid.uuid4().hex
+        with self._lock:
+            self.sessions[session_id] = {"metadata": metadata, "received": 0}
+        handler._send(200, b"", headers={"Location": f"{self.url}/upload/session/{session_id}"})
+
+    def _put(self, handler, parsed, query):
+        session_id = parsed.path.rsplit("/", 1)[-1]
+        body = handler._read_body()
+        session = self.sessions.get(session_id)
+        if session is None:
+            handler._send_json({"error": "unknown session"}, status=404)
+            return
+        self.sleep()
+        session["received"] += len(body)
+        content_range = handler.headers.get("Content-Range", "")
+        match = re.match(r"bytes (\d+)-(\d+)/(\d+)", content_range)
+        if match and int(match.group(2)) + 1 < int(match.group(3)):
+            # 途中のチャンク: 308 Resume Incomplete
+            handler._send(308, b"", headers={"Range": f"bytes=0-{match.group(2)}"})
+            return
+        video_id = f"fake{session_id[:8]}"
+        with self._lock:
+            self.completed.append(video_id)
+        handler._send_json({"id": video_id, "snippet": session["metadata"].get("snippet", {})})
+
+class _FakeResponse:
+    def __init__(self, text):
+        self.text = text
+
+class FakeGenerativeModel:
+    """
+    google.generativeai.GenerativeModel のスタブ。
+    台本生成のプロンプトには【台本】形式の文章を、画像プロンプト生成には指定件数の行を返す。
+    """
+    latency = 0.0
+    sentences = 12
+    sentence_chars = 25
+    calls = 0
+    _lock = threading.Lock()
+
+    def __init__(self, model_name=None, *args, **kwargs):
+        self.model_name = model_name
+
+    @classmethod
+    def configure(cls, latency=None, sentences=None, sentence_chars=None):
+        if latency is not None:
+            cls.latency = latency
+        if sentences is not None:
+            cls.sentences = sentences
+        if sentence_chars is not None:
+            cls.sentence_chars = sentence_chars
+        cls.calls = 0
+
+    def _build_text(self, prompt):
+        with FakeGenerativeModel._lock:
+            FakeGenerativeModel.calls += 1
+        match = re.search(r"Generate exactly (\d+)", prompt)
+        if match:
+            num = int(match.group(1))
+            return "\n".join(f"A cinematic scene number {i + 1} about the topic, dramatic lighting." for i in range(num))
+        filler = "あ" * max(1, self.sentence_chars - 6)
+        lines = [f"第{i + 1}の文{filler}です。" for i in range(self.sentences)]
+        script = "\n".join(lines)
+        return f"【台本】\n{script}\n\n【文字数】{len(script)}文字\n\n【構成メモ】\n- フック：テスト"
+
+    def _stream(self, text, step=16):
+        # 遅延をチャンク全体に分散させ、逐次生成されるレスポンスを模擬する
+        chunks = [text[i:i + step] for i in range(0, len(text), step)]
+        for chunk in chunks:
+            if self.latency:
+                time.sleep(self.latency / len(chunks))
+            yield _FakeResponse(chunk)
+
+    def _build_json(self, prompt):
+        # 台本と画像プロンプトをまとめて生成する場合のJSON形式の応答
+        with FakeGenerativeModel._lock:
+            FakeGenerativeModel.calls += 1
+        filler = "あ" * max(1, self.sentence_chars - 6)
+        lines = [
+            {"narration": f"第{i + 1}の文{filler}です。", "image_prompt": f"A cinematic scene number {i + 1}, dramatic lighting."}
+            for i in range(self.sentences)
+        ]
+        return json.dumps({"lines": lines}, ensure_ascii=False)
+
+    def generate_content(self, prompt, stream=False, generation_config=None, **kwargs):
+        if (generation_config or {}).get("response_mime_type") == "application/json":
+            text = self._build_json(prompt)
+        else:
+            text = self._build_text(prompt)
+        if stream:
+            return self._stream(text)
+        if self.latency:
+            time.sleep(self.latency)
+        return _FakeResponse(text)
@@ -0,0 +1,238 @@
+# benchmarks/pipeline_bench.py
+"""
+実APIを使わずにパイプライン全体のスループットを計測するベンチマーク。
+Stable Diffusion / VOICEVOX / YouTube をローカルの代替サーバーに、Gemini をスタブに差し替え、
+make_short.process_single_video を N テーマ分実行して videos/hour、ステージ別 p50/p95、ピークRSSを報告する。
+
+例:
+    python benchmarks/pipeline_bench.py --themes 6 --workers 3 --sd-latency 2.0 --tts-latency 0.2
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import resource
+import tempfile
+from unittest.mock import patch
+
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.fake_services import (  # noqa: E402
+    FakeStableDiffusion, FakeVoicevox, FakeYouTubeUpload, FakeGenerativeModel,
+)
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="オフライン・エンドツーエンドのパイプラインベンチマーク")
+    parser.add_argument("--themes", type=int, default=3, help="生成する動画の本数")
+    parser.add_argument("--workers", type=int, default=1, help="同時に処理するテーマ数 (batch.workers)")
+    parser.add_argument("--gemini-latency", type=float, default=1.0, help="Gemini 1呼び出しあたりの遅延(秒)")
+    parser.add_argument("--sentences", type=int, default=12, help="スタブ台本の文数")
+    parser.add_argument("--sd-latency", type=float, default=1.0, help="txt2img 1リクエストあたりの固定遅延(秒)")
+    parser.add_argument("--sd-gpus", type=int, default=None, help="SDの代替サーバーが同時に処理するリクエスト数 (GPUの台数)")
+    parser.add_argument("--sd-concurrency", type=int, default=2, help="SDへ同時に送るリクエスト数 (stable_diffusion.concurrency)")
+    parser.add_argument("--sd-latency-per-mp", type=float, default=0.0, help="txt2img の1メガピクセルあたりの追加遅延(秒)")
+    parser.add_argument("--sd-payload-bytes", type=int, default=0, help="生成画像に付加するダミーデータのバイト数")
+    parser.add_argument("--image-size", type=str, default="512x896", help="SDの生成サイズ (幅x高さ)")
+    parser.add_argument("--tts-latency", type=float, default=0.2, help="VOICEVOX 1リクエストあたりの遅延(秒)")
+    parser.add_argument("--upload-latency", type=float, default=0.5, help="アップロード1チャンクあたりの遅延(秒)")
+    parser.add_argument("--resolution", type=str, default="360x640", help="出力動画の解像度 (幅x高さ)")
+    parser.add_argument("--fake-compose", type=float, default=None, metavar="SECONDS",
+                        help="動画合成を指定秒数の待ちに置き換える (ネットワーク待ちのステージだけを計測する場合)")
+    parser.add_argument("--stream-script", action="store_true",
+                        help="台本をストリーミングで生成し、書き終わった文から音声合成を始める")
+    parser.add_argument("--combined-script", action="store_true",
+                        help="台本と画像プロンプトを1回のGemini呼び出しでまとめて生成する")
+    parser.add_argument("--settings", type=str, default=None, help="ベース設定に上書きするYAML/JSONファイル")
+    parser.add_argument("--json", type=str, default=None, help="結果をJSONで書き出すパス")
+    return parser.parse_args(argv)
+
+def build_settings(args, sd, voicevox):
+    width, height = (int(v) for v in args.image_size.split("x"))
+    res_w, res_h = (int(v) for v in args.resolution.split("x"))
+    settings = {
+        "api_keys": {"gemini": "fake-key"},
+        "audio_engine": "voicevox",
+        "voicevox": {"api_url": voicevox.url, "speaker_id": 1},
+        "script_generation": {"length": "short", "stream": args.stream_script, "combined": args.combined_script},
+        "image": {
+            "api_priority": ["stable_diffusion"],
+            "enabled_apis": {"stable_diffusion": True},
+            "stable_diffusion": {"url": f"{sd.url}/sdapi/v1/txt2img", "width": width, "height": height, "steps": 20,
+                                 "concurrency": args.sd_concurrency},
+        },
+        "video": {"resolution": [res_w, res_h], "image_duration": 1.0, "fps": 10},
+        "bgm": {},
+        "subtitle": {},
+        "youtube": {"post_to_youtube": True},
+        "batch": {"workers": args.workers},
+        "checkpoint": {"enabled": False},
+        "logging": {"level": "WARNING"},
+    }
+    if args.settings:
+        with open(args.settings, "r", encoding="utf-8") as f:
+            if args.settings.endswith(".json"):
+                overrides = json.load(f)
+            else:
+                import yaml
+                overrides = yaml.safe_load(f)
+        _deep_update(settings, overrides or {})
+    return settings
+
+def _deep_update(base, overrides):
+    for key, value in overrides.items():
+        if isinstance(value, dict) and isinstance(base.get(key), dict):
+            _deep_update(base[key], value)
+        else:
+            base[key] = value
+
+def make_fake_uploader(upload_server, chunk_size=256 * 1024):
+    """post_log_manager.upload_video の代わりに、代替サーバーへ resumable upload を行う関数を返す"""
+    def upload_video(video_path, title, description, tags, category_id, privacy_status, settings, thumbnail_path=None):
+        body = {"snippet": {"title": title, "description": description, "tags": tags, "categoryId": category_id},
+                "status": {"privacyStatus": privacy_status}}
+        start = requests.post(f"{upload_server.url}/upload/youtube/v3/videos?uploadType=resumable", json=body)
+        start.raise_for_status()
+        session_url = start.headers["Location"]
+        total = os.path.getsize(video_path)
+        with open(video_path, "rb") as f:
+            offset = 0
+            while True:
+                chunk = f.read(chunk_size)
+                end = offset + len(chunk) - 1
+                r = requests.put(session_url, data=chunk, headers={"Content-Range": f"bytes {offset}-{end}/{total}"})
+                if r.status_code != 308:
+                    r.raise_for_status()
+                    break
+                offset += len(chunk)
+        if callable(thumbnail_path):
+            thumbnail_path()
+        return True
+    return upload_video
+
+def make_fake_compose(seconds):
+    """一定時間待ってダミーの動画ファイルを書き出す compose_video の代替"""
+    def compose_video(theme, images, audio_segments_info, bgm_path, subtitle_file, settings):
+        time.sleep(seconds)
+        os.makedirs("output/videos", exist_ok=True)
+        path = os.path.join("output/videos", f"{abs(hash((theme, time.time())))}.mp4")
+        with open(path, "wb") as f:
+            f.write(b"\x00" * 1024 * 1024)
+        return path
+    return compose_video
+
+def percentile(values, q):
+    """線形補間による百分位数"""
+    if not values:
+        return 0.0
+    values = sorted(values)
+    pos = (len(values) - 1) * q
+    lower = int(pos)
+    upper = min(lower + 1, len(values) - 1)
+    return values[lower] + (values[upper] - values[lower]) * (pos - lower)
+
+def stage_latencies(spans):
+    """スパン名ごとの件数と p50/p95 (秒)"""
+    grouped = {}
+    for s in spans:
+        grouped.setdefault(s["name"], []).append(s["dur"] / 1_000_000)
+    return {
+        name: {"count": len(v), "p50": percentile(v, 0.50), "p95": percentile(v, 0.95)}
+        for name, v in grouped.items()
+    }
+
+def peak_rss_mb():
+    """自プロセスと子プロセス（エンコード用ワーカー）それぞれのピークRSS (MB)"""
+    self_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    children_kb = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    scale = 1024 * 1024 if sys.platform == "darwin" else 1024  # macOSはバイト単位
+    return self_kb / scale, children_kb / scale
+
+def run_benchmark(args):
+    import make_short
+    from modules import tracing, clients
+    from modules.batch_scheduler import BatchScheduler
+
+    FakeGenerativeModel.configure(latency=args.gemini_latency, sentences=args.sentences)
+
+    with FakeStableDiffusion(args.sd_latency, args.sd_latency_per_mp, args.sd_payload_bytes, gpus=args.sd_gpus) as sd, \
+            FakeVoicevox(args.tts_latency) as voicevox, \
+            FakeYouTubeUpload(args.upload_latency) as uploader:
+        settings = build_settings(args, sd, voicevox)
+        themes = [f"ベンチマークテーマ{i + 1}" for i in range(args.themes)]
+
+        patches = [
+            patch("google.generativeai.GenerativeModel", FakeGenerativeModel),
+            patch("google.generativeai.configure", lambda **kwargs: None),
+            patch("modules.post_log_manager.upload_video", make_fake_uploader(uploader)),
+        ]
+        if args.fake_compose is not None:
+            fake_compose = make_fake_compose(args.fake_compose)
+            patches.append(patch("modules.video_composer.compose_video", fake_compose))
+            patches.append(patch.object(BatchScheduler, "compose_video", lambda self, *a: fake_compose(*a)))
+
+        workdir = tempfile.mkdtemp(prefix="pipeline_bench_")
+        cwd = os.getcwd()
+        os.chdir(workdir)
+        for p in patches:
+            p.start()
+        tracing.reset()
+        tracing.enable()
+        try:
+            make_short.setup_directories()
+            start = time.perf_counter()
+            results = BatchScheduler(settings).run(themes, make_short.process_single_video, settings)
+            elapsed = time.perf_counter() - start
+        finally:
+            tracing.disable()
+            for p in reversed(patches):
+                p.stop()
+            # 偽のGeminiモデルが共有クライアントとして残らないようにする
+            clients.reset()
+            os.chdir(cwd)
+
+        succeeded = sum(1 for r in results if r)
+        rss_self, rss_children = peak_rss_mb()
+        return {
+            "themes": args.themes,
+            "workers": args.workers,
+            "succeeded": succeeded,
+            "elapsed_seconds": elapsed,
+            "videos_per_hour": succeeded / elapsed * 3600 if elapsed else 0.0,
+            "stages": stage_latencies(tracing.get_spans()),
+            "peak_rss_mb": {"self": rss_self, "children": rss_children},
+            "requests": {
+                "gemini": FakeGenerativeModel.calls,
+                "stable_diffusion": sd.request_count,
+                "voicevox": voicevox.request_count,
+                "youtube_upload": uploader.request_count,
+            },
+            "bytes_from_sd": sd.bytes_sent,
+            "workdir": workdir,
+        }
+
+def format_report(report):
+    lines = [
+        f"動画: {report['succeeded']}/{report['themes']}本成功 (workers={report['workers']})",
+        f"経過時間: {report['elapsed_seconds']:.2f}秒  スループット: {report['videos_per_hour']:.1f} videos/hour",
+        f"ピークRSS: 本体 {report['peak_rss_mb']['self']:.0f}MB / 子プロセス {report['peak_rss_mb']['children']:.0f}MB",
+        "リクエスト数: " + ", ".join(f"{k}={v}" for k, v in report["requests"].items()),
+        "",
+        f"{'span':<32} {'count':>6} {'p50(s)':>9} {'p95(s)':>9}",
+    ]
+    for name, s in sorted(report["stages"].items(), key=lambda item: item[1]["p95"], reverse=True):
+        lines.append(f"{name:<32} {s['count']:>6} {s['p50']:>9.3f} {s['p95']:>9.3f}")
+    return "\n".join(lines)
+
+def main(argv=None):
+    args = parse_args(argv)
+    report = run_benchmark(args)
+    print(format_report(report))
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+# benchmarks/sd_upscale_bench.py
+"""
+Stable Diffusionで動画の解像度のまま生成する場合と、縮小したサイズで生成してローカルのCPUで拡大する場合を比較するベンチマーク。
+SDをローカルの代替サーバーに差し替え、動画1本分の画像を生成して、GPU秒・SDから受信したバイト数・ローカルでの拡大にかかった時間を報告する。
+
+例:
+    python benchmarks/sd_upscale_bench.py --images 12 --image-size 1024x1792 --render-scale 0.5
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.fake_services import FakeStableDiffusion  # noqa: E402
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="SDの低解像度生成+ローカルアップスケールのベンチマーク")
+    parser.add_argument("--images", type=int, default=12, help="動画1本あたりの画像枚数")
+    parser.add_argument("--image-size", type=str, default="1024x1792", help="SDの設定上の生成サイズ (幅x高さ)")
+    parser.add_argument("--resolution", type=str, default="1080x1920", help="出力動画の解像度 (幅x高さ)")
+    parser.add_argument("--render-scale", type=float, default=0.5, help="アップスケール時にSDで生成するサイズの倍率")
+    parser.add_argument("--sd-latency", type=float, default=0.05, help="txt2img 1リクエストあたりの固定遅延(秒)")
+    parser.add_argument("--sd-latency-per-mp", type=float, default=1.0, help="txt2img の1メガピクセルあたりの遅延(秒)")
+    parser.add_argument("--sd-bytes-per-mp", type=int, default=1_500_000, help="生成画像の1メガピクセルあたりのバイト数")
+    parser.add_argument("--sd-concurrency", type=int, default=2, help="SDへ同時に送るリクエスト数")
+    parser.add_argument("--json", type=str, default=None, help="結果をJSONで書き出すパス")
+    return parser.parse_args(argv)
+
+def run_mode(args, upscale_enabled):
+    from modules import tracing, clients
+    from modules.image_manager import _generate_images_sd
+
+    width, height = (int(v) for v in args.image_size.split("x"))
+    res_w, res_h = (int(v) for v in args.resolution.split("x"))
+    with FakeStableDiffusion(args.sd_latency, args.sd_latency_per_mp,
+                             payload_bytes_per_megapixel=args.sd_bytes_per_mp) as sd:
+        settings = {
+            "runtime_scratch_dir": tempfile.mkdtemp(prefix="sd_upscale_bench_"),
+            "video": {"resolution": [res_w, res_h]},
+            "image": {"stable_diffusion": {
+                "url": f"{sd.url}/sdapi/v1/txt2img", "width": width, "height": height,
+                "concurrency": args.sd_concurrency,
+                "upscale": {"enabled": upscale_enabled, "render_scale": args.render_scale},
+            }},
+        }
+        tracing.reset()
+        tracing.enable()
+        try:
+            start = time.perf_counter()
+            # 同じプロンプトはbatch_sizeでまとめられるため、すべて別のプロンプトにする
+            paths = _generate_images_sd([f"scene {i}" for i in range(args.images)], settings)
+            elapsed = time.perf_counter() - start
+        finally:
+            tracing.disable()
+            clients.reset()
+        spans = tracing.get_spans()
+        return {
+            "images": len(paths),
+            "elapsed_seconds": elapsed,
+            "gpu_seconds": sd.gpu_seconds,
+            "bytes_from_sd": sum(s["args"].get("bytes", 0) for s in spans if s["name"] == "sd.txt2img"),
+            "upscale_cpu_seconds": sum(s["dur"] for s in spans if s["name"] == "image.upscale") / 1_000_000,
+            "megapixels_rendered": sd.pixels_rendered / 1_000_000,
+        }
+
+def run_benchmark(args):
+    return {"full_resolution": run_mode(args, False), "upscaled": run_mode(args, True)}
+
+def format_report(report):
+    lines = [f"{'mode':<16} {'images':>6} {'GPU秒':>8} {'受信MB':>8} {'拡大CPU秒':>10} {'経過秒':>8}"]
+    for mode, r in report.items():
+        lines.append(
+            f"{mode:<16} {r['images']:>6} {r['gpu_seconds']:>8.2f} {r['bytes_from_sd'] / 1024 / 1024:>8.1f} "
+            f"{r['upscale_cpu_seconds']:>10.2f} {r['elapsed_seconds']:>8.2f}"
+        )
+    full, upscaled = report["full_resolution"], report["upscaled"]
+    if full["gpu_seconds"] and full["bytes_from_sd"]:
+        lines.append(
+            f"GPU秒: {upscaled['gpu_seconds'] / full['gpu_seconds']:.0%}  "
+            f"受信バイト数: {upscaled['bytes_from_sd'] / full['bytes_from_sd']:.0%} (フル解像度に対する割合)"
+        )
+    return "\n".join(lines)
+
+def main(argv=None):
+    args = parse_args(argv)
+    report = run_benchmark(args)
+    print(format_report(report))
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+if __name__ == "__main__":
+    main()
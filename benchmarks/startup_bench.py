@@ -0,0 +1,66 @@
+# benchmarks/startup_bench.py
+"""
+CLIの起動時間を計測するベンチマーク。
+新しいPythonプロセスで `make_short.py --help` を繰り返し実行し、中央値が予算を超えた場合は終了コード1を返す。
+あわせて、起動時に重い依存ライブラリが読み込まれていないかを確認する。
+
+例:
+    python benchmarks/startup_bench.py --runs 5 --budget 1.0
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import statistics
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# 起動時に読み込まれてはいけない（実際に使う時点で読み込む）モジュール
+HEAVY_MODULES = (
+    "moviepy",
+    "google.generativeai",
+    "google.cloud.texttospeech",
+    "googleapiclient",
+    "openai",
+    "feedparser",
+)
+
+def heavy_modules_loaded():
+    """make_shortをimportした直後に読み込まれている重いモジュールの一覧"""
+    code = (
+        "import sys, json, make_short\n"
+        f"print(json.dumps([m for m in {HEAVY_MODULES!r} if m in sys.modules]))"
+    )
+    out = subprocess.run([sys.executable, "-c", code], cwd=ROOT, capture_output=True, text=True, check=True)
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+def time_help(runs):
+    """`make_short.py --help` の実行時間（秒）をruns回計測する"""
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, "make_short.py", "--help"], cwd=ROOT, capture_output=True, check=True)
+        timings.append(time.perf_counter() - start)
+    return timings
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="CLIの起動時間ベンチマーク")
+    parser.add_argument("--runs", type=int, default=5, help="計測回数")
+    parser.add_argument("--budget", type=float, default=1.0, help="起動時間の予算（秒、中央値で判定）")
+    args = parser.parse_args(argv)
+
+    loaded = heavy_modules_loaded()
+    timings = time_help(args.runs)
+    median = statistics.median(timings)
+
+    print(f"make_short.py --help: 中央値 {median:.3f}秒 / 最小 {min(timings):.3f}秒 / 最大 {max(timings):.3f}秒 ({args.runs}回)")
+    print(f"起動時に読み込まれた重いモジュール: {', '.join(loaded) if loaded else 'なし'}")
+
+    ok = median <= args.budget and not loaded
+    print(f"予算 {args.budget:.2f}秒: {'OK' if ok else 'NG'}")
+    return 0 if ok else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
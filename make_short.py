@@ -2,17 +2,30 @@
 import os
 import traceback
 import logging
+from datetime import datetime
 from modules.input_manager import parse_args, get_themes
 from modules.theme_selector import filter_duplicate_themes, select_themes_for_batch
-from modules.script_generator import generate_script
-from modules.image_manager import generate_images
-from modules.audio_manager import generate_voice
+from modules.script_generator import generate_script, generate_scripts, generate_script_with_prompts, SCRIPT_ERROR_PREFIX
+from modules.image_manager import generate_image_prompts, generate_images
+from modules.frame_preprocessor import prepare_frames
+from modules.audio_manager import generate_voice, split_script_segments, splits_by_sentence
 from modules.bgm_manager import select_bgm
-from modules.video_composer import compose_video
 from modules.subtitle_generator import generate_subtitles
 from modules.thumbnail_generator import generate_thumbnail
 from modules.post_log_manager import log_video, post_to_sns
 from modules.utils import ensure_folder, load_settings, setup_logging
+from modules.batch_scheduler import BatchScheduler
+from modules.artifact_store import ArtifactStore, Checkpointer, file_digest, text_digest
+from modules.pipeline_graph import StageGraph, StageFailed, Channel
+from modules.daemon import open_queue, run_daemon
+from modules.scratch import open_scratch, sweep_orphans
+from modules.planner import plan_batch, format_plan
+from modules import run_history
+from modules import llm_cache
+from modules import image_cache
+from modules import tts_cache
+from modules import clients
+from modules import tracing
 
 def setup_directories():
     """必要なフォルダを準備する"""
@@ -40,90 +53,326 @@ def merge_settings_with_args(settings, args):
         settings['youtube']['post_to_youtube'] = True
     if args.no_post:
         settings['youtube']['post_to_youtube'] = False
+
+    # --workers で同時に処理するテーマ数を上書き
+    if args.workers:
+        settings.setdefault('batch', {})['workers'] = args.workers
+
+    # --trace でステージごとの処理時間を記録
+    if args.trace:
+        settings.setdefault('tracing', {})['enabled'] = True
+
+    # --resume で入力の変わっていないステージをチェックポイントから再利用
+    if args.resume:
+        settings.setdefault('checkpoint', {})['resume'] = True
+
+    # --refresh-cache でGeminiの応答キャッシュを読まずに再生成
+    if args.refresh_cache:
+        settings.setdefault('llm_cache', {})['bypass'] = True
     
     return settings
 
-def process_single_video(theme, settings):
-    """1つのテーマに対して動画を生成する処理"""
+def _open_checkpointer(theme, settings):
+    """設定に従ってテーマ用のチェックポイントを準備する"""
+    checkpoint_settings = settings.get('checkpoint', {})
+    store = None
+    if checkpoint_settings.get('enabled', True):
+        store = ArtifactStore(checkpoint_settings.get('dir', 'output/artifacts'))
+    return Checkpointer(store, theme, resume=checkpoint_settings.get('resume', False))
+
+def _script_inputs(settings):
+    """台本ステージのチェックポイントのキーに含める入力"""
+    # ストリーミングの有無は台本の内容に影響しないため、キーに含めない
+    script_settings = {k: v for k, v in settings.get('script_generation', {}).items() if k != 'stream'}
+    return {"script_generation": script_settings}
+
+def _streams_script(settings):
+    """台本をストリーミングで生成するかどうか（台本と画像プロンプトをまとめて生成する場合はストリーミングしない）"""
+    return splits_by_sentence(settings)
+
+def prefetch_scripts(themes, settings):
+    """
+    全テーマの台本をまとめて並行生成し、settings['runtime_scripts']に格納した設定を返す。
+    台本と画像プロンプトをまとめて生成した場合、画像プロンプトはsettings['runtime_image_prompts']に格納する。
+    台本ファイルが指定されている場合や、チェックポイントから再利用できるテーマは生成しない。
+    """
+    script_path = settings.get('script', {}).get('path')
+    script_settings = settings.get('script_generation', {})
+    if (script_path and os.path.exists(script_path)) or not script_settings.get('prefetch', True):
+        return settings
+    # ストリーミング生成では、台本を各テーマの音声合成と並行して生成する
+    if _streams_script(settings):
+        return settings
+    targets = [theme for theme in themes if _open_checkpointer(theme, settings).cached('script', _script_inputs(settings)) is None]
+    if len(targets) < 2:
+        return settings
+    print(f"\n>>> {len(targets)}件のテーマの台本をまとめて生成中... <<<")
+    results = generate_scripts(targets, settings)
+    for result in results:
+        if result['error']:
+            logging.warning(f"テーマ「{result['theme']}」の台本の事前生成に失敗しました（動画生成時に再試行します）: {result['error']}")
+    return {
+        **settings,
+        'runtime_scripts': {r['theme']: r['script'] for r in results if r['script']},
+        'runtime_image_prompts': {r['theme']: r['image_prompts'] for r in results if r['script'] and r['image_prompts']},
+    }
+
+# 必須ステージが失敗した場合のエラーメッセージ
+_STAGE_FAILURE_MESSAGES = {
+    'script': "台本生成に失敗したため、テーマ「{theme}」の処理を中断します。",
+    'voice': "音声生成に失敗しました。処理を中断します。",
+    'images': "画像生成に失敗しました。処理を中断します。",
+    'video': "動画合成に失敗しました。処理を中断します。",
+}
+
+def process_single_video(theme, settings, scheduler=None):
+    """
+    1つのテーマに対して動画を生成する処理。
+    成功した場合は動画ファイルのパスを、失敗した場合はNoneを返す。
+    schedulerが渡された場合、動画合成はスケジューラのプロセスプールで実行する。
+    各ステージは依存関係グラフとして実行され、音声と画像のように互いに依存しないステージは並行して進む。
+    各ステージの成果物はチェックポイントとして保存され、--resume時は入力の変わっていない
+    ステージを再利用して最初の無効なステージから再開する。
+    音声や画像などの中間ファイルはテーマ専用の作業領域に書き出し、処理の成否にかかわらず最後に削除する。
+    """
     print(f"\n--- テーマ: \"{theme}\" の動画生成を開始します ---")
 
     try:
-        # --- 台本生成 ---
+        with open_scratch(theme, settings) as scratch, tracing.bind(theme=theme), tracing.span("video.total"):
+            job_settings = {**settings, 'runtime_scratch_dir': scratch.path}
+            results = _run_video_graph(theme, job_settings, scheduler)
+
+    except StageFailed as e:
+        logging.error(_STAGE_FAILURE_MESSAGES[e.stage].format(theme=theme))
+        return
+
+    except Exception as e:
+        logging.error(f"テーマ「{theme}」の処理中に予期せぬエラーが発生しました。")
+        traceback.print_exc()
+        return
+
+    print(f"--- テーマ: \"{theme}\" の動画生成が完了しました ---")
+    return results['video']
+
+def _run_video_graph(theme, settings, scheduler):
+    """1テーマ分のステージを依存関係グラフとして組み立てて実行する"""
+    ckpt = _open_checkpointer(theme, settings)
+    graph = StageGraph()
+    audio_engine = settings.get('audio_engine', 'google')
+    audio_engine_settings = settings.get('voicevox' if audio_engine == 'voicevox' else 'google_tts', {})
+    image_settings = settings.get('image', {})
+    yt_settings = settings.get('youtube', {})
+
+    # 台本をストリーミングで生成する場合は、書き終わった文から音声合成を始める
+    script_path = settings.get('script', {}).get('path')
+    prefetched = settings.get('runtime_scripts', {}).get(theme)
+    sentences = None
+    if (_streams_script(settings)
+            and not (script_path and os.path.exists(script_path)) and not prefetched
+            and ckpt.cached('script', _script_inputs(settings)) is None):
+        sentences = Channel()
+
+    # 台本と画像プロンプトをまとめて生成した場合の、台本の各行に対応する画像プロンプト
+    aligned_prompts = {'prompts': settings.get('runtime_image_prompts', {}).get(theme) if prefetched else None}
+
+    def produce_script():
+        if prefetched:
+            return prefetched
+        if settings.get('script_generation', {}).get('combined', False):
+            script_text, aligned_prompts['prompts'] = generate_script_with_prompts(theme, settings)
+            return script_text
+        return generate_script(theme, settings)
+
+    # --- 台本生成 ---
+    def script_stage(deps):
         print("1. 台本を生成中...")
-        script_path = settings.get('script', {}).get('path')
-        if script_path and os.path.exists(script_path):
+        if sentences is not None:
+            try:
+                script_text = ckpt.run(
+                    'script',
+                    _script_inputs(settings),
+                    lambda: generate_script(theme, settings, on_sentence=sentences.put),
+                    cacheable=lambda text: not text.startswith(SCRIPT_ERROR_PREFIX)
+                )
+            finally:
+                sentences.close()
+        elif script_path and os.path.exists(script_path):
             print(f"-> 指定された台本ファイルを使用: {script_path}")
             with open(script_path, 'r', encoding='utf-8') as f:
                 script_text = f.read()
+            ckpt.keys['script'] = file_digest(script_path)
         else:
-            script_text = generate_script(theme, settings)
-        
-        if not script_text:
-            logging.error(f"台本生成に失敗したため、テーマ「{theme}」の処理を中断します。")
-            return
+            # 事前にまとめて生成した台本があればそれを使う
+            script_text = ckpt.run(
+                'script',
+                _script_inputs(settings),
+                produce_script,
+                cacheable=lambda text: not text.startswith(SCRIPT_ERROR_PREFIX)
+            )
+        # 下流のステージは台本の生成条件ではなく、実際の台本の内容をキーにする
+        # （Geminiの失敗時の代替台本から作った音声や動画を、再開時に成功した台本で再利用しないため）
+        ckpt.keys['script_text'] = text_digest(script_text)
+        if script_text:
+            display_script = script_text.replace('\n', ' ')[:80]
+            print(f"-> 生成された台本: {display_script}...")
+        return script_text
 
-        display_script = script_text.replace('\n', ' ')[:80]
-        print(f"-> 生成された台本: {display_script}...")
-
-        # --- 音声生成 ---
+    # --- 音声生成 ---
+    def voice_stage(deps):
         print("2. 音声を生成中...")
-        audio_segments_info = generate_voice(script_text, settings)
-        if not audio_segments_info:
-            logging.error("音声生成に失敗しました。処理を中断します。")
-            return
-        
-        total_duration = sum(seg['duration'] for seg in audio_segments_info)
-        print(f"-> 生成された音声長: {total_duration:.2f}秒")
+        streamed = None
+        if sentences is not None:
+            # 台本の生成と並行して、届いた文から順に音声を合成する
+            streamed = generate_voice(sentences, settings)
+            script_text = graph.future('script').result()
+            if not script_text:
+                return None
+            # 途中で失敗した場合や、確定した台本の文と一致しない場合（キャッシュから台本を再利用して
+            # 文が届かなかった場合を含む）は台本全体から合成し直す
+            if not streamed or [seg['text'] for seg in streamed] != split_script_segments(script_text, by_sentence=True):
+                if streamed:
+                    logging.warning("ストリーミングで合成した音声が台本と一致しないため、台本全体から音声を生成し直します。")
+                streamed = None
+        else:
+            script_text = deps['script']
+        voice_inputs = {"script": ckpt.keys['script_text'], "audio_engine": audio_engine, "engine_settings": audio_engine_settings}
+        if settings.get('narration'):
+            voice_inputs["narration"] = settings['narration']
+        if splits_by_sentence(settings):
+            voice_inputs["by_sentence"] = True
+        audio_segments_info = ckpt.run(
+            'voice',
+            voice_inputs,
+            lambda: streamed or generate_voice(script_text, settings),
+            copy_files=lambda segs: [p for seg in segs for p in (seg.get('path'), seg.get('narration_path'))]
+        )
+        if audio_segments_info:
+            total_duration = sum(seg['duration'] for seg in audio_segments_info)
+            print(f"-> 生成された音声長: {total_duration:.2f}秒")
+        return audio_segments_info
 
-        # --- 画像準備 ---
+    # --- 画像準備 ---
+    def image_prompts_stage(deps):
         print("3. 画像を準備中...")
-        images = generate_images(theme, script_text, settings)
-        if not images:
-            logging.error("画像生成に失敗しました。処理を中断します。")
-            return
-        print(f"-> 生成された画像数: {len(images)}枚")
+        return ckpt.run(
+            'image_prompts',
+            {"script": ckpt.keys['script_text'], "style_prompt": image_settings.get('style_prompt')},
+            # 台本と一緒に生成した画像プロンプトがあれば、Geminiを改めて呼び出さずにそれを使う
+            lambda: aligned_prompts['prompts'] or generate_image_prompts(theme, deps['script'], settings)
+        )
+
+    def images_stage(deps):
+        images = ckpt.run(
+            'images',
+            {"image_prompts": ckpt.keys['image_prompts'], "image": image_settings},
+            lambda: generate_images(theme, deps['script'], settings, prompts=deps['image_prompts']),
+            copy_files=lambda paths: paths,
+            # プレースホルダーで補った結果は保存せず、再開時に画像生成をやり直す
+            cacheable=lambda paths: image_settings.get('placeholder_path') not in paths
+        )
+        if images:
+            print(f"-> 生成された画像数: {len(images)}枚")
+        return images
+
+    def frames_stage(deps):
+        # 画像を動画の解像度のフレームに1度だけ変換しておき、動画合成では変換しない
+        return prepare_frames(deps['images'], settings)
 
-        # --- BGM準備 ---
+    # --- BGM準備 ---
+    def bgm_stage(deps):
         print("4. BGMを準備中...")
         bgm_file = select_bgm(settings)
         print(f"-> BGMファイル: {bgm_file}")
+        return bgm_file
 
-        # --- 字幕生成 ---
+    # --- 字幕生成 ---
+    def subtitles_stage(deps):
         print("5. 字幕を生成中...")
-        subtitle_file = generate_subtitles(theme, audio_segments_info, settings)
+        subtitle_file = ckpt.run(
+            'subtitles',
+            {"voice": ckpt.keys['voice']},
+            lambda: generate_subtitles(theme, deps['voice'], settings),
+            ref_files=lambda path: [path]
+        )
         if subtitle_file:
             print(f"-> 字幕ファイル: {subtitle_file}")
         else:
             logging.warning("字幕ファイルの生成に失敗しました。字幕なしで続行します。")
+        return subtitle_file
 
-        # --- 動画合成 ---
+    # --- 動画合成 ---
+    def video_stage(deps):
         print("6. 動画を合成中...")
-        video_file = compose_video(theme, images, audio_segments_info, bgm_file, subtitle_file, settings)
-        if not video_file:
-            logging.error("動画合成に失敗しました。処理を中断します。")
-            return
-        print(f"-> 動画ファイル: {video_file}")
+        if scheduler:
+            compose = scheduler.compose_video
+        else:
+            from modules.video_composer import compose_video as compose
+        subtitle_file = deps['subtitles']
+        video_file = ckpt.run(
+            'video',
+            {
+                "images": ckpt.keys['images'],
+                "voice": ckpt.keys['voice'],
+                "subtitles": ckpt.keys.get('subtitles') if subtitle_file else None,
+                "bgm": file_digest(deps['bgm']),
+                "video": settings.get('video', {}),
+                "subtitle": settings.get('subtitle', {}),
+                "bgm_settings": settings.get('bgm', {}),
+            },
+            lambda: compose(theme, deps.get('frames') or deps['images'], deps['voice'], deps['bgm'], subtitle_file, settings),
+            ref_files=lambda path: [path]
+        )
+        if video_file:
+            print(f"-> 動画ファイル: {video_file}")
+        return video_file
 
-        # --- サムネイル生成 ---
+    # --- サムネイル生成 ---
+    def thumbnail_stage(deps):
         print("7. サムネイルを生成中...")
-        thumbnail_file = generate_thumbnail(video_file, theme, images, settings)
+        video_file = deps.get('video')
+        thumbnail_file = ckpt.run(
+            'thumbnail',
+            {"video": ckpt.keys['video'] if video_file else None, "images": ckpt.keys['images'],
+             "youtube": yt_settings, "subtitle": settings.get('subtitle', {})},
+            lambda: generate_thumbnail(video_file, theme, deps['images'], settings),
+            ref_files=lambda path: [path]
+        )
         if thumbnail_file:
             print(f"-> サムネイルファイル: {thumbnail_file}")
+        return thumbnail_file
 
-        # --- ログ記録 & SNS投稿 ---
+    # --- ログ記録 & SNS投稿 ---
+    def post_stage(deps):
         print("8. ログ記録とSNS投稿...")
+        video_file = deps['video']
         log_video(video_file, theme, settings)
-        if settings.get('youtube', {}).get('post_to_youtube', False):
-            post_to_sns(video_file, thumbnail_file, theme, script_text, settings)
-        else:
+        if not yt_settings.get('post_to_youtube', False):
             print("-> YouTubeへの投稿はスキップされました。")
+            return
+        # 同じ動画を再開時に二重投稿しないよう、投稿済みかをマニフェストで確認する
+        if ckpt.is_done('upload', ckpt.keys['video']):
+            print("-> この動画は投稿済みのため、YouTubeへの投稿をスキップします。")
+            return
+        # サムネイルは動画のアップロード完了後に設定するため、生成完了を待たずに投稿を開始する
+        thumbnail = graph.future('thumbnail')
+        if post_to_sns(video_file, thumbnail.result, theme, deps['script'], settings):
+            ckpt.mark_done('upload', ckpt.keys['video'])
 
-    except Exception as e:
-        logging.error(f"テーマ「{theme}」の処理中に予期せぬエラーが発生しました。")
-        traceback.print_exc()
-        return
+    # 動画からサムネイルを切り出す設定の場合のみ、サムネイルは動画合成を待つ
+    thumbnail_deps = ('images', 'video') if yt_settings.get('thumbnail_from_video') else ('images',)
 
-    print(f"--- テーマ: \"{theme}\" の動画生成が完了しました ---")
+    graph.add('script', script_stage)
+    # ストリーミング時の音声合成は台本の完成を待たずに始め、ステージ内で台本の完成を待つ
+    graph.add('voice', voice_stage, deps=() if sentences is not None else ('script',))
+    graph.add('image_prompts', image_prompts_stage, deps=('script',), required=False)
+    graph.add('images', images_stage, deps=('script', 'image_prompts'))
+    graph.add('frames', frames_stage, deps=('images',), required=False)
+    graph.add('bgm', bgm_stage, required=False)
+    graph.add('subtitles', subtitles_stage, deps=('voice',), required=False)
+    graph.add('video', video_stage, deps=('images', 'frames', 'voice', 'bgm', 'subtitles'))
+    graph.add('thumbnail', thumbnail_stage, deps=thumbnail_deps, required=False)
+    graph.add('post', post_stage, deps=('script', 'video'), required=False)
+    return graph.run()
 
 def main():
     try:
@@ -141,6 +390,30 @@ def main():
         # ロギング設定
         setup_logging(settings)
 
+        # 処理時間は実行履歴（--planの見積もりに使う）のため、トレースを出力しない場合も記録する
+        tracing_settings = settings.get('tracing', {})
+        history_settings = settings.get('history', {})
+        if tracing_settings.get('enabled', False) or history_settings.get('enabled', True):
+            tracing.enable()
+
+        # 古いチェックポイントを整理
+        checkpoint_settings = settings.get('checkpoint', {})
+        if checkpoint_settings.get('enabled', True):
+            ArtifactStore(checkpoint_settings.get('dir', 'output/artifacts')).prune(checkpoint_settings.get('max_age_days', 7))
+
+        # 異常終了した実行が残した作業領域を整理
+        scratch_settings = settings.get('scratch', {})
+        sweep_orphans(scratch_settings.get('root', 'temp/jobs'), scratch_settings.get('max_age_hours', 24))
+
+        # 使用するAPIクライアントの接続を、テーマの取得と並行して済ませておく
+        if not (args.plan or args.enqueue):
+            clients.warm_up(settings)
+
+        # --- 常駐モード ---
+        if args.daemon:
+            run_daemon(settings, process_single_video, prepare_fn=prefetch_scripts)
+            return
+
         # --- テーマ取得 ---
         if 'runtime_themes' in settings:
             themes = settings['runtime_themes']
@@ -153,13 +426,50 @@ def main():
             print("処理するテーマが見つからないため、終了します。")
             return
 
+        if args.plan:
+            rates = run_history.load_rates(history_settings.get('path', 'output/history/runs.jsonl'))
+            print(f"\n>>> {len(themes)}件のテーマの実行計画 (APIは呼び出していません) <<<")
+            print(format_plan(plan_batch(themes, settings, rates)))
+            return
+
+        if args.enqueue:
+            queue = open_queue(settings)
+            for theme in themes:
+                queue.enqueue(theme)
+            print(f"{len(themes)}件のテーマをジョブキュー ({queue.queue_dir}) に追加しました。")
+            return
+
         # --- メインループ ---
+        settings = prefetch_scripts(themes, settings)
         print(f"\n>>> 合計{len(themes)}件の動画生成を開始します <<<")
-        for i, theme in enumerate(themes):
-            process_single_video(theme, settings)
-            print(f">>> 進捗: {i + 1}/{len(themes)}件完了 <<<")
+        scheduler = BatchScheduler(settings)
+        results = scheduler.run(themes, process_single_video, settings)
+
+        succeeded = sum(1 for r in results if r)
+        print(f"\n>>> 全ての動画生成が完了しました (成功: {succeeded}件 / 失敗: {len(themes) - succeeded}件) <<<")
+
+        cache_stats = llm_cache.stats(settings)
+        if cache_stats:
+            print(f"Gemini応答キャッシュ: ヒット {cache_stats['hits']}件 / ミス {cache_stats['misses']}件 (保存件数: {cache_stats['entries']}件)")
+        image_stats = image_cache.stats(settings)
+        if image_stats:
+            lookups = image_stats['hits'] + image_stats['misses']
+            hit_rate = image_stats['hits'] / lookups * 100 if lookups else 0.0
+            print(f"画像キャッシュ: ヒット {image_stats['hits']}枚 / ミス {image_stats['misses']}枚 (ヒット率 {hit_rate:.0f}%, {image_stats['bytes'] / 1024 / 1024:.0f}MB)")
+        tts_stats = tts_cache.stats(settings)
+        if tts_stats:
+            lookups = tts_stats['hits'] + tts_stats['misses']
+            hit_rate = tts_stats['hits'] / lookups * 100 if lookups else 0.0
+            print(f"音声キャッシュ: ヒット {tts_stats['hits']}文 / ミス {tts_stats['misses']}文 (ヒット率 {hit_rate:.0f}%, {tts_stats['bytes'] / 1024 / 1024:.0f}MB)")
+
+        if history_settings.get('enabled', True):
+            run_history.record(tracing.get_spans(), history_settings.get('path', 'output/history/runs.jsonl'))
 
-        print("\n>>> 全ての動画生成が完了しました <<<")
+        if tracing_settings.get('enabled', False):
+            run_name = datetime.now().strftime('%Y%m%d_%H%M%S')
+            trace_path, summary_table = tracing.export(tracing_settings.get('output_dir', 'output/traces'), run_name)
+            print(f"\n>>> ステージ別処理時間 (トレース: {trace_path}) <<<")
+            print(summary_table)
 
     except Exception as e:
         print(f"メインプロセスで致命的なエラーが発生しました: {e}")
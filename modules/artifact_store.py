@@ -0,0 +1,210 @@
+# modules/artifact_store.py
+import os
+import json
+import time
+import shutil
+import hashlib
+import logging
+import threading
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+def make_key(stage, inputs):
+    """ステージ名と入力（テーマ、設定の一部、上流ステージのキー）からキーを計算する"""
+    payload = json.dumps({"stage": stage, "inputs": inputs}, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+def file_digest(path):
+    """ファイル内容のSHA-256を返す。ファイルがなければNone"""
+    if not path or not os.path.exists(path):
+        return None
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+def text_digest(text):
+    """文字列のSHA-256を返す。Noneや空文字列の場合はNone"""
+    if not text:
+        return None
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+def _write_json_atomic(path, data):
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+        # 投稿済みの記録などがクラッシュで失われないよう、置き換える前にディスクへ書き込む
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+def _replace_paths(value, mapping):
+    """値の中に含まれるファイルパスを置き換える"""
+    if isinstance(value, str):
+        return mapping.get(value, value)
+    if isinstance(value, list):
+        return [_replace_paths(v, mapping) for v in value]
+    if isinstance(value, dict):
+        return {k: _replace_paths(v, mapping) for k, v in value.items()}
+    return value
+
+class ArtifactStore:
+    """
+    パイプラインの各ステージの成果物を、入力から計算したキーで保存するストア。
+    objects/<key>/ に成果物ファイルのコピーとrecord.jsonを、runs/ にテーマごとの実行マニフェストを置く。
+    """
+
+    def __init__(self, root="output/artifacts"):
+        self.root = root
+        self.objects_dir = os.path.join(root, "objects")
+        self.runs_dir = os.path.join(root, "runs")
+        os.makedirs(self.objects_dir, exist_ok=True)
+        os.makedirs(self.runs_dir, exist_ok=True)
+
+    def _record_path(self, key):
+        return os.path.join(self.objects_dir, key, "record.json")
+
+    def load(self, key):
+        """保存済みの成果物を返す。存在しない、または参照ファイルが欠けている場合はNone"""
+        record_path = self._record_path(key)
+        if not os.path.exists(record_path):
+            return None
+        try:
+            with open(record_path, 'r', encoding='utf-8') as f:
+                record = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f"チェックポイントの読み込みに失敗しました ({record_path}): {e}")
+            return None
+        missing = [p for p in record.get("files", []) if not os.path.exists(p)]
+        if missing:
+            logger.info(f"チェックポイント {key[:12]} の参照ファイルが見つからないため無効とします: {missing[0]}")
+            return None
+        return record["value"]
+
+    def save(self, key, stage, value, copy_files=(), ref_files=()):
+        """
+        成果物を保存する。copy_filesはストア内にコピーし、値の中のパスもコピー先に書き換える。
+        ref_filesはコピーせず、読み込み時に存在確認だけを行う。
+        """
+        object_dir = os.path.join(self.objects_dir, key)
+        os.makedirs(object_dir, exist_ok=True)
+
+        mapping = {}
+        for i, src in enumerate(dict.fromkeys(p for p in copy_files if p)):
+            if not os.path.exists(src):
+                continue
+            dst = os.path.join(object_dir, f"{i:04}_{os.path.basename(src)}")
+            shutil.copy2(src, dst)
+            mapping[src] = dst
+
+        stored_value = _replace_paths(value, mapping)
+        files = list(mapping.values()) + [p for p in ref_files if p]
+        record = {
+            "stage": stage,
+            "created_at": datetime.now().isoformat(),
+            "value": stored_value,
+            "files": files,
+        }
+        _write_json_atomic(self._record_path(key), record)
+        return stored_value
+
+    def manifest_path(self, theme):
+        theme_hash = hashlib.sha1(theme.encode('utf-8')).hexdigest()[:16]
+        return os.path.join(self.runs_dir, f"{theme_hash}.json")
+
+    def load_manifest(self, theme):
+        path = self.manifest_path(theme)
+        if os.path.exists(path):
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    return json.load(f)
+            except (OSError, ValueError):
+                logger.warning(f"実行マニフェストが壊れているため作り直します: {path}")
+        return {"theme": theme, "stages": {}}
+
+    def save_manifest(self, theme, manifest):
+        manifest["updated_at"] = datetime.now().isoformat()
+        _write_json_atomic(self.manifest_path(theme), manifest)
+
+    def prune(self, max_age_days):
+        """最終更新から max_age_days 日以上経過した成果物を削除する"""
+        if not max_age_days:
+            return 0
+        cutoff = time.time() - max_age_days * 86400
+        removed = 0
+        for key in os.listdir(self.objects_dir):
+            record_path = self._record_path(key)
+            target = record_path if os.path.exists(record_path) else os.path.join(self.objects_dir, key)
+            try:
+                if os.path.getmtime(target) < cutoff:
+                    shutil.rmtree(os.path.join(self.objects_dir, key), ignore_errors=True)
+                    removed += 1
+            except OSError:
+                continue
+        if removed:
+            logger.info(f"古いチェックポイントを{removed}件削除しました。")
+        return removed
+
+class Checkpointer:
+    """
+    1テーマ分のステージ実行をチェックポイント化する。
+    resume=Trueの場合、入力が変わっていないステージは保存済みの成果物を再利用する。
+    """
+
+    def __init__(self, store, theme, resume=False):
+        self.store = store
+        self.theme = theme
+        self.resume = resume
+        self.keys = {}
+        self.manifest = store.load_manifest(theme) if store else {"theme": theme, "stages": {}}
+        # ステージが並行して実行されるため、マニフェストの更新は排他的に行う
+        self._lock = threading.Lock()
+
+    def run(self, stage, inputs, produce, copy_files=None, ref_files=None, cacheable=None):
+        """
+        ステージを実行する（またはチェックポイントから復元する）。
+        copy_files/ref_filesは成果物の値からファイルパスのリストを返す関数。
+        cacheableが渡された場合、Falseを返した成果物は保存しない（フォールバック結果など）。
+        """
+        key = make_key(stage, {"theme": self.theme, **inputs})
+        self.keys[stage] = key
+
+        if self.store and self.resume:
+            cached = self.store.load(key)
+            if cached is not None:
+                print(f"-> チェックポイントを再利用します ({stage})")
+                self._record(stage, key, "reused")
+                return cached
+
+        value = produce()
+        if self.store and value and (cacheable is None or cacheable(value)):
+            value = self.store.save(
+                key, stage, value,
+                copy_files=copy_files(value) if copy_files else (),
+                ref_files=ref_files(value) if ref_files else ()
+            )
+            self._record(stage, key, "done")
+        return value
+
+    def cached(self, stage, inputs):
+        """resume時に再利用できる保存済みの成果物を返す（なければNone）。ステージは実行しない"""
+        if not (self.store and self.resume):
+            return None
+        return self.store.load(make_key(stage, {"theme": self.theme, **inputs}))
+
+    def is_done(self, stage, key):
+        """マニフェスト上で、同じキーのステージが完了済みかどうか"""
+        entry = self.manifest["stages"].get(stage)
+        return bool(self.resume and entry and entry.get("key") == key)
+
+    def mark_done(self, stage, key):
+        self._record(stage, key, "done")
+
+    def _record(self, stage, key, status):
+        if not self.store:
+            return
+        with self._lock:
+            self.manifest["stages"][stage] = {"key": key, "status": status, "at": datetime.now().isoformat()}
+            self.store.save_manifest(self.theme, self.manifest)
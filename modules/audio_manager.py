@@ -1,32 +1,214 @@
+import io
 import os
 import uuid
 import re
-from google.cloud import texttospeech
-from moviepy.audio.io.AudioFileClip import AudioFileClip
-import google.api_core.exceptions
 import requests
 import logging # 追加
+import wave
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from xml.sax.saxutils import escape
+from modules import tracing, backends, scratch, clients, tts_cache, audio_metadata
 
 # ロガーを取得
 logger = logging.getLogger(__name__)
 
+_SEGMENT_BOUNDARY = re.compile('(。[。！？.!?])')
+
+# 1文ずつに分割する場合の文末の句読点と括弧
+_SENTENCE_END = "。！？!?"
+_OPEN_BRACKETS = "「『（("
+_CLOSE_BRACKETS = "」』）)"
+
+def splits_by_sentence(settings):
+    """
+    台本を1文ずつに分割して音声を合成するかどうか。台本をストリーミングで生成する場合は、
+    書き終わった文から合成を始めるため1文ずつに分割する（台本と画像プロンプトをまとめて生成する場合はストリーミングしない）。
+    """
+    script_settings = settings.get('script_generation', {})
+    return bool(script_settings.get('stream', False) and not script_settings.get('combined', False))
+
+def sentence_cuts(text):
+    """
+    1文ずつに分割する位置のリストを返す。文末の句読点（。！？!?）の後、続く句読点や閉じ括弧まで含めて区切り、
+    括弧の中では区切らない。改行では常に区切る。
+    次の文字が届くまで文が終わったか確定しないため、テキストの末尾の区切りは含まない。
+    """
+    cuts = []
+    depth = 0
+    ended = False
+    for i, c in enumerate(text):
+        if c == "\n":
+            cuts.append(i + 1)
+            depth, ended = 0, False
+            continue
+        if ended and depth == 0 and c not in _SENTENCE_END + _CLOSE_BRACKETS:
+            cuts.append(i)
+            ended = False
+        if c in _OPEN_BRACKETS:
+            depth += 1
+            ended = False
+        elif c in _CLOSE_BRACKETS:
+            depth = max(0, depth - 1)
+        elif c in _SENTENCE_END:
+            ended = True
+        else:
+            ended = False
+    return cuts
+
+def split_script_segments(script_text, by_sentence=False):
+    """
+    台本を音声合成の単位に分割する。by_sentence=Trueの場合は1文ずつに分割する
+    （台本のストリーミング生成時。区切りは sentence_cuts を参照）。
+    """
+    if by_sentence:
+        bounds = [0] + sentence_cuts(script_text) + [len(script_text)]
+        pieces = [script_text[a:b] for a, b in zip(bounds, bounds[1:])]
+    else:
+        pieces = _SEGMENT_BOUNDARY.split(script_text)
+    return [s.strip() for s in pieces if s.strip()]
+
+def _script_segments(script_text, engine_label, settings):
+    """台本の文字列は文に分割し、文のイテラブル（生成中の台本）は届いた順にそのまま使う"""
+    if isinstance(script_text, str):
+        segments = split_script_segments(script_text, splits_by_sentence(settings))
+        logger.info(f"テキストを{len(segments)}個のセグメントに分割しました ({engine_label})。")
+        return segments
+    logger.info(f"生成中の台本から文が届くたびに音声を合成します ({engine_label})。")
+    return script_text
+
+def _synthesize_segments(segments, synthesize, concurrency):
+    """
+    文ごとの音声合成 synthesize(index, text) を最大 concurrency 件まで並行して行い、結果を文の順に並べたリストを返す。
+    synthesize は失敗時に None を返す（または例外を送出する）。1つでも失敗した場合は、
+    まだ始まっていない文を取り消し、合成済みの音声ファイルを削除して None を返す。
+    """
+    failed = threading.Event()
+    futures = []
+
+    def run(i, text):
+        if failed.is_set():
+            return None
+        try:
+            result = synthesize(i, text)
+        except Exception as e:
+            logger.error(f"音声生成中に予期せぬエラーが発生しました (セグメント: '{text[:30]}...'): {e}", exc_info=True)
+            result = None
+        if result is None and not failed.is_set():
+            # 一つでも失敗したら、待機中のセグメントを取り消して全体を中断する
+            failed.set()
+            for future in list(futures):
+                future.cancel()
+        return result
+
+    with ThreadPoolExecutor(max_workers=max(1, int(concurrency)), thread_name_prefix="tts") as executor:
+        # 生成中の台本の場合は、文が届くたびに合成を始める
+        for i, segment_text in enumerate(segments):
+            if failed.is_set():
+                break
+            if not segment_text:
+                continue
+            futures.append(executor.submit(contextvars.copy_context().run, run, i, segment_text))
+
+    results = [future.result() for future in futures if not future.cancelled()]
+    if failed.is_set():
+        for result in results:
+            if result and os.path.exists(result["path"]):
+                os.remove(result["path"])
+        return None
+    return results
+
+def _cached_segment(settings, key, output_path, index, segment_text):
+    """同じ文と声の設定で合成済みの音声がキャッシュにあれば output_path に置き、セグメント情報を返す"""
+    duration = tts_cache.fetch(settings, key, output_path)
+    if duration is None:
+        return None
+    scratch.account(settings, output_path)
+    logger.info(f"セグメント {index+1}をキャッシュから再利用: {output_path} ({duration:.2f}秒)")
+    return {"path": output_path, "duration": duration, "text": segment_text}
+
 def generate_voice(script_text, settings):
     """
     Google Cloud TTSまたはVOICEVOXで台本を音声化し、tempフォルダに保存する。
+    script_textには台本の文字列のほか、文を順に返すイテラブル（ストリーミングで生成中の台本）も渡せる。
     成功した場合は音声セグメント情報のリストを、失敗した場合はNoneを返す。
     """
     # settings.yamlの'audio_engine'設定に基づいて使用するエンジンを決定
     engine = settings.get('audio_engine', 'google') # デフォルトはgoogle
+    if engine not in backends.available('tts'):
+        logger.warning(f"未対応の音声合成エンジン '{engine}' が指定されたため、Google Cloud TTS を使用します。")
+        engine = 'google'
 
-    if engine == 'voicevox':
-        logger.info("音声合成エンジン: VOICEVOX を使用します。")
-        return _generate_voice_voicevox(script_text, settings)
-    else:
-        logger.info("音声合成エンジン: Google Cloud TTS を使用します。")
-        return _generate_voice_google_tts(script_text, settings)
+    logger.info(f"音声合成エンジン: {engine} を使用します。")
+    return assemble_narration(backends.get('tts', engine)(script_text, settings), settings)
+
+def _single_track(settings):
+    return settings.get('narration', {}).get('single_track', False)
+
+def _read_pcm(path):
+    """WAVファイルの (チャンネル数, サンプル幅, サンプリングレート) とPCMのサンプル列を返す。PCMのWAVでなければNone"""
+    import numpy as np
+    try:
+        with wave.open(path, "rb") as w:
+            params = (w.getnchannels(), w.getsampwidth(), w.getframerate())
+            frames = w.readframes(w.getnframes())
+    except (wave.Error, EOFError):
+        return None
+    if params[1] != 2:
+        return None
+    return params, np.frombuffer(frames, dtype="<i2")
+
+def assemble_narration(audio_segments_info, settings):
+    """
+    narration.single_track が有効な場合、文ごとの音声を1つのナレーション (narration_*.wav) に連結し、
+    各セグメントにナレーション内の開始・終了位置 (start, end 秒) とナレーションのパス (narration_path) を加えて返す。
+    無効な場合や、PCMのWAVでない音声・形式がそろっていない音声が含まれる場合は連結せずにそのまま返す。
+    """
+    if not audio_segments_info or not _single_track(settings):
+        return audio_segments_info
+    import numpy as np
+    pcm = [_read_pcm(seg['path']) for seg in audio_segments_info]
+    formats = {p[0] for p in pcm if p}
+    if None in pcm or len(formats) != 1:
+        logger.warning("音声セグメントの形式がそろっていないため、ナレーションを1つのファイルにまとめません。")
+        return audio_segments_info
+    channels, sample_width, sample_rate = formats.pop()
+
+    narration_path = os.path.join(scratch.scratch_dir(settings, "voice"), f"narration_{uuid.uuid4().hex[:8]}.wav")
+    with tracing.span("tts.assemble", segments=len(pcm)) as sp:
+        samples = np.concatenate([p[1] for p in pcm])
+        with wave.open(narration_path, "wb") as w:
+            w.setnchannels(channels)
+            w.setsampwidth(sample_width)
+            w.setframerate(sample_rate)
+            w.writeframes(samples.tobytes())
+        sp["bytes"] = samples.nbytes
+    scratch.account(settings, narration_path)
+
+    # 各セグメントの位置はサンプル数から計算する（ファイルごとの長さの丸め誤差が積み重ならない）
+    assembled = []
+    offset = 0
+    for seg, (_, data) in zip(audio_segments_info, pcm):
+        frames = len(data) // channels
+        assembled.append({
+            **seg,
+            "start": offset / sample_rate,
+            "end": (offset + frames) / sample_rate,
+            "narration_path": narration_path,
+        })
+        offset += frames
+    logger.info(f"ナレーションを1つのファイルにまとめました: {narration_path} ({offset / sample_rate:.2f}秒)")
+    return assembled
+
+def _audio_duration(path):
+    """音声ファイルの長さ（秒）を返す（ffmpegを起動せず、ファイルのヘッダから求める）"""
+    return audio_metadata.duration(path)
 
 def _generate_voice_google_tts(script_text, settings):
     # 既存のGoogle Cloud TTSのロジック
+    import google.api_core.exceptions
+
     # 最初に認証情報の存在をチェック
     credentials_path = os.getenv('GOOGLE_APPLICATION_CREDENTIALS')
     if not credentials_path or not os.path.exists(credentials_path):
@@ -34,8 +216,34 @@ def _generate_voice_google_tts(script_text, settings):
         logger.error("環境変数 GOOGLE_APPLICATION_CREDENTIALS が正しく設定されているか確認してください。")
         return None
 
+    # ナレーションを1つのファイルにまとめる場合は、連結しやすいようPCM (LINEAR16, WAV) で受け取る
+    # （SSMLでまとめて合成する場合も、文ごとに切り分けるためPCMで受け取る）
+    ssml_marks = settings['google_tts'].get('ssml_marks', False)
+    linear16 = _single_track(settings) or ssml_marks
+    sample_rate = settings['google_tts'].get('sample_rate_hertz', 24000)
+
+    # 合成結果に影響する設定（キャッシュキーに含める）
+    cache_params = {
+        "language_code": "ja-JP",
+        "voice_name": settings['google_tts']['voice_name'],
+        "ssml_gender": settings['google_tts']['ssml_gender'],
+        "speaking_rate": settings['google_tts']['speaking_rate'],
+        "audio_encoding": "LINEAR16" if linear16 else "MP3",
+    }
+    if linear16:
+        cache_params["sample_rate_hertz"] = sample_rate
+
+    # テキストを句読点で分割
+    segments = _script_segments(script_text, "Google Cloud TTS", settings)
+    if ssml_marks:
+        # SSMLでまとめて合成する場合は、v1beta1のクライアントだけを使う
+        if isinstance(segments, list):
+            return _generate_voice_google_ssml(segments, settings, cache_params)
+        logger.info("生成中の台本はSSMLでまとめて合成できないため、文ごとに合成します。")
+
+    from google.cloud import texttospeech
     try:
-        client = texttospeech.TextToSpeechClient()
+        client = clients.tts_client()
     except Exception as e:
         logger.error(f"Google Cloud TTSクライアントの初期化に失敗しました: {e}", exc_info=True)
         return None
@@ -45,38 +253,44 @@ def _generate_voice_google_tts(script_text, settings):
         name=settings['google_tts']['voice_name'],
         ssml_gender=getattr(texttospeech.SsmlVoiceGender, settings['google_tts']['ssml_gender'])
     )
-    audio_config = texttospeech.AudioConfig(
-        audio_encoding=texttospeech.AudioEncoding.MP3,
-        speaking_rate=settings['google_tts']['speaking_rate']
-    )
-
-    os.makedirs("temp", exist_ok=True)
-
-    # テキストを句読点で分割
-    segments = [s.strip() for s in re.split('(。[。！？.!?])', script_text) if s.strip()]
-    audio_segments_info = []
-    logger.info(f"テキストを{len(segments)}個のセグメントに分割しました (Google Cloud TTS)。")
+    if linear16:
+        audio_config = texttospeech.AudioConfig(
+            audio_encoding=texttospeech.AudioEncoding.LINEAR16,
+            speaking_rate=settings['google_tts']['speaking_rate'],
+            sample_rate_hertz=sample_rate
+        )
+    else:
+        audio_config = texttospeech.AudioConfig(
+            audio_encoding=texttospeech.AudioEncoding.MP3,
+            speaking_rate=settings['google_tts']['speaking_rate']
+        )
 
-    for i, segment_text in enumerate(segments):
-        if not segment_text:
-            continue
+    output_dir = scratch.scratch_dir(settings, "voice")
 
+    def synthesize(i, segment_text):
         synthesis_input = texttospeech.SynthesisInput(text=segment_text)
-        output_path = os.path.join("temp", f"voice_{uuid.uuid4()}.mp3")
+        output_path = os.path.join(output_dir, f"voice_{uuid.uuid4()}.{'wav' if linear16 else 'mp3'}")
+        key = tts_cache.segment_key("google", segment_text, cache_params)
 
         try:
-            response = client.synthesize_speech(
-                input=synthesis_input, voice=voice, audio_config=audio_config
-            )
+            cached = _cached_segment(settings, key, output_path, i, segment_text)
+            if cached:
+                return cached
+
+            with tracing.span("tts.segment", engine="google", index=i, chars=len(segment_text)) as sp:
+                response = client.synthesize_speech(
+                    input=synthesis_input, voice=voice, audio_config=audio_config
+                )
+                sp["bytes"] = len(response.audio_content)
             with open(output_path, "wb") as out:
                 out.write(response.audio_content)
+            scratch.account(settings, output_path)
 
-            audio_clip = AudioFileClip(output_path)
-            duration = audio_clip.duration
-            audio_clip.close()
+            duration = _audio_duration(output_path)
+            tts_cache.store(settings, key, output_path, duration)
 
-            audio_segments_info.append({"path": output_path, "duration": duration, "text": segment_text})
             logger.info(f"セグメント {i+1}を生成: {output_path} ({duration:.2f}秒)")
+            return {"path": output_path, "duration": duration, "text": segment_text}
 
         except (google.api_core.exceptions.GoogleAPIError, Exception) as e:
             logger.error(f"音声生成に失敗しました (セグメント: '{segment_text[:30]}...'): {e}", exc_info=True)
@@ -86,7 +300,140 @@ def _generate_voice_google_tts(script_text, settings):
             # 一つでも失敗したら、全体の処理を中断してNoneを返す
             return None
 
-    return audio_segments_info
+    # gRPCのクライアントはスレッドセーフなため、複数の文を並行して合成する
+    return _synthesize_segments(segments, synthesize, settings['google_tts'].get('concurrency', 4))
+
+# Google Cloud TTSの1リクエストあたりの入力の上限（SSMLのタグを含むバイト数）
+_SSML_MAX_BYTES = 5000
+
+def _ssml_chunks(segments, max_bytes=_SSML_MAX_BYTES):
+    """
+    (文のインデックス, 文) のリストを、入力の上限 max_bytes に収まるSSMLに分ける。
+    各文の前に <mark name="s{インデックス}"/> を置き、(SSML, [文のインデックス]) のリストを返す。
+    """
+    chunks = []
+    body, indices, size = [], [], len("<speak></speak>")
+    for i, text in segments:
+        part = f'<mark name="s{i}"/>{escape(text)}'
+        part_size = len(part.encode("utf-8"))
+        if indices and size + part_size > max_bytes:
+            chunks.append((f"<speak>{''.join(body)}</speak>", indices))
+            body, indices, size = [], [], len("<speak></speak>")
+        if size + part_size > max_bytes:
+            logger.warning(f"1文だけで入力の上限 ({max_bytes}バイト) を超えています: '{text[:30]}...'")
+        body.append(part)
+        indices.append(i)
+        size += part_size
+    if indices:
+        chunks.append((f"<speak>{''.join(body)}</speak>", indices))
+    return chunks
+
+def ssml_request_lengths(segments, settings):
+    """SSMLでまとめて合成する場合に、文のリスト segments を送るリクエストごとのSSMLの文字数を返す"""
+    max_bytes = settings.get('google_tts', {}).get('ssml_max_bytes', _SSML_MAX_BYTES)
+    return [len(ssml) for ssml, _ in _ssml_chunks(list(enumerate(segments)), max_bytes)]
+
+def _split_wav_at_marks(audio_content, starts):
+    """
+    WAVの音声を、各文の開始時刻（秒）のリスト starts で切り分け、文ごとのWAVのバイト列のリストを返す。
+    最初の文は音声の先頭から、最後の文は音声の末尾までとする。
+    """
+    with wave.open(io.BytesIO(audio_content), "rb") as w:
+        params = w.getparams()
+        frames = w.readframes(params.nframes)
+    frame_size = params.nchannels * params.sampwidth
+    bounds = [0]
+    for t in starts[1:]:
+        bounds.append(min(max(round(t * params.framerate), bounds[-1]), params.nframes))
+    bounds.append(params.nframes)
+
+    pieces = []
+    for start, end in zip(bounds, bounds[1:]):
+        buf = io.BytesIO()
+        with wave.open(buf, "wb") as out:
+            out.setparams(params)
+            out.writeframes(frames[start * frame_size:end * frame_size])
+        pieces.append(buf.getvalue())
+    return pieces
+
+def _generate_voice_google_ssml(segments, settings, cache_params):
+    """
+    文の境界にSSMLの<mark>を置いて台本をまとめて合成し、応答のタイムポイント（各markの時刻）で
+    音声を文ごとのWAVに切り分ける。入力の上限を超える台本は複数のリクエストに分けて並行して合成する。
+    """
+    from google.cloud import texttospeech_v1beta1 as texttospeech
+
+    google_settings = settings['google_tts']
+    try:
+        # タイムポイントはv1beta1のAPIだけが返す
+        client = clients.tts_client(beta=True)
+    except Exception as e:
+        logger.error(f"Google Cloud TTSクライアントの初期化に失敗しました: {e}", exc_info=True)
+        return None
+
+    voice = texttospeech.VoiceSelectionParams(
+        language_code="ja-JP",
+        name=google_settings['voice_name'],
+        ssml_gender=getattr(texttospeech.SsmlVoiceGender, google_settings['ssml_gender'])
+    )
+    audio_config = texttospeech.AudioConfig(
+        audio_encoding=texttospeech.AudioEncoding.LINEAR16,
+        speaking_rate=google_settings['speaking_rate'],
+        sample_rate_hertz=cache_params["sample_rate_hertz"]
+    )
+    output_dir = scratch.scratch_dir(settings, "voice")
+    # 前後の文とまとめて合成した音声は文ごとに合成した音声と異なるため、キャッシュのエントリを分ける
+    cache_params = {**cache_params, "ssml_marks": True}
+    keys = [tts_cache.segment_key("google", text, cache_params) for text in segments]
+
+    results = [
+        _cached_segment(settings, keys[i], os.path.join(output_dir, f"voice_{uuid.uuid4()}.wav"), i, text)
+        for i, text in enumerate(segments)
+    ]
+    chunks = _ssml_chunks(
+        [(i, text) for i, text in enumerate(segments) if results[i] is None],
+        google_settings.get('ssml_max_bytes', _SSML_MAX_BYTES)
+    )
+    if chunks:
+        logger.info(f"{sum(len(indices) for _, indices in chunks)}個のセグメントを{len(chunks)}回のリクエストで合成します (SSML)。")
+
+    def synthesize(chunk):
+        ssml, indices = chunk
+        try:
+            with tracing.span("tts.ssml", engine="google", segments=len(indices), chars=len(ssml)) as sp:
+                response = client.synthesize_speech(request=texttospeech.SynthesizeSpeechRequest(
+                    input=texttospeech.SynthesisInput(ssml=ssml),
+                    voice=voice,
+                    audio_config=audio_config,
+                    enable_time_pointing=[texttospeech.SynthesizeSpeechRequest.TimepointType.SSML_MARK],
+                ))
+                sp["bytes"] = len(response.audio_content)
+            marks = {tp.mark_name: tp.time_seconds for tp in response.timepoints}
+            pieces = _split_wav_at_marks(response.audio_content, [marks[f"s{i}"] for i in indices])
+            for i, piece in zip(indices, pieces):
+                output_path = os.path.join(output_dir, f"voice_{uuid.uuid4()}.wav")
+                with open(output_path, "wb") as out:
+                    out.write(piece)
+                results[i] = {"path": output_path, "duration": _audio_duration(output_path), "text": segments[i]}
+                scratch.account(settings, output_path)
+                tts_cache.store(settings, keys[i], output_path, results[i]["duration"])
+                logger.info(f"セグメント {i+1}を生成: {output_path} ({results[i]['duration']:.2f}秒)")
+            return True
+        except KeyError as e:
+            logger.error(f"音声合成の応答にタイムポイント {e} がありません。")
+        except Exception as e:
+            logger.error(f"音声生成に失敗しました (SSML, {len(indices)}セグメント): {e}", exc_info=True)
+        return False
+
+    with ThreadPoolExecutor(max_workers=max(1, int(google_settings.get('concurrency', 4))), thread_name_prefix="tts") as executor:
+        succeeded = list(executor.map(lambda chunk: contextvars.copy_context().run(synthesize, chunk), chunks))
+    if not all(succeeded):
+        # 一つでも失敗したら、合成済みの音声を削除してNoneを返す
+        for result in results:
+            if result and os.path.exists(result["path"]):
+                os.remove(result["path"])
+        return None
+    return results
 
 def _generate_voice_voicevox(script_text, settings):
     voicevox_settings = settings.get('voicevox', {})
@@ -103,59 +450,75 @@ def _generate_voice_voicevox(script_text, settings):
         logger.error("VOICEVOX APIのURLまたは話者IDが設定されていません。")
         return None
 
-    os.makedirs("temp", exist_ok=True)
-
-    segments = [s.strip() for s in re.split('(。[。！？.!?])', script_text) if s.strip()]
-    audio_segments_info = []
-    logger.info(f"テキストを{len(segments)}個のセグメントに分割しました (VOICEVOX)。")
+    output_dir = scratch.scratch_dir(settings, "voice")
 
-    for i, segment_text in enumerate(segments):
-        if not segment_text:
-            continue
+    segments = _script_segments(script_text, "VOICEVOX", settings)
+    concurrency = voicevox_settings.get('concurrency', 2)
+    session = clients.http_session("voicevox", pool_size=concurrency)
+    # 合成結果に影響する設定（キャッシュキーに含める）
+    cache_params = {
+        "speaker_id": speaker_id,
+        "speed_scale": speed_scale,
+        "intonation_scale": intonation_scale,
+        "volume_scale": volume_scale,
+        "pre_phrasing_rate": pre_phrasing_rate,
+        "post_phrasing_rate": post_phrasing_rate,
+        "output_sampling_rate": output_sampling_rate,
+    }
 
+    def synthesize(i, segment_text):
+        output_path = None
+        key = tts_cache.segment_key("voicevox", segment_text, cache_params)
         try:
-            # audio_query
-            audio_query_params = {
-                "text": segment_text,
-                "speaker": speaker_id
-            }
-            audio_query_response = requests.post(f"{api_url}/audio_query", params=audio_query_params)
-            audio_query_response.raise_for_status()
-            query_data = audio_query_response.json()
-
-            # synthesis
-            synthesis_params = {
-                "speaker": speaker_id,
-                "speedScale": speed_scale,
-                "intonationScale": intonation_scale,
-                "volumeScale": volume_scale,
-                "prePhonemeLength": pre_phrasing_rate,
-                "postPhonemeLength": post_phrasing_rate,
-                "outputSamplingRate": output_sampling_rate
-            }
-            synthesis_response = requests.post(f"{api_url}/synthesis", params=synthesis_params, json=query_data)
-            synthesis_response.raise_for_status()
-
-            output_path = os.path.join("temp", f"voice_{uuid.uuid4()}.wav") # VOICEVOXはWAV出力
+            cached_path = os.path.join(output_dir, f"voice_{uuid.uuid4()}.wav")
+            cached = _cached_segment(settings, key, cached_path, i, segment_text)
+            if cached:
+                return cached
+            with tracing.span("tts.segment", engine="voicevox", index=i, chars=len(segment_text)) as sp:
+                # audio_query
+                audio_query_params = {
+                    "text": segment_text,
+                    "speaker": speaker_id
+                }
+                audio_query_response = session.post(f"{api_url}/audio_query", params=audio_query_params)
+                audio_query_response.raise_for_status()
+                query_data = audio_query_response.json()
+
+                # synthesis
+                synthesis_params = {
+                    "speaker": speaker_id,
+                    "speedScale": speed_scale,
+                    "intonationScale": intonation_scale,
+                    "volumeScale": volume_scale,
+                    "prePhonemeLength": pre_phrasing_rate,
+                    "postPhonemeLength": post_phrasing_rate,
+                    "outputSamplingRate": output_sampling_rate
+                }
+                synthesis_response = session.post(f"{api_url}/synthesis", params=synthesis_params, json=query_data)
+                synthesis_response.raise_for_status()
+                sp["bytes"] = len(synthesis_response.content)
+
+            output_path = os.path.join(output_dir, f"voice_{uuid.uuid4()}.wav") # VOICEVOXはWAV出力
             with open(output_path, "wb") as out:
                 out.write(synthesis_response.content)
+            scratch.account(settings, output_path)
 
-            audio_clip = AudioFileClip(output_path)
-            duration = audio_clip.duration
-            audio_clip.close()
+            duration = _audio_duration(output_path)
+            tts_cache.store(settings, key, output_path, duration)
 
-            audio_segments_info.append({"path": output_path, "duration": duration, "text": segment_text})
             logger.info(f"セグメント {i+1}を生成: {output_path} ({duration:.2f}秒)")
+            return {"path": output_path, "duration": duration, "text": segment_text}
 
         except requests.exceptions.RequestException as e:
             logger.error(f"VOICEVOX API呼び出しに失敗しました (セグメント: '{segment_text[:30]}...'): {e}", exc_info=True)
-            if os.path.exists(output_path):
+            if output_path and os.path.exists(output_path):
                 os.remove(output_path)
             return None
         except Exception as e:
             logger.error(f"VOICEVOX音声生成中に予期せぬエラーが発生しました (セグメント: '{segment_text[:30]}...'): {e}", exc_info=True)
-            if os.path.exists(output_path):
+            if output_path and os.path.exists(output_path):
                 os.remove(output_path)
             return None
 
-    return audio_segments_info
\ No newline at end of file
+    # エンジンの負荷に合わせて、同時に送るリクエスト数を voicevox.concurrency 件までに抑える
+    return _synthesize_segments(segments, synthesize, concurrency)
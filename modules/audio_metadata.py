@@ -0,0 +1,154 @@
+# modules/audio_metadata.py
+import os
+import shutil
+import struct
+import logging
+import subprocess
+
+logger = logging.getLogger(__name__)
+
+# --- WAV ---
+
+def _wav_duration(f):
+    """RIFF/WAVEのfmtチャンクのバイトレートとdataチャンクのサイズから長さを求める"""
+    f.seek(12)
+    byte_rate = None
+    file_size = os.fstat(f.fileno()).st_size
+    while True:
+        header = f.read(8)
+        if len(header) < 8:
+            return None
+        chunk_id, size = header[:4], struct.unpack("<I", header[4:])[0]
+        if chunk_id == b"fmt ":
+            fmt = f.read(size)
+            byte_rate = struct.unpack("<I", fmt[8:12])[0]
+            f.seek(size % 2, os.SEEK_CUR)
+        elif chunk_id == b"data":
+            if not byte_rate:
+                return None
+            # ストリーミングで書き出されたファイルはサイズが未確定 (0xFFFFFFFF など) の場合がある
+            size = min(size, file_size - f.tell())
+            return size / byte_rate
+        else:
+            f.seek(size + size % 2, os.SEEK_CUR)
+
+# --- MP3 ---
+
+_MP3_BITRATES = {
+    (1, 1): (0, 32, 64, 96, 128, 160, 192, 224, 256, 288, 320, 352, 384, 416, 448),
+    (1, 2): (0, 32, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320, 384),
+    (1, 3): (0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320),
+    (2, 1): (0, 32, 48, 56, 64, 80, 96, 112, 128, 144, 160, 176, 192, 224, 256),
+    (2, 2): (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+    (2, 3): (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+}
+_MP3_SAMPLE_RATES = {1: (44100, 48000, 32000), 2: (22050, 24000, 16000), 2.5: (11025, 12000, 8000)}
+_MP3_VERSIONS = {0b00: 2.5, 0b10: 2, 0b11: 1}
+_MP3_LAYERS = {0b01: 3, 0b10: 2, 0b11: 1}
+
+def _mp3_frame(data, pos):
+    """
+    pos から始まるMP3フレームのヘッダを解析し、(フレーム長, 1フレームのサンプル数, サンプリングレート, モノラルか, MPEGバージョン)
+    を返す。フレームヘッダでなければNone
+    """
+    if pos + 4 > len(data) or data[pos] != 0xFF or (data[pos + 1] & 0xE0) != 0xE0:
+        return None
+    b1, b2, b3 = data[pos + 1], data[pos + 2], data[pos + 3]
+    version = _MP3_VERSIONS.get((b1 >> 3) & 0b11)
+    layer = _MP3_LAYERS.get((b1 >> 1) & 0b11)
+    bitrate_index, rate_index = b2 >> 4, (b2 >> 2) & 0b11
+    if version is None or layer is None or bitrate_index in (0, 15) or rate_index == 3:
+        return None
+    bitrate = _MP3_BITRATES[(1 if version == 1 else 2, layer)][bitrate_index] * 1000
+    sample_rate = _MP3_SAMPLE_RATES[version][rate_index]
+    padding = (b2 >> 1) & 1
+    if layer == 1:
+        samples, length = 384, (12 * bitrate // sample_rate + padding) * 4
+    elif layer == 3 and version != 1:
+        samples, length = 576, 72 * bitrate // sample_rate + padding
+    else:
+        samples, length = 1152, 144 * bitrate // sample_rate + padding
+    mono = (b3 >> 6) == 0b11
+    return length, samples, sample_rate, mono, version
+
+def _mp3_start(data):
+    """ID3v2タグを読み飛ばし、最初のフレームの位置を返す"""
+    pos = 0
+    while data[pos:pos + 3] == b"ID3" and pos + 10 <= len(data):
+        size = 0
+        for b in data[pos + 6:pos + 10]:
+            size = (size << 7) | (b & 0x7F)  # syncsafe integer
+        pos += 10 + size + (10 if data[pos + 5] & 0x10 else 0)
+    # タグの後に余分なバイトがあっても、最初のフレームヘッダまで読み進める
+    limit = min(len(data), pos + 64 * 1024)
+    while pos < limit and _mp3_frame(data, pos) is None:
+        pos += 1
+    return pos if pos < limit else None
+
+def _mp3_duration(data):
+    start = _mp3_start(data)
+    if start is None:
+        return None
+    length, samples, sample_rate, mono, version = _mp3_frame(data, start)
+
+    # VBRのファイルは先頭フレームのXing/Info・VBRIタグに総フレーム数が書かれている
+    side_info = (17 if mono else 32) if version == 1 else (9 if mono else 17)
+    xing = start + 4 + side_info
+    if data[xing:xing + 4] in (b"Xing", b"Info"):
+        flags = struct.unpack(">I", data[xing + 4:xing + 8])[0]
+        if flags & 1:
+            frames = struct.unpack(">I", data[xing + 8:xing + 12])[0]
+            return frames * samples / sample_rate
+    vbri = start + 4 + 32
+    if data[vbri:vbri + 4] == b"VBRI":
+        frames = struct.unpack(">I", data[vbri + 14:vbri + 18])[0]
+        return frames * samples / sample_rate
+
+    # タグがない場合はフレームヘッダをたどって数える（フレーム長だけ読み飛ばすので速い）
+    total_samples = 0
+    pos = start
+    while True:
+        frame = _mp3_frame(data, pos)
+        if frame is None or frame[0] <= 0:
+            break
+        total_samples += frame[1]
+        pos += frame[0]
+        sample_rate = frame[2]
+    return total_samples / sample_rate if total_samples else None
+
+# --- フォールバック ---
+
+def _probe_duration(path):
+    """ヘッダから長さを求められない形式の場合に、ffprobe（なければmoviepy）で長さを調べる"""
+    ffprobe = shutil.which("ffprobe")
+    if ffprobe:
+        result = subprocess.run(
+            [ffprobe, "-v", "error", "-show_entries", "format=duration", "-of", "default=noprint_wrappers=1:nokey=1", path],
+            capture_output=True, text=True, check=True, timeout=30,
+        )
+        return float(result.stdout.strip())
+    from moviepy.audio.io.AudioFileClip import AudioFileClip
+    audio_clip = AudioFileClip(path)
+    duration = audio_clip.duration
+    audio_clip.close()
+    return duration
+
+def duration(path):
+    """
+    音声ファイルの長さ（秒）を返す。WAV (RIFF) はfmt/dataチャンクから、MP3はXing/Info・VBRIタグまたは
+    フレームヘッダから計算し、ffmpegのプロセスを起動しない。それ以外の形式だけffprobe（なければmoviepy）で調べる。
+    長さを求められない場合は例外を送出する。
+    """
+    with open(path, "rb") as f:
+        head = f.read(12)
+        if head[:4] == b"RIFF" and head[8:12] == b"WAVE":
+            seconds = _wav_duration(f)
+        elif head[:3] == b"ID3" or (len(head) >= 2 and head[0] == 0xFF and (head[1] & 0xE0) == 0xE0):
+            f.seek(0)
+            seconds = _mp3_duration(f.read())
+        else:
+            seconds = None
+    if seconds is None:
+        logger.debug(f"ヘッダから音声の長さを求められないため、ffprobeで調べます: {path}")
+        seconds = _probe_duration(path)
+    return seconds
@@ -0,0 +1,40 @@
+# modules/backends.py
+import logging
+import importlib
+
+logger = logging.getLogger(__name__)
+
+# 種類ごとのバックエンド名 -> "モジュール:関数名"
+# 実装モジュールは get() で初めて読み込まれるため、使わないエンジンの依存ライブラリは読み込まれない
+_REGISTRY = {
+    "tts": {
+        "google": "modules.audio_manager:_generate_voice_google_tts",
+        "voicevox": "modules.audio_manager:_generate_voice_voicevox",
+    },
+    "image": {
+        "stable_diffusion": "modules.image_manager:_generate_images_sd",
+        "stock": "modules.image_manager:_select_stock_images",
+    },
+}
+
+def register(kind, name, target):
+    """バックエンドを登録する。targetは "モジュール:関数名" の文字列か、呼び出し可能オブジェクト"""
+    _REGISTRY.setdefault(kind, {})[name] = target
+
+def available(kind):
+    """登録されているバックエンド名の一覧"""
+    return list(_REGISTRY.get(kind, {}))
+
+def get(kind, name):
+    """
+    バックエンドの関数を返す（実装モジュールは初回呼び出し時に読み込まれる）。
+    登録されていない場合はNoneを返す。
+    """
+    target = _REGISTRY.get(kind, {}).get(name)
+    if target is None:
+        logger.error(f"未登録のバックエンドです: {kind}/{name}")
+        return None
+    if isinstance(target, str):
+        module_name, attr = target.split(":")
+        target = getattr(importlib.import_module(module_name), attr)
+    return target
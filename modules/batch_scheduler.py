@@ -0,0 +1,134 @@
+# modules/batch_scheduler.py
+import os
+import logging
+import multiprocessing
+import traceback
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
+from modules import tracing
+from modules.memory_budget import MemoryBudget, RssSampler, estimate_compose_bytes
+
+logger = logging.getLogger(__name__)
+
+def _init_compose_worker(log_level):
+    """動画合成用ワーカープロセスのロギングを初期化する"""
+    logging.basicConfig(level=log_level, format='%(asctime)s - %(levelname)s - %(message)s')
+
+def _compose_in_worker(args, trace):
+    """
+    ワーカープロセス内で動画合成を実行する (moviepyはここで初めて読み込まれる)。
+    トレースが有効な場合は、ワーカー内で記録したスパンも一緒に返す。
+    合成中に増えたRSSのピークも計測して返す。
+    """
+    from modules.video_composer import compose_video
+    if trace:
+        tracing.enable()
+    with RssSampler() as sampler:
+        result = compose_video(*args)
+    return result, tracing.drain(), sampler.peak
+
+class BatchScheduler:
+    """
+    複数テーマの動画生成を並行して実行するスケジューラ。
+    ネットワーク待ちが中心のステージはスレッドプールで並行させ、
+    CPU負荷の高い動画エンコードはコア数に合わせたプロセスプールで実行し、
+    同時に実行する合成の数はメモリ予算の範囲内に抑える。
+    withブロック内で使うと、エンコード用のプロセスプールを複数回のrun()で使い回す（常駐モード用）。
+    """
+
+    def __init__(self, settings):
+        batch_settings = settings.get('batch', {})
+        self.workers = max(1, int(batch_settings.get('workers', 1)))
+        cpu_count = os.cpu_count() or 1
+        compose_workers = batch_settings.get('compose_workers') or cpu_count
+        # テーマ数以上のエンコードプロセスを用意しても意味がないため上限を設ける
+        self.compose_workers = max(1, min(int(compose_workers), cpu_count, self.workers))
+        log_level_str = settings.get('logging', {}).get('level', 'INFO').upper()
+        self._log_level = getattr(logging, log_level_str, logging.INFO)
+        self._compose_pool = None
+        self._keep_pool = False
+        self.memory = MemoryBudget.from_settings(settings)
+
+    def __enter__(self):
+        self._keep_pool = True
+        return self
+
+    def __exit__(self, *exc):
+        self._keep_pool = False
+        self._shutdown_pool()
+
+    def _shutdown_pool(self):
+        if self._compose_pool is not None:
+            self._compose_pool.shutdown(wait=True)
+            self._compose_pool = None
+
+    def compose_video(self, *args):
+        """
+        動画合成をプロセスプールに投入し、完了まで待って結果を返す。
+        メモリ予算を超える場合は、実行中の合成が終わるまで投入を待つ。
+        """
+        if self._compose_pool is None:
+            from modules.video_composer import compose_video
+            return compose_video(*args)
+        theme, images, audio_segments_info, settings = args[0], args[1], args[2], args[-1]
+        estimate = estimate_compose_bytes(images, audio_segments_info, settings)
+        with self.memory.reserve(estimate, label=theme):
+            result, spans, peak = self._compose_pool.submit(_compose_in_worker, args, tracing.is_enabled()).result()
+        tracing.add_spans(spans)
+        if result:
+            # 途中で失敗した合成の実測値は見積もりの補正に使わない
+            self.memory.observe(estimate, peak)
+        return result
+
+    def run(self, themes, process_fn, settings, on_done=None):
+        """
+        テーマごとに process_fn(theme, settings, scheduler) を実行する。
+        1テーマの失敗は他のテーマに影響させない。
+        on_doneを渡すと、テーマが終わるたびに on_done(テーマの位置, 戻り値) を呼ぶ（バッチ全体の完了を待たない）。
+
+        Returns:
+            list: テーマと同じ順序で並んだ process_fn の戻り値（失敗時はNone）のリスト。
+        """
+        total = len(themes)
+        results = [None] * total
+
+        if self.workers == 1:
+            # 従来通り1テーマずつ順番に処理する
+            for i, theme in enumerate(themes):
+                results[i] = self._run_one(process_fn, theme, settings)
+                if on_done:
+                    on_done(i, results[i])
+                print(f">>> 進捗: {i + 1}/{total}件完了 <<<")
+            return results
+
+        logger.info(f"バッチモード: 並列数={self.workers}, エンコードプロセス数={self.compose_workers}")
+        if self._compose_pool is None:
+            # fork後のスレッド/ロック状態を引き継がないよう、spawnでワーカーを起動する
+            self._compose_pool = ProcessPoolExecutor(
+                max_workers=self.compose_workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_compose_worker,
+                initargs=(self._log_level,)
+            )
+        try:
+            with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="theme") as executor:
+                futures = {executor.submit(self._run_one, process_fn, theme, settings): i for i, theme in enumerate(themes)}
+                for done, future in enumerate(as_completed(futures), start=1):
+                    i = futures[future]
+                    theme = themes[i]
+                    results[i] = future.result()
+                    if on_done:
+                        on_done(i, results[i])
+                    print(f">>> 進捗: {done}/{total}件完了 (テーマ: \"{theme}\") <<<")
+        finally:
+            if not self._keep_pool:
+                self._shutdown_pool()
+
+        return results
+
+    def _run_one(self, process_fn, theme, settings):
+        try:
+            return process_fn(theme, settings, self)
+        except Exception:
+            logger.error(f"テーマ「{theme}」の処理中に予期せぬエラーが発生しました。")
+            traceback.print_exc()
+            return None
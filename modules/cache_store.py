@@ -0,0 +1,213 @@
+# modules/cache_store.py
+import os
+import time
+import shutil
+import sqlite3
+import hashlib
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+def cache_key(*parts):
+    """キーの構成要素を連結したSHA-256"""
+    h = hashlib.sha256()
+    for part in parts:
+        data = part if isinstance(part, bytes) else str(part).encode('utf-8')
+        h.update(len(data).to_bytes(8, 'big'))
+        h.update(data)
+    return h.hexdigest()
+
+class SQLiteCache:
+    """
+    SQLiteに値（バイト列）を保存するキャッシュ。
+    作成から ttl_seconds を過ぎたエントリは無効とし、合計サイズが max_bytes を超えた場合は
+    最後に参照された時刻が古いものから削除する (LRU)。複数スレッドから共有して使える。
+    """
+
+    def __init__(self, path, ttl_seconds=None, max_bytes=None):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        # 常駐モードと単発実行が同じファイルを使っても読み書きできるようWALモードにする
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            "key TEXT PRIMARY KEY, value BLOB NOT NULL, size INTEGER NOT NULL, "
+            "created_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS entries_accessed_at ON entries(accessed_at)")
+
+    def get(self, key):
+        """値を返す。存在しない・期限切れの場合はNone"""
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute("SELECT value, created_at FROM entries WHERE key = ?", (key,)).fetchone()
+            if row is not None and self.ttl_seconds and now - row[1] > self.ttl_seconds:
+                self._conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+                row = None
+            if row is None:
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE entries SET accessed_at = ? WHERE key = ?", (now, key))
+            self.hits += 1
+            return row[0]
+
+    def set(self, key, value):
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO entries (key, value, size, created_at, accessed_at) VALUES (?, ?, ?, ?, ?)",
+                (key, sqlite3.Binary(value), len(value), now, now)
+            )
+            self._evict(now)
+
+    def _evict(self, now):
+        if self.ttl_seconds:
+            self._conn.execute("DELETE FROM entries WHERE created_at < ?", (now - self.ttl_seconds,))
+        if not self.max_bytes:
+            return
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        victims = []
+        for key, size in self._conn.execute("SELECT key, size FROM entries ORDER BY accessed_at ASC"):
+            if total <= self.max_bytes:
+                break
+            victims.append((key,))
+            total -= size
+        self._conn.executemany("DELETE FROM entries WHERE key = ?", victims)
+        logger.debug(f"キャッシュ容量を超えたため{len(victims)}件を削除しました: {self.path}")
+
+    def stats(self):
+        """ヒット数・ミス数・エントリ数・合計サイズ"""
+        with self._lock:
+            entries, size = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries").fetchone()
+        return {"hits": self.hits, "misses": self.misses, "entries": entries, "bytes": size}
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+class FileCache:
+    """
+    キーから内容が決まるファイル（生成画像など）をディレクトリに保存するキャッシュ。
+    合計サイズが max_bytes を超えた場合は、最後に参照された時刻が古いファイルから削除する (LRU)。
+    参照時刻はファイルの更新時刻で管理するため、複数のプロセスから同じディレクトリを使える。
+    """
+
+    def __init__(self, root, max_bytes=None):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+        self._total = sum(size for _, size, _ in self._entries())
+
+    def _path(self, key, suffix):
+        return os.path.join(self.root, key[:2], f"{key}{suffix}")
+
+    def _entries(self):
+        """(パス, サイズ, 最終参照時刻) のリスト"""
+        entries = []
+        for dirpath, _, filenames in os.walk(self.root):
+            for name in filenames:
+                if name.endswith(".tmp"):
+                    continue
+                path = os.path.join(dirpath, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((path, st.st_size, st.st_mtime))
+        return entries
+
+    def get(self, key, suffix=""):
+        """保存済みのファイルのパスを返す。なければNone"""
+        path = self._path(key, suffix)
+        try:
+            os.utime(path)
+        except OSError:
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        return path
+
+    def put(self, key, src_path, suffix=""):
+        """ファイルの内容をキャッシュに保存し、保存先のパスを返す"""
+        path = self._path(key, suffix)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        shutil.copyfile(src_path, tmp_path)
+        os.replace(tmp_path, path)
+        with self._lock:
+            self._total += os.path.getsize(path)
+            if self.max_bytes and self._total > self.max_bytes:
+                self._evict()
+        return path
+
+    def _evict(self):
+        # 他のプロセスが追加・削除した分も反映するため、削除時はディレクトリを走査し直す
+        entries = sorted(self._entries(), key=lambda e: e[2])
+        total = sum(size for _, size, _ in entries)
+        removed = 0
+        for path, size, _ in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            removed += 1
+        self._total = total
+        logger.debug(f"キャッシュ容量を超えたため{removed}件を削除しました: {self.root}")
+
+    def stats(self):
+        """ヒット数・ミス数・合計サイズ"""
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "bytes": self._total}
+
+def link_file(src_path, dest_path):
+    """キャッシュのファイルをジョブの作業領域に置く（可能ならハードリンクで、コピーはしない）"""
+    try:
+        os.link(src_path, dest_path)
+    except OSError:
+        shutil.copyfile(src_path, dest_path)
+
+def open_file_cache(root, max_bytes=None):
+    """ディレクトリごとに1つのファイルキャッシュを開いて共有する"""
+    with _caches_lock:
+        cache = _caches.get(root)
+        if cache is None:
+            cache = FileCache(root, max_bytes)
+            _caches[root] = cache
+        return cache
+
+def open_cache(path, ttl_seconds=None, max_bytes=None):
+    """パスごとに1つのキャッシュを開いて共有する（ヒット数などをプロセス全体で集計するため）"""
+    with _caches_lock:
+        cache = _caches.get(path)
+        if cache is None:
+            cache = SQLiteCache(path, ttl_seconds, max_bytes)
+            _caches[path] = cache
+        return cache
+
+def close_all():
+    """開いているキャッシュをすべて閉じる（ファイルキャッシュは共有を解除するだけ）"""
+    with _caches_lock:
+        for cache in _caches.values():
+            if isinstance(cache, SQLiteCache):
+                cache.close()
+        _caches.clear()
@@ -0,0 +1,183 @@
+# modules/clients.py
+import os
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+# 台本・画像プロンプトの生成に使うGeminiのモデル
+GEMINI_MODEL = 'models/gemini-1.5-flash'
+
+# プロセス全体で共有するクライアント (キー -> クライアント)
+_clients = {}
+# クライアントごとの作成中ロック（同じクライアントを複数スレッドが同時に作らないようにする）
+_creating = {}
+_lock = threading.Lock()
+# スレッドごとに作るクライアント（httplib2はスレッドセーフではないため、YouTubeはスレッドごとに持つ）
+_local = threading.local()
+_generation = 0
+
+def _get_or_create(key, factory):
+    """キーに対応するクライアントを返す。未作成なら1度だけ作成する（Noneは保存しない）"""
+    with _lock:
+        if key in _clients:
+            return _clients[key]
+        creating = _creating.setdefault(key, threading.Lock())
+    with creating:
+        with _lock:
+            if key in _clients:
+                return _clients[key]
+        client = factory()
+        if client is not None:
+            with _lock:
+                _clients[key] = client
+        return client
+
+def shared(key, factory):
+    """
+    クライアント以外にプロセス全体で共有するオブジェクト（サーキットブレーカーなど）を、キーごとに1度だけ作成して返す。
+    reset() でクライアントと一緒に破棄される。
+    """
+    return _get_or_create(key, factory)
+
+def reset():
+    """作成済みのクライアントをすべて破棄する（テストや設定の変更時に使う）"""
+    global _generation
+    with _lock:
+        _clients.clear()
+        _creating.clear()
+        _generation += 1
+
+def gemini_model(settings, model_name=GEMINI_MODEL):
+    """
+    設定のAPIキーで初期化したGeminiのモデルを返す。
+    genai.configureは呼ぶたびに内部の接続を作り直すため、APIキーごとに1度だけ呼ぶ。
+    """
+    api_key = settings['api_keys']['gemini']
+
+    def configure():
+        import google.generativeai as genai
+        genai.configure(api_key=api_key)
+        return genai
+
+    def create():
+        genai = _get_or_create(("gemini.configure", api_key), configure)
+        return genai.GenerativeModel(model_name)
+
+    return _get_or_create(("gemini", api_key, model_name), create)
+
+def tts_client(beta=False):
+    """
+    Google Cloud TTSのクライアント（gRPCのチャネルと認証を使い回す。スレッドセーフ）。
+    beta=Trueの場合は、SSMLのmarkのタイムポイントを返せるv1beta1のクライアントを返す。
+    """
+    def create():
+        if beta:
+            from google.cloud import texttospeech_v1beta1 as texttospeech
+        else:
+            from google.cloud import texttospeech
+        return texttospeech.TextToSpeechClient()
+    return _get_or_create(("tts", "v1beta1") if beta else ("tts",), create)
+
+def http_session(name, pool_size=10):
+    """
+    名前ごとに共有するrequestsのセッション（接続を使い回す）。
+    並行して送るリクエスト数まで接続を保持できるよう、接続プールの大きさを pool_size にする。
+    """
+    def create():
+        import requests
+        from requests.adapters import HTTPAdapter
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max(1, pool_size))
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        return session
+    return _get_or_create(("http", name, pool_size), create)
+
+def _youtube_discovery_document():
+    """YouTube Data APIのディスカバリドキュメント（パッケージ同梱のものを1度だけ読み込む）"""
+    def load():
+        from googleapiclient.discovery_cache import get_static_doc
+        return get_static_doc("youtube", "v3")
+    return _get_or_create(("youtube.discovery",), load)
+
+def youtube_credentials(settings):
+    """YouTubeの認証情報を返す（トークンファイルごとに1度だけ読み込む）。認証に失敗した場合はNone"""
+    from modules.youtube_uploader import get_credentials
+    youtube_settings = settings.get('youtube', {})
+    token_path = youtube_settings.get('token_path', "youtube_token.json")
+    client_secret_path = youtube_settings.get('client_secret_path', "client_secret.json")
+    return _get_or_create(
+        ("youtube.credentials", token_path),
+        lambda: get_credentials(token_path, client_secret_path)
+    )
+
+def youtube_service(settings):
+    """
+    YouTube Data APIのサービスを返す。認証に失敗した場合はNone。
+    サービスは呼び出し元のスレッドごとに1度だけ作り、ディスカバリドキュメントはプロセス全体で共有する。
+    """
+    credentials = youtube_credentials(settings)
+    if not credentials:
+        return None
+    services = getattr(_local, "youtube", None)
+    if services is None or services[0] != _generation:
+        services = (_generation, {})
+        _local.youtube = services
+    key = id(credentials)
+    if key not in services[1]:
+        from googleapiclient.discovery import build, build_from_document
+        document = _youtube_discovery_document()
+        if document:
+            services[1][key] = build_from_document(document, credentials=credentials)
+        else:
+            services[1][key] = build("youtube", "v3", credentials=credentials, cache_discovery=False)
+    return services[1][key]
+
+def _warm_gemini(settings):
+    # 無料のトークン数計算を呼び、台本生成と同じgRPCチャネルの接続を確立しておく
+    gemini_model(settings).count_tokens("warm up")
+
+def _warm_tts(settings):
+    tts_client().list_voices(language_code="ja-JP", timeout=10)
+
+def _warm_youtube(settings):
+    youtube_service(settings)
+
+def _warmers(settings):
+    """この実行で使うクライアントの事前接続処理の一覧"""
+    warmers = []
+    api_key = settings.get('api_keys', {}).get('gemini')
+    if api_key and "ここに" not in api_key:
+        warmers.append(("gemini", _warm_gemini))
+    credentials_path = os.getenv('GOOGLE_APPLICATION_CREDENTIALS')
+    if settings.get('audio_engine', 'google') == 'google' and credentials_path and os.path.exists(credentials_path):
+        warmers.append(("tts", _warm_tts))
+    youtube_settings = settings.get('youtube', {})
+    # ブラウザでの認証が必要になる場合はバックグラウンドで始めないよう、保存済みのトークンがあるときだけ準備する
+    if youtube_settings.get('post_to_youtube', False) and os.path.exists(youtube_settings.get('token_path', "youtube_token.json")):
+        warmers.append(("youtube", _warm_youtube))
+    return warmers
+
+def warm_up(settings):
+    """
+    この実行で使うクライアントをバックグラウンドで並行して作成・接続しておく。
+    失敗しても実際の呼び出し時に改めて作成されるため、エラーはログに記録するだけにする。
+    起動したスレッドのリストを返す（待つ必要はない）。
+    """
+    if not settings.get('clients', {}).get('warm_up', True):
+        return []
+
+    def run(name, warm):
+        try:
+            warm(settings)
+            logger.debug(f"APIクライアントの事前接続が完了しました: {name}")
+        except Exception as e:
+            logger.debug(f"APIクライアントの事前接続に失敗しました ({name}): {e}")
+
+    threads = []
+    for name, warm in _warmers(settings):
+        thread = threading.Thread(target=run, args=(name, warm), name=f"warm-{name}", daemon=True)
+        thread.start()
+        threads.append(thread)
+    return threads
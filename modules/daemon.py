@@ -0,0 +1,119 @@
+# modules/daemon.py
+import copy
+import signal
+import logging
+import threading
+from datetime import datetime
+
+from modules import tracing, run_history
+from modules.batch_scheduler import BatchScheduler
+from modules.job_queue import JobQueue
+
+logger = logging.getLogger(__name__)
+
+def open_queue(settings):
+    """設定に従ってジョブキューを開く"""
+    daemon_settings = settings.get('daemon', {})
+    return JobQueue(daemon_settings.get('queue_dir', 'output/queue'),
+                    max_attempts=daemon_settings.get('max_attempts', 3))
+
+def _daemon_settings(settings):
+    """
+    常駐モード用に設定を調整する。
+    クラッシュ後に同じジョブを再実行しても動画を作り直したり二重投稿したりしないよう、
+    チェックポイントからの再開を常に有効にする。
+    """
+    settings = copy.deepcopy(settings)
+    checkpoint_settings = settings.setdefault('checkpoint', {})
+    checkpoint_settings['resume'] = True
+    if not checkpoint_settings.get('enabled', True):
+        logger.warning("チェックポイントが無効なため、クラッシュ後の再実行で二重投稿を防げません。")
+    return settings
+
+def _take_batch(queue, limit):
+    """同じテーマのジョブが同時に走らないよう、テーマの重複を除いて未処理のジョブを取り出す"""
+    batch = []
+    themes = set()
+    for job in queue.pending():
+        if job["theme"] in themes:
+            continue
+        themes.add(job["theme"])
+        batch.append(job)
+        if len(batch) >= limit:
+            break
+    return batch
+
+def _install_signal_handlers(stop_event):
+    """SIGTERM/SIGINTで、処理中のバッチが終わってから停止する"""
+    if threading.current_thread() is not threading.main_thread():
+        return
+
+    def handler(signum, frame):
+        print("\n>>> 停止要求を受け付けました。処理中のジョブが完了してから終了します <<<")
+        stop_event.set()
+
+    signal.signal(signal.SIGTERM, handler)
+    signal.signal(signal.SIGINT, handler)
+
+def run_daemon(settings, process_fn, stop_event=None, prepare_fn=None):
+    """
+    ジョブキューを監視し、未処理のジョブをバッチスケジューラで処理し続ける。
+    prepare_fnを渡すと、バッチごとに prepare_fn(themes, settings) が返す設定で処理する（台本の事前生成など）。
+    設定とプロセスプールはプロセスの生存中使い回す。
+    各ジョブはテーマの処理が終わるたびにacks.jsonlへ記録するため、バッチの途中でクラッシュしても未完了のジョブだけが再実行される。
+
+    Returns:
+        int: 完了したジョブの件数。
+    """
+    daemon_settings = settings.get('daemon', {})
+    poll_interval = daemon_settings.get('poll_interval', 10)
+    exit_when_empty = daemon_settings.get('exit_when_empty', False)
+    tracing_settings = settings.get('tracing', {})
+    history_settings = settings.get('history', {})
+    settings = _daemon_settings(settings)
+
+    queue = open_queue(settings)
+    stop_event = stop_event or threading.Event()
+    _install_signal_handlers(stop_event)
+
+    completed = 0
+    with BatchScheduler(settings) as scheduler:
+        batch_size = daemon_settings.get('batch_size') or scheduler.workers
+        print(f">>> 常駐モードを開始しました (キュー: {queue.queue_dir}, 並列数: {scheduler.workers}) <<<")
+        while not stop_event.is_set():
+            jobs = _take_batch(queue, batch_size)
+            if not jobs:
+                if exit_when_empty:
+                    break
+                stop_event.wait(poll_interval)
+                continue
+
+            themes = [job["theme"] for job in jobs]
+            print(f"\n>>> {len(jobs)}件のジョブを処理します <<<")
+            batch_settings = prepare_fn(themes, settings) if prepare_fn else settings
+
+            def ack(i, result):
+                # バッチ全体の完了を待たずに記録し、途中でクラッシュしても完了したジョブを再実行しない
+                nonlocal completed
+                job = jobs[i]
+                if result:
+                    queue.ack(job["job_id"], "done", result)
+                    completed += 1
+                else:
+                    queue.ack(job["job_id"], "failed")
+                    attempts = job["attempts"] + 1
+                    if attempts >= queue.max_attempts:
+                        logger.error(f"ジョブ {job['job_id']} (テーマ: {job['theme']}) は{attempts}回失敗したため打ち切ります。")
+
+            scheduler.run(themes, process_fn, batch_settings, on_done=ack)
+
+            if history_settings.get('enabled', True):
+                run_history.record(tracing.get_spans(), history_settings.get('path', 'output/history/runs.jsonl'))
+            if tracing_settings.get('enabled', False):
+                run_name = datetime.now().strftime('%Y%m%d_%H%M%S')
+                tracing.export(tracing_settings.get('output_dir', 'output/traces'), run_name)
+            tracing.reset()
+
+    stats = queue.stats()
+    print(f">>> 常駐モードを終了しました (完了: {stats['done']}件 / 未処理: {stats['pending']}件 / 打ち切り: {stats['gave_up']}件) <<<")
+    return completed
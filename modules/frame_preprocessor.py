@@ -0,0 +1,126 @@
+# modules/frame_preprocessor.py
+import os
+import hashlib
+import logging
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+
+from modules import tracing, scratch
+from modules.cache_store import open_file_cache, cache_key, link_file
+
+logger = logging.getLogger(__name__)
+
+# フレームの作り方を変えた場合はこの値を変え、古いキャッシュを使わないようにする
+_FRAME_VERSION = 1
+_HASH_CHUNK_SIZE = 1024 * 1024
+
+def _preprocess_settings(settings):
+    """有効な場合に前処理の設定を返す。無効ならNone"""
+    preprocess_settings = settings.get('video', {}).get('preprocess', {})
+    if not preprocess_settings.get('enabled', False):
+        return None
+    return preprocess_settings
+
+def _open_cache(preprocess_settings):
+    max_mb = preprocess_settings.get('cache_max_mb', 1024)
+    return open_file_cache(
+        preprocess_settings.get('cache_dir', 'output/cache/frames'),
+        max_bytes=int(max_mb * 1024 * 1024) if max_mb else None,
+    )
+
+def _resolution(settings):
+    return tuple(settings.get('video', {}).get('resolution', [1080, 1920]))
+
+def frame_key(path, resolution):
+    """元画像の内容と出力解像度から決まるフレームのキャッシュキー"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(_HASH_CHUNK_SIZE), b""):
+            digest.update(block)
+    return cache_key(digest.hexdigest(), resolution[0], resolution[1], _FRAME_VERSION)
+
+def render_frame(src_path, dest_path, resolution):
+    """
+    画像を動画のフレームに変換する。幅を解像度に合わせて縦横比を保ったまま縮小・拡大し、
+    黒背景の中央に配置したRGB画像として保存する（はみ出す部分は切り取る）。
+    video_composer の resize + ColorClip + CompositeVideoClip と同じ見た目になる。
+    """
+    from PIL import Image
+    width, height = resolution
+    with Image.open(src_path) as img:
+        if img.mode in ("RGBA", "LA", "P"):
+            # 透過部分は黒背景に重ねる
+            rgba = img.convert("RGBA")
+            img_rgb = Image.new("RGB", rgba.size, (0, 0, 0))
+            img_rgb.paste(rgba, mask=rgba.getchannel("A"))
+        else:
+            img_rgb = img.convert("RGB")
+    resized_h = max(1, round(img_rgb.height * width / img_rgb.width))
+    if img_rgb.size != (width, resized_h):
+        img_rgb = img_rgb.resize((width, resized_h), Image.LANCZOS)
+    frame = Image.new("RGB", (width, height), (0, 0, 0))
+    frame.paste(img_rgb, (0, (height - resized_h) // 2))
+    # 書き出し時に読み込むだけなので、圧縮率より保存の速さを優先する
+    frame.save(dest_path, format="PNG", compress_level=1)
+    return dest_path
+
+def is_frame(path, resolution):
+    """前処理済みのフレーム（解像度どおりのRGB画像）かどうか（ヘッダのみ読み込む）"""
+    try:
+        from PIL import Image
+        with Image.open(path) as img:
+            return img.size == tuple(resolution) and img.mode == "RGB"
+    except Exception:
+        return False
+
+def prepare_frames(images, settings):
+    """
+    画像をそれぞれ1度だけ動画のフレームに変換し、フレームのパスを画像と同じ順で返す。
+    変換は並行して行い、同じ内容の画像のフレームはキャッシュから再利用する。
+    前処理が無効な場合や、変換できなかった画像は元のパスをそのまま返す（動画合成時に従来どおり処理される）。
+    """
+    preprocess_settings = _preprocess_settings(settings)
+    if not preprocess_settings or not images:
+        return images
+    resolution = _resolution(settings)
+    cache = _open_cache(preprocess_settings)
+    save_dir = scratch.scratch_dir(settings, "frames")
+    workers = max(1, int(preprocess_settings.get('workers', min(4, os.cpu_count() or 1))))
+
+    def prepare(index, src_path):
+        if not src_path or not os.path.exists(src_path):
+            return src_path, False
+        dest_path = os.path.join(save_dir, f"{index + 1:04}.png")
+        try:
+            key = frame_key(src_path, resolution)
+            cached = cache.get(key, ".png")
+            if cached:
+                try:
+                    link_file(cached, dest_path)
+                    return dest_path, True
+                except OSError as e:
+                    # 別のプロセスに削除された場合などは作り直す
+                    logger.debug(f"キャッシュのフレームを取得できませんでした: {cached} ({e})")
+            render_frame(src_path, dest_path, resolution)
+            scratch.account(settings, dest_path)
+        except scratch.ScratchQuotaExceeded:
+            raise
+        except Exception as e:
+            logger.warning(f"画像のフレームへの変換に失敗しました。動画合成時に変換します: {src_path} ({e})")
+            return src_path, False
+        try:
+            cache.put(key, dest_path, ".png")
+        except OSError as e:
+            logger.warning(f"フレームをキャッシュに保存できませんでした: {e}")
+        return dest_path, False
+
+    with tracing.span("video.preprocess", images=len(images), workers=workers) as sp:
+        with ThreadPoolExecutor(max_workers=min(workers, len(images)), thread_name_prefix="frames") as executor:
+            futures = [
+                executor.submit(contextvars.copy_context().run, prepare, i, path)
+                for i, path in enumerate(images)
+            ]
+            results = [future.result() for future in futures]
+        sp["cache_hits"] = sum(1 for _, hit in results if hit)
+    logger.info(f"画像を{len(images)}枚フレームに変換しました (キャッシュ{sp['cache_hits']}枚)")
+    return [path for path, _ in results]
@@ -0,0 +1,60 @@
+# modules/image_cache.py
+import json
+import logging
+
+from modules.cache_store import open_file_cache, cache_key, link_file
+
+logger = logging.getLogger(__name__)
+
+def _open(settings):
+    """設定でキャッシュが有効な場合にキャッシュを開く"""
+    cache_settings = settings.get('image_cache', {})
+    if not cache_settings.get('enabled', False):
+        return None
+    max_mb = cache_settings.get('max_mb', 2048)
+    return open_file_cache(
+        cache_settings.get('path', 'output/cache/images'),
+        max_bytes=int(max_mb * 1024 * 1024) if max_mb else None,
+    )
+
+def image_key(payload, occurrence=0, postprocess=None):
+    """
+    画像のキャッシュキー。txt2imgのリクエスト内容（プロンプト、ネガティブプロンプト、モデル、LoRAと重み、
+    ステップ数、サイズ、シード）から計算する。同じプロンプトを複数枚使う場合は何枚目か (occurrence) で区別する。
+    生成後にアップスケールなどの加工をする場合は、その設定 (postprocess) もキーに含める。
+    """
+    fields = {k: v for k, v in payload.items() if k != "batch_size"}
+    if postprocess:
+        fields["postprocess"] = postprocess
+    return cache_key(json.dumps(fields, sort_keys=True, ensure_ascii=False), occurrence)
+
+def fetch(settings, key, dest_path):
+    """キャッシュにある画像を dest_path に置いて True を返す。なければ False"""
+    cache = _open(settings)
+    if not cache:
+        return False
+    cached = cache.get(key, ".png")
+    if not cached:
+        return False
+    try:
+        link_file(cached, dest_path)
+    except OSError as e:
+        # 別のプロセスに削除された場合などは、キャッシュになかったものとして生成し直す
+        logger.debug(f"キャッシュの画像を取得できませんでした: {cached} ({e})")
+        return False
+    return True
+
+def store(settings, key, path):
+    """生成した画像をキャッシュに保存する（失敗しても画像生成は成功として扱う）"""
+    cache = _open(settings)
+    if not cache:
+        return
+    try:
+        cache.put(key, path, ".png")
+    except OSError as e:
+        logger.warning(f"生成した画像をキャッシュに保存できませんでした: {e}")
+
+def stats(settings):
+    """キャッシュのヒット数などを返す。キャッシュが無効な場合はNone"""
+    cache = _open(settings)
+    return cache.stats() if cache else None
@@ -2,22 +2,27 @@
 import os
 import glob
 import traceback
-import google.generativeai as genai
-from google.generativeai import types
-import requests
 import base64
 from datetime import datetime
-import urllib.parse
-from openai import OpenAI, APIStatusError, APIConnectionError
 import logging
+import time
+import random
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, Future, wait, FIRST_COMPLETED
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from modules import tracing, backends, scratch, llm_cache, clients, image_cache, upscale, provider_health
+from modules.clients import GEMINI_MODEL
+
+def _split_prompts(text):
+    """Geminiの応答を1行1プロンプトとして分割する"""
+    return [line.strip() for line in text.strip().split('\n') if line.strip()]
 
 def _generate_image_prompts(theme, num, settings):
     """Geminiを使用して、画像生成のためのプロンプトを複数作成する"""
     logging.info(f"Geminiで画像プロンプトを{num}件生成します。")
     try:
-        api_key = settings['api_keys']['gemini']
-        genai.configure(api_key=api_key)
-        model = genai.GenerativeModel('models/gemini-1.5-flash')
+        model = clients.gemini_model(settings, GEMINI_MODEL)
         style = settings.get('image', {}).get('style_prompt', 'cinematic')
 
         prompt = f"""You are an expert image prompt engineer.
@@ -28,8 +33,17 @@ Focus on diverse scenes and compositions that capture the essence of the topic.
 Ensure the prompts are highly descriptive and evoke strong visual imagery.
 Output only the prompts, one per line.
 """
-        response = model.generate_content(prompt)
-        prompts = [line.strip() for line in response.text.strip().split('\n') if line.strip()]
+        def call_gemini():
+            with tracing.span("gemini.image_prompts", num=num, prompt_chars=len(prompt)) as sp:
+                response = model.generate_content(prompt)
+                sp["response_chars"] = len(response.text)
+            return response.text
+
+        response_text = llm_cache.generate_text(
+            settings, GEMINI_MODEL, prompt, call_gemini,
+            validate=lambda text: len(_split_prompts(text)) >= num
+        )
+        prompts = _split_prompts(response_text)
         if len(prompts) < num:
             logging.warning(f"Geminiが要求された{num}件ではなく、{len(prompts)}件のプロンプトを返しました。")
         return prompts
@@ -38,8 +52,146 @@ Output only the prompts, one per line.
         traceback.print_exc()
         return []
 
+def _sd_payload(prompt, settings):
+    """1つのプロンプトに対するtxt2imgのリクエスト内容"""
+    image_settings = settings.get('image', {})
+    sd_settings = image_settings.get('stable_diffusion', {})
+    # アップスケールが有効な場合は縮小したサイズで生成する
+    width, height = upscale.render_size(settings)
+    payload = {
+        "prompt": f"{prompt}, {image_settings.get('style_prompt', '')}, {sd_settings.get('quality_keywords', '')}",
+        "steps": sd_settings.get('steps', 30),
+        "width": width,
+        "height": height,
+        "negative_prompt": sd_settings.get('negative_prompt', ''),
+        "seed": sd_settings.get('seed', -1)
+    }
+    # LoRAモデルが設定されていればプロンプトに追加
+    if sd_settings.get('lora_model'):
+        payload["prompt"] += f" <lora:{sd_settings['lora_model']}:{sd_settings.get('lora_weight', 0.8)}>"
+
+    # ベースモデルが設定されていればoverride_settingsに追加
+    if sd_settings.get('model'):
+        payload["override_settings"] = {"sd_model_checkpoint": sd_settings['model']}
+    return payload
+
+def _group_sd_requests(prompts, max_batch_size):
+    """
+    同じ内容のプロンプトをまとめ、batch_sizeで1回のリクエストにできるグループに分ける。
+    (プロンプト, そのプロンプトを使う位置のリスト) のリストを、最初に現れた順で返す。
+    """
+    positions = {}
+    for i, p in enumerate(prompts):
+        positions.setdefault(p, []).append(i)
+    groups = []
+    for p, indexes in positions.items():
+        for start in range(0, len(indexes), max_batch_size):
+            groups.append((p, indexes[start:start + max_batch_size]))
+    return groups
+
+_B64_CHUNK_SIZE = 64 * 1024
+
+def _stream_sd_images(response, out_paths):
+    """
+    txt2imgの応答 ({"images": ["<base64>", ...], ...}) を少しずつ読み、base64をデコードしながら
+    out_paths の順にファイルへ書き出す。応答全体や画像全体をメモリに保持しない。
+    書き出したパスのリストと、受信したバイト数を返す。
+    """
+    written = []
+    received = 0
+    pending = b""       # まだ処理していない受信データ
+    state = "key"       # key -> array -> value -> (string -> value ...) -> done
+    carry = b""         # 4文字に満たずデコードできなかったbase64
+    out = None
+    for chunk in response.iter_content(chunk_size=_B64_CHUNK_SIZE):
+        received += len(chunk)
+        if state == "done":
+            # 残り (parameters, info) は読み捨てて接続を再利用できるようにする
+            continue
+        pending += chunk
+        while pending and state != "done":
+            if state == "key":
+                pos = pending.find(b'"images"')
+                if pos < 0:
+                    pending = pending[-7:]
+                    break
+                pending = pending[pos + 8:]
+                state = "array"
+            elif state == "array":
+                pos = pending.find(b"[")
+                if pos < 0:
+                    pending = b""
+                    break
+                pending = pending[pos + 1:]
+                state = "value"
+            elif state == "value":
+                pending = pending.lstrip(b" \t\r\n,")
+                if not pending:
+                    break
+                if pending[:1] == b"]":
+                    state = "done"
+                elif pending[:1] == b'"':
+                    pending = pending[1:]
+                    index = len(written)
+                    out = open(out_paths[index], "wb") if index < len(out_paths) else None
+                    carry = b""
+                    state = "string"
+                else:
+                    raise ValueError(f"SDの応答を解析できません: {pending[:20]!r}")
+            elif state == "string":
+                end = pending.find(b'"')
+                data = pending if end < 0 else pending[:end]
+                # JSONのエスケープ ("\/") を取り除く（base64の文字にエスケープは不要）
+                data = carry + data.replace(b"\\", b"")
+                usable = len(data) // 4 * 4
+                if out is not None:
+                    out.write(base64.b64decode(data[:usable]))
+                carry = data[usable:]
+                if end < 0:
+                    pending = b""
+                    break
+                pending = pending[end + 1:]
+                if out is not None:
+                    if carry:
+                        out.write(base64.b64decode(carry + b"=" * (-len(carry) % 4)))
+                    out.close()
+                    written.append(out.name)
+                    out = None
+                state = "value"
+    if out is not None:
+        out.close()
+    if state != "done":
+        raise ValueError("SDの応答が途中で終わっています。")
+    return written, received
+
+def _in_daemon_thread(fn, *args, name=None):
+    """
+    fn(*args) をデーモンスレッドで実行し、結果のFutureを返す。
+    取り消された処理の完了を待たずにプロセスを終了できるよう、スレッドプールではなくデーモンスレッドを使う。
+    """
+    future = Future()
+    ctx = contextvars.copy_context()
+
+    def run():
+        try:
+            future.set_result(ctx.run(fn, *args))
+        except BaseException as e:
+            future.set_exception(e)
+
+    threading.Thread(target=run, name=name, daemon=True).start()
+    return future
+
+def _remove_files(paths):
+    for path in paths:
+        if os.path.exists(path):
+            os.remove(path)
+
 def _generate_images_sd(prompts, settings):
-    """Stable Diffusion APIを使用して画像を生成する"""
+    """
+    Stable Diffusion APIを使用して画像を生成する。
+    複数のリクエストを sd.concurrency 件まで並行して送り、同じプロンプトはbatch_sizeでまとめて生成する。
+    返す画像のパスはプロンプトの順に並ぶ（失敗した画像は含まない）。
+    """
     logging.info("Stable Diffusion APIで画像を生成します。")
     sd_settings = settings.get('image', {}).get('stable_diffusion', {})
     api_url = sd_settings.get('url')
@@ -47,41 +199,130 @@ def _generate_images_sd(prompts, settings):
         logging.error("settings.yamlにStable DiffusionのAPI URLが設定されていません。")
         return []
 
-    save_dir = f"input/images/{datetime.now().strftime('%Y%m%d_%H%M%S')}_sd"
-    os.makedirs(save_dir, exist_ok=True)
+    # ジョブの作業領域内に保存する（単体で呼ばれた場合は従来通り input/images に保存）
+    save_dir = scratch.scratch_dir(settings, "images", legacy_dir=f"input/images/{datetime.now().strftime('%Y%m%d_%H%M%S')}_sd")
     logging.info(f"SD画像を保存するディレクトリ: {save_dir}")
 
-    generated_image_paths = []
-    for i, p in enumerate(prompts):
-        logging.info(f"  - SD画像 {i+1}/{len(prompts)} を生成中...")
-        payload = {
-            "prompt": f"{p}, {settings.get('image', {}).get('style_prompt', '')}, {sd_settings.get('quality_keywords', '')}",
-            "steps": sd_settings.get('steps', 30),
-            "width": sd_settings.get('width', 1024),
-            "height": sd_settings.get('height', 1792),
-            "negative_prompt": sd_settings.get('negative_prompt', '')
-        }
-        # LoRAモデルが設定されていればプロンプトに追加
-        if sd_settings.get('lora_model'):
-            payload["prompt"] += f" <lora:{sd_settings['lora_model']}:{sd_settings.get('lora_weight', 0.8)}>"
-        
-        # ベースモデルが設定されていればoverride_settingsに追加
-        if sd_settings.get('model'):
-            payload["override_settings"] = {"sd_model_checkpoint": sd_settings['model']}
+    # 画像ごとのキャッシュキー（同じプロンプトの画像は何枚目かで区別する）
+    keys = []
+    occurrences = {}
+    for p in prompts:
+        keys.append(image_cache.image_key(_sd_payload(p, settings), occurrences.get(p, 0), upscale.describe(settings)))
+        occurrences[p] = occurrences.get(p, 0) + 1
+
+    paths = {}
+    for i, key in enumerate(keys):
+        img_path = os.path.join(save_dir, f"{i+1:04}.png")
+        if image_cache.fetch(settings, key, img_path):
+            paths[i] = img_path
+    if settings.get('image_cache', {}).get('enabled', False):
+        logging.info(f"画像キャッシュ: {len(prompts)}枚中{len(paths)}枚ヒットしました。")
 
+    # キャッシュになかった画像だけを生成する
+    missing = [i for i in range(len(prompts)) if i not in paths]
+    concurrency = max(1, int(sd_settings.get('concurrency', 2)))
+    groups = [
+        (p, [missing[j] for j in indexes])
+        for p, indexes in _group_sd_requests([prompts[i] for i in missing], max(1, int(sd_settings.get('max_batch_size', 4))))
+    ]
+    session = clients.http_session("stable_diffusion", pool_size=concurrency)
+    sd_breaker = provider_health.breaker("stable_diffusion", settings)
+    # ヘッジで別のバックエンドの画像が使われた場合に設定される（以降のリクエストと書き込みを行わない）
+    hedged = settings.get('runtime_cancel') is not None
+    cancel = settings.get('runtime_cancel') or threading.Event()
+    timings = []  # (待ち時間, 1枚あたりの生成時間)
+
+    def render(prompt, indexes, submitted):
+        """1回のリクエストで indexes の位置の画像を生成して保存する"""
+        if cancel.is_set():
+            return
+        # SDサーバーが停止している場合は、リクエストごとにタイムアウトを待たずにすぐ諦める
+        if not sd_breaker.allow():
+            logging.warning(f"  - SDが停止中のため、画像 {', '.join(str(i + 1) for i in indexes)} の生成をスキップします。")
+            return
+        payload = _sd_payload(prompt, settings)
+        if len(indexes) > 1:
+            payload["batch_size"] = len(indexes)
+        queue_wait = time.perf_counter() - submitted
+        logging.info(f"  - SD画像 {', '.join(str(i + 1) for i in indexes)}/{len(prompts)} を生成中...")
         try:
-            r = requests.post(api_url, json=payload, timeout=300)
-            r.raise_for_status()
-            img_data = base64.b64decode(r.json()['images'][0])
-            img_path = os.path.join(save_dir, f"{i+1:04}.png")
-            with open(img_path, "wb") as f: f.write(img_data)
-            generated_image_paths.append(img_path)
+            with tracing.span("sd.txt2img", index=indexes[0], images=len(indexes), width=payload["width"],
+                              height=payload["height"], steps=payload["steps"], queue_wait=round(queue_wait, 3)) as sp:
+                started = time.perf_counter()
+                img_paths = [os.path.join(save_dir, f"{i+1:04}.png") for i in indexes]
+
+                def request():
+                    with session.post(api_url, json=payload, timeout=300, stream=True) as r:
+                        r.raise_for_status()
+                        written, received = _stream_sd_images(r, img_paths)
+                    if cancel.is_set():
+                        _remove_files(written)
+                        return [], received
+                    return written, received
+
+                if hedged:
+                    # 取り消されたら応答を待たずに戻る（実行中のリクエストはデーモンスレッドに残し、
+                    # スレッドプールの終了待ちでプロセスの終了が遅れないようにする）
+                    pending_request = _in_daemon_thread(request, name="sd-request")
+                    while True:
+                        try:
+                            written, sp["bytes"] = pending_request.result(timeout=0.1)
+                            break
+                        except FutureTimeoutError:
+                            if cancel.is_set():
+                                sp["cancelled"] = True
+                                sd_breaker.release()
+                                return
+                else:
+                    written, sp["bytes"] = request()
+                sp["per_image_seconds"] = round((time.perf_counter() - started) / len(indexes), 3)
+            sd_breaker.record_success()
+            timings.append((queue_wait, sp["per_image_seconds"]))
+            if cancel.is_set():
+                # 使われない画像は作業領域に残さない
+                _remove_files(written)
+                return
+            for i, img_path in zip(indexes, written):
+                # ローカルのCPUで動画の解像度まで拡大してから、キャッシュと作業領域に登録する
+                upscale.upscale_image(img_path, settings)
+                paths[i] = img_path
+                scratch.account(settings, img_path)
+                image_cache.store(settings, keys[i], img_path)
+            if len(written) < len(indexes):
+                logging.error(f"SDが要求された{len(indexes)}枚ではなく{len(written)}枚の画像を返しました。")
+        except scratch.ScratchQuotaExceeded:
+            raise
         except Exception as e:
+            if cancel.is_set():
+                # 取り消された後のエラー（削除された作業領域への書き込みなど）はSDの障害として扱わない
+                logging.debug(f"取り消されたSDのリクエストでエラーが発生しました: {e}")
+                sd_breaker.release()
+                return
+            sd_breaker.record_failure()
             logging.error(f"SDでの画像生成中にエラーが発生しました: {e}")
             traceback.print_exc()
-            continue # 1枚失敗しても次へ
-            
-    return generated_image_paths
+            # 1枚失敗しても次へ
+
+    # テーマなどのトレース属性をワーカースレッドに引き継ぐ
+    with ThreadPoolExecutor(max_workers=min(concurrency, len(groups)) or 1, thread_name_prefix="sd") as executor:
+        futures = [
+            executor.submit(contextvars.copy_context().run, render, prompt, indexes, time.perf_counter())
+            for prompt, indexes in groups
+        ]
+        for future in futures:
+            future.result()
+
+    # 同時実行数の調整に使えるよう、SDサーバーの応答時間と順番待ちの時間を記録する
+    if cancel.is_set():
+        logging.info("別のバックエンドの画像が使われたため、SDでの画像生成を中止しました。")
+        return []
+    if timings:
+        logging.info(
+            f"SD画像を{len(paths)}/{len(prompts)}枚用意しました (リクエスト{len(groups)}件, 同時実行数{concurrency}, "
+            f"1枚あたり平均{sum(t[1] for t in timings) / len(timings):.2f}秒, "
+            f"順番待ち最大{max(t[0] for t in timings):.2f}秒)"
+        )
+    return [paths[i] for i in sorted(paths)]
 
 def _search_and_download_images(theme, num, settings):
     # (この関数の内容は変更が少ないため、簡略化のため省略。実際にはloggingを追加するなどの修正が望ましい)
@@ -91,6 +332,78 @@ def _generate_images_dalle(prompts, settings):
     # (この関数の内容は変更が少ないため、簡略化のため省略。実際には引数とsettingsの参照を修正する)
     return [] # 今回の改修ではDALL-Eは一旦対象外とする
 
+def _stock_dir(settings):
+    return settings.get('image', {}).get('stock', {}).get('dir', 'input/images/stock')
+
+def load_manual_images(folder):
+    """フォルダ内の画像ファイルのパスを重複なく名前順で返す。フォルダがない場合は空のリスト"""
+    if not folder or not os.path.exists(folder):
+        return []
+    paths = []
+    for ext in ("png", "jpg", "jpeg", "webp"):
+        paths.extend(glob.glob(os.path.join(folder, f"*.{ext}")))
+    return sorted(dict.fromkeys(paths))
+
+def _select_stock_images(prompts, settings):
+    """ローカルのストック画像からプロンプトの数だけ画像を選ぶ（足りない場合は繰り返して使う）"""
+    stock = load_manual_images(_stock_dir(settings))
+    if not stock:
+        logging.warning(f"ストック画像が見つかりません: {_stock_dir(settings)}")
+        return []
+    logging.info(f"ストック画像から{len(prompts)}枚を選びます。")
+    start = random.randrange(len(stock))
+    return [stock[(start + i) % len(stock)] for i in range(len(prompts))]
+
+def _run_backend(api_name, prompts, settings):
+    """画像のバックエンドを呼び出す。例外はバックエンドの失敗として記録し、空のリストを返す"""
+    try:
+        return backends.get('image', api_name)(prompts, settings) or []
+    except scratch.ScratchQuotaExceeded:
+        raise
+    except Exception as e:
+        provider_health.breaker(api_name, settings).record_failure()
+        logging.error(f"{api_name} での画像生成中にエラーが発生しました: {e}")
+        return []
+
+def _start_backend(api_name, prompts, settings):
+    """
+    バックエンドをバックグラウンドで呼び出し、結果のFutureを返す。
+    ヘッジで使われなかった方は runtime_cancel で取り消され、SDの実行中のリクエストもデーモンスレッドで待つため、
+    その完了を待たずにプロセスを終了できる。
+    """
+    return _in_daemon_thread(_run_backend, api_name, prompts, settings, name=f"image-{api_name}")
+
+def _generate_with_hedge(api_name, hedge_name, prompts, settings, hedge_after):
+    """
+    api_name で画像を生成し、hedge_after 秒以内に終わらなければ hedge_name にも同じ枚数を要求する。
+    先にすべての画像をそろえた方の結果を返す（どちらもそろわなければ枚数が多い方）。
+    使われなかった方の呼び出しは runtime_cancel で取り消し、以降のリクエストと作業領域への書き込みを止める。
+    """
+    cancel = threading.Event()
+    hedge_settings = {**settings, 'runtime_cancel': cancel}
+    primary = _start_backend(api_name, prompts, hedge_settings)
+    try:
+        return primary.result(timeout=hedge_after)
+    except FutureTimeoutError:
+        pass
+    logging.info(f"{api_name} が{hedge_after}秒以内に完了しないため、{hedge_name} にも画像を要求します。")
+    pending = {primary: api_name, _start_backend(hedge_name, prompts, hedge_settings): hedge_name}
+    best = []
+    try:
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                name = pending.pop(future)
+                generated = future.result()
+                if len(generated) >= len(prompts):
+                    logging.info(f"{name} の画像を使用します。")
+                    return generated
+                if len(generated) > len(best):
+                    best = generated
+        return best
+    finally:
+        cancel.set()
+
 def _get_placeholder_image(settings):
     """プレースホルダー画像のパスを返す"""
     try:
@@ -103,20 +416,40 @@ def _get_placeholder_image(settings):
         logging.warning("settings.yamlにプレースホルダー画像のパスが設定されていません。")
         return None
 
-def generate_images(theme, script_text, settings):
-    """テーマと台本に基づき、設定に従って画像を生成する。"""
-    image_settings = settings.get('image', {})
-    
-    # 必要な画像枚数を台本の行数から決定 (最低5枚、最大20枚など上限下限を設けても良い)
+def count_images_for_script(script_text):
+    """必要な画像枚数を台本の行数から決定する (最低5枚、最大20枚など上限下限を設けても良い)"""
     num_images = len([line for line in script_text.split('\n') if line.strip()])
     if num_images == 0:
         logging.warning("台本が空のため、画像枚数をデフォルトの10枚に設定します。")
         num_images = 10
+    return num_images
+
+def generate_image_prompts(theme, script_text, settings):
+    """台本の行数に応じた枚数の画像生成プロンプトを作成する"""
+    return _generate_image_prompts(theme, count_images_for_script(script_text), settings)
+
+def _hedge_backend(api_name, api_priority, enabled_apis, settings):
+    """ヘッジが有効な場合に、api_name の次の優先順位で利用可能なバックエンド名を返す。なければNone"""
+    if not settings.get('image', {}).get('failover', {}).get('hedge_after_seconds'):
+        return None
+    for name in api_priority[api_priority.index(api_name) + 1:]:
+        if enabled_apis.get(name) and name in backends.available('image') and provider_health.is_available(name, settings):
+            return name
+    return None
+
+def generate_images(theme, script_text, settings, prompts=None):
+    """
+    テーマと台本に基づき、設定に従って画像を生成する。
+    promptsが渡された場合はプロンプト生成を省略してそれを使用する。
+    """
+    image_settings = settings.get('image', {})
+    num_images = count_images_for_script(script_text)
 
     logging.info(f"台本に基づき、{num_images}枚の画像を生成します。")
 
     # 画像生成プロンプトを作成
-    prompts = _generate_image_prompts(theme, num_images, settings)
+    if prompts is None:
+        prompts = _generate_image_prompts(theme, num_images, settings)
     if not prompts:
         logging.error("画像プロンプトの生成に失敗したため、画像生成を中止します。")
         # プロンプト生成失敗時はプレースホルダーで埋める
@@ -126,6 +459,7 @@ def generate_images(theme, script_text, settings):
     image_paths = []
     api_priority = image_settings.get('api_priority', [])
     enabled_apis = image_settings.get('enabled_apis', {})
+    hedge_after = image_settings.get('failover', {}).get('hedge_after_seconds')
 
     for api_name in api_priority:
         if len(image_paths) >= num_images: break
@@ -133,9 +467,20 @@ def generate_images(theme, script_text, settings):
         remaining_prompts = prompts[len(image_paths):]
         if not remaining_prompts: break
 
-        if api_name == 'stable_diffusion' and enabled_apis.get('stable_diffusion'):
-            logging.info("優先順位に従い、Stable Diffusion APIを試行します。")
-            generated = _generate_images_sd(remaining_prompts, settings)
+        if not enabled_apis.get(api_name):
+            continue
+
+        if api_name in backends.available('image'):
+            # 停止中のバックエンドは、タイムアウトを待たずに次の候補へ進む
+            if not provider_health.is_available(api_name, settings):
+                logging.warning(f"{api_name} は現在利用できないため、スキップします。")
+                continue
+            logging.info(f"優先順位に従い、{api_name} を試行します。")
+            hedge_name = _hedge_backend(api_name, api_priority, enabled_apis, settings)
+            if hedge_name:
+                generated = _generate_with_hedge(api_name, hedge_name, remaining_prompts, settings, hedge_after)
+            else:
+                generated = _run_backend(api_name, remaining_prompts, settings)
             image_paths.extend(generated)
         
         elif api_name == 'dalle' and enabled_apis.get('dalle'):
@@ -1,6 +1,5 @@
 # modules/input_manager.py
 import argparse
-import feedparser
 import random
 import traceback
 import requests
@@ -43,12 +42,56 @@ def parse_args():
         help="settings.yamlの設定を無視して、YouTubeへの投稿を強制的にスキップします。"
     )
 
+    # バッチ処理の並列数
+    parser.add_argument(
+        "--workers",
+        type=int,
+        help="同時に処理するテーマ数を指定します。2以上で複数テーマを並行して生成します。"
+    )
+    parser.add_argument(
+        "--trace",
+        action="store_true",
+        help="ステージごとの処理時間を記録し、Chromeトレース形式のJSONと集計表を出力します。"
+    )
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="前回の実行で保存したチェックポイントを再利用し、入力が変わっていないステージをスキップします。"
+    )
+
+    parser.add_argument(
+        "--refresh-cache",
+        action="store_true",
+        help="Geminiの応答キャッシュを読まずにAPIを呼び出し、結果でキャッシュを更新します。"
+    )
+
+    parser.add_argument(
+        "--plan",
+        action="store_true",
+        help="APIを呼び出さずに、取得したテーマごとの台本の長さ・音声セグメント数・画像枚数・所要時間の見積もりを表示して終了します。"
+    )
+
+    # 常駐モード
+    queue_group = parser.add_mutually_exclusive_group()
+    queue_group.add_argument(
+        "--enqueue",
+        action="store_true",
+        help="動画を生成せず、テーマをジョブキューに追加して終了します。"
+    )
+    queue_group.add_argument(
+        "--daemon",
+        action="store_true",
+        help="常駐し、ジョブキューに追加されたテーマを順次処理します。"
+    )
+
     return parser.parse_args()
 
 def fetch_news_from_feed(rss_url, keywords=None, categories=None, max_articles=None):
     """
     単一のRSSフィードからニュースを取得し、キーワード/カテゴリでフィルタリングする。
     """
+    import feedparser  # RSS取得時のみ使うため、起動時には読み込まない
+
     news_items = []
     try:
         response = requests.get(rss_url, verify=False)
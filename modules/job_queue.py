@@ -0,0 +1,113 @@
+# modules/job_queue.py
+import os
+import json
+import uuid
+import logging
+import threading
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+def _append_line(path, record):
+    """1レコードを1行のJSONとして追記し、ディスクへの書き込みを待つ"""
+    line = json.dumps(record, ensure_ascii=False) + "\n"
+    with open(path, 'a', encoding='utf-8') as f:
+        f.write(line)
+        f.flush()
+        os.fsync(f.fileno())
+
+def _read_lines(path):
+    """JSONLを読み込む。書き込み途中でクラッシュした末尾の壊れた行は読み飛ばす"""
+    if not os.path.exists(path):
+        return []
+    records = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for lineno, line in enumerate(f, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                records.append(json.loads(line))
+            except ValueError:
+                logger.warning(f"キューの{lineno}行目を解析できないため読み飛ばします: {path}")
+    return records
+
+class JobQueue:
+    """
+    追記専用のJSONLファイルで管理するジョブキュー。
+    jobs.jsonl にジョブを、acks.jsonl に処理結果を追記し、完了の記録がないジョブを未処理として扱う。
+    どちらのファイルも書き込みごとにfsyncするため、クラッシュしても投入済みのジョブや完了記録は失われない。
+    """
+
+    def __init__(self, queue_dir="output/queue", max_attempts=3):
+        self.queue_dir = queue_dir
+        self.jobs_path = os.path.join(queue_dir, "jobs.jsonl")
+        self.acks_path = os.path.join(queue_dir, "acks.jsonl")
+        self.max_attempts = max_attempts
+        self._lock = threading.Lock()
+        os.makedirs(queue_dir, exist_ok=True)
+
+    def enqueue(self, theme, **options):
+        """ジョブを追加し、ジョブIDを返す"""
+        job = {
+            "job_id": uuid.uuid4().hex,
+            "theme": theme,
+            "enqueued_at": datetime.now().isoformat(),
+            **options,
+        }
+        with self._lock:
+            _append_line(self.jobs_path, job)
+        logger.info(f"ジョブを追加しました: {job['job_id']} (テーマ: {theme})")
+        return job["job_id"]
+
+    def ack(self, job_id, status, result=None):
+        """
+        ジョブの処理結果を記録する。
+        statusは "done"（完了）または "failed"（失敗。max_attempts回に達するまで再実行される）。
+        """
+        record = {"job_id": job_id, "status": status, "result": result, "at": datetime.now().isoformat()}
+        with self._lock:
+            _append_line(self.acks_path, record)
+
+    def _state(self):
+        """ジョブIDごとの完了有無と失敗回数を集計する"""
+        done = set()
+        failures = {}
+        for ack in _read_lines(self.acks_path):
+            if ack.get("status") == "done":
+                done.add(ack["job_id"])
+            elif ack.get("status") == "failed":
+                failures[ack["job_id"]] = failures.get(ack["job_id"], 0) + 1
+        return done, failures
+
+    def pending(self, limit=None):
+        """
+        未処理のジョブを投入順に返す。
+        完了済みのジョブと、失敗回数がmax_attemptsに達したジョブは含めない。
+        """
+        with self._lock:
+            jobs = _read_lines(self.jobs_path)
+            done, failures = self._state()
+        result = []
+        for job in jobs:
+            job_id = job.get("job_id")
+            if not job_id or job_id in done or failures.get(job_id, 0) >= self.max_attempts:
+                continue
+            result.append({**job, "attempts": failures.get(job_id, 0)})
+            if limit and len(result) >= limit:
+                break
+        return result
+
+    def stats(self):
+        """キューの件数（全体・完了・打ち切り・未処理）を返す"""
+        with self._lock:
+            jobs = _read_lines(self.jobs_path)
+            done, failures = self._state()
+        job_ids = {job.get("job_id") for job in jobs}
+        gave_up = {job_id for job_id, count in failures.items() if count >= self.max_attempts and job_id not in done}
+        return {
+            "total": len(job_ids),
+            "done": len(job_ids & done),
+            "gave_up": len(job_ids & gave_up),
+            "pending": len(job_ids - done - gave_up),
+        }
@@ -0,0 +1,46 @@
+# modules/llm_cache.py
+import json
+import logging
+
+from modules.cache_store import open_cache, cache_key
+
+logger = logging.getLogger(__name__)
+
+def _open(settings):
+    """設定でキャッシュが有効な場合にキャッシュを開く"""
+    cache_settings = settings.get('llm_cache', {})
+    if not cache_settings.get('enabled', False):
+        return None
+    ttl_hours = cache_settings.get('ttl_hours', 168)
+    max_mb = cache_settings.get('max_mb', 64)
+    return open_cache(
+        cache_settings.get('path', 'output/cache/llm.sqlite'),
+        ttl_seconds=ttl_hours * 3600 if ttl_hours else None,
+        max_bytes=int(max_mb * 1024 * 1024) if max_mb else None,
+    )
+
+def generate_text(settings, model_name, prompt, generate, params=None, validate=None):
+    """
+    Geminiのテキスト生成をキャッシュ経由で行う。
+    キーはモデル名・プロンプト全文・生成パラメータ(params)から計算する。
+    generateはAPIを呼び出して応答テキストを返す関数で、キャッシュにない場合だけ呼ばれる。
+    validateが偽を返した応答（形式不正など）はキャッシュしない。
+    llm_cache.bypass が真の場合はキャッシュを読まずに呼び出し、結果で上書きする。
+    """
+    cache = _open(settings)
+    key = cache_key(model_name, prompt, json.dumps(params or {}, sort_keys=True, ensure_ascii=False))
+    if cache and not settings.get('llm_cache', {}).get('bypass', False):
+        cached = cache.get(key)
+        if cached is not None:
+            logger.info(f"Geminiの応答をキャッシュから再利用します ({model_name})。")
+            return cached.decode('utf-8')
+
+    text = generate()
+    if cache and text and (validate is None or validate(text)):
+        cache.set(key, text.encode('utf-8'))
+    return text
+
+def stats(settings):
+    """キャッシュのヒット数などを返す。キャッシュが無効な場合はNone"""
+    cache = _open(settings)
+    return cache.stats() if cache else None
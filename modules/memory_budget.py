@@ -0,0 +1,192 @@
+# modules/memory_budget.py
+import os
+import sys
+import logging
+import threading
+from contextlib import contextmanager
+
+from modules import tracing, upscale, frame_preprocessor
+
+logger = logging.getLogger(__name__)
+
+MB = 1024 * 1024
+
+# libx264のエンコーダが先読みのために保持するフレーム数の目安
+_ENCODER_FRAMES = 60
+
+def total_memory_bytes():
+    """物理メモリの総量。取得できない場合はNone"""
+    try:
+        return os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES")
+    except (ValueError, OSError, AttributeError):
+        return None
+
+def available_memory_bytes():
+    """現在利用可能なメモリ量 (/proc/meminfo の MemAvailable)。取得できない場合はNone"""
+    try:
+        with open("/proc/meminfo", "r") as f:
+            for line in f:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError):
+        pass
+    return None
+
+def current_rss_bytes():
+    """自プロセスの現在のRSS。/procがない環境ではピークRSSで代用し、どちらも取得できない場合（Windows）はNone"""
+    try:
+        with open("/proc/self/statm", "r") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError, AttributeError):
+        try:
+            import resource
+        except ImportError:
+            return None
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024  # macOSはバイト単位
+
+def _image_size(path, fallback):
+    """画像の幅と高さ（ヘッダのみ読み込む）"""
+    try:
+        from PIL import Image
+        with Image.open(path) as img:
+            return img.size
+    except Exception:
+        return fallback
+
+def estimate_compose_bytes(images, audio_segments_info, settings):
+    """
+    動画合成1件で増えるメモリ使用量を見積もる（ワーカープロセス自体の常駐分は含まない）。
+    画像ごとに元画像・リサイズ後の画像・背景・合成フレームを保持し（前処理済みのフレームは1枚分）、
+    さらにエンコーダの先読みフレームと音声バッファを加える。
+    """
+    video_settings = settings.get('video', {})
+    width, height = video_settings.get('resolution', [1080, 1920])
+    frame_bytes = width * height * 3
+    sd_settings = settings.get('image', {}).get('stable_diffusion', {})
+    # アップスケールが有効な場合、画像は動画の幅まで拡大されている
+    fallback_size = upscale.target_size(settings) or (sd_settings.get('width', 1024), sd_settings.get('height', 1792))
+
+    total = 0
+    for path in dict.fromkeys(images or []):
+        if frame_preprocessor.is_frame(path, (width, height)):
+            # 前処理済みのフレームはそのまま使うため、リサイズや背景との合成の分は増えない
+            total += frame_bytes
+            continue
+        src_w, src_h = _image_size(path, fallback_size)
+        resized_h = int(src_h * width / src_w) if src_w else height
+        total += src_w * src_h * 3 + width * resized_h * 3 + 2 * frame_bytes
+
+    total += _ENCODER_FRAMES * frame_bytes * 3 // 2  # yuv420
+
+    # 音声は44.1kHzステレオのfloat64配列として展開される
+    audio_seconds = sum(seg.get('duration', 0) or 0 for seg in audio_segments_info or [])
+    total += int(audio_seconds * 44100 * 2 * 8)
+    return total
+
+class RssSampler:
+    """処理中のRSSを定期的に計測し、開始時点からの増加量のピークを記録する"""
+
+    def __init__(self, interval=0.2):
+        self.interval = interval
+        self.baseline = 0
+        self.peak = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _sample(self):
+        rss = current_rss_bytes()
+        # RSSを取得できない環境では計測せず、ピークは0のまま（見積もりは補正しない）
+        if rss is not None and self.baseline is not None:
+            self.peak = max(self.peak, rss - self.baseline)
+
+    def _loop(self):
+        while not self._stop.wait(self.interval):
+            self._sample()
+
+    def __enter__(self):
+        self.baseline = current_rss_bytes()
+        self._thread = threading.Thread(target=self._loop, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self._sample()
+
+class MemoryBudget:
+    """
+    動画合成の同時実行をメモリ量で制限する。
+    見積もりの合計が予算を超える場合や、空きメモリが見積もりに満たない場合は、
+    実行中の合成が終わるまで待たせる（実行中の合成がなければ予算超過でも実行する）。
+    実測したRSSと見積もりの比率から、以降の見積もりを補正する。
+    """
+
+    def __init__(self, budget_bytes, reserve_bytes=0, poll_interval=1.0):
+        self.budget_bytes = budget_bytes
+        self.reserve_bytes = reserve_bytes
+        self.poll_interval = poll_interval
+        self.in_use = 0
+        self.running = 0
+        self.correction = 1.0
+        self._cond = threading.Condition()
+
+    @classmethod
+    def from_settings(cls, settings):
+        batch_settings = settings.get('batch', {})
+        budget_mb = batch_settings.get('memory_budget_mb')
+        if budget_mb:
+            budget = int(budget_mb * MB)
+        else:
+            total = total_memory_bytes()
+            budget = int(total * 0.75) if total else None
+        reserve = int(batch_settings.get('memory_reserve_mb', 1024) * MB)
+        return cls(budget, reserve)
+
+    def adjusted(self, estimate):
+        """実測に基づいて補正した見積もり"""
+        return int(estimate * self.correction)
+
+    def _fits(self, need):
+        if self.running == 0:
+            return True
+        if self.budget_bytes is not None and self.in_use + need > self.budget_bytes:
+            return False
+        available = available_memory_bytes()
+        if available is not None and available - self.reserve_bytes < need:
+            return False
+        return True
+
+    @contextmanager
+    def reserve(self, estimate, label=""):
+        """見積もり分のメモリを確保できるまで待ってから、ブロック内の処理を実行する"""
+        need = self.adjusted(estimate)
+        with tracing.span("compose.admission", estimate_mb=need // MB) as sp:
+            with self._cond:
+                waited = False
+                while not self._fits(need):
+                    if not waited:
+                        logger.info(f"メモリ予算を超えるため動画合成を待機します ({label}: 見積もり{need // MB}MB, 使用中{self.in_use // MB}MB)")
+                        waited = True
+                    # 空きメモリは他プロセスの終了でも増えるため、通知がなくても定期的に再確認する
+                    self._cond.wait(self.poll_interval)
+                self.in_use += need
+                self.running += 1
+                sp["waited"] = waited
+        try:
+            yield need
+        finally:
+            with self._cond:
+                self.in_use -= need
+                self.running -= 1
+                self._cond.notify_all()
+
+    def observe(self, estimate, measured):
+        """実測したメモリ増加量で見積もりの補正係数を更新する"""
+        if not estimate or not measured or measured <= 0:
+            return
+        ratio = min(4.0, max(0.5, measured / estimate))
+        with self._cond:
+            self.correction = 0.7 * self.correction + 0.3 * ratio
+        logger.debug(f"動画合成のメモリ実測: {measured // MB}MB (見積もり{estimate // MB}MB, 補正係数{self.correction:.2f})")
@@ -0,0 +1,129 @@
+# modules/pipeline_graph.py
+import queue
+import logging
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, Future, wait, FIRST_COMPLETED
+
+from modules import tracing
+
+logger = logging.getLogger(__name__)
+
+def _run_stage(name, fn, deps):
+    with tracing.span(f"stage.{name}"):
+        return fn(deps)
+
+def _copy_outcome(source, target):
+    """実行中だったステージの結果を、ステージのFutureに反映する"""
+    if target.done():
+        return
+    if source.cancelled():
+        target.cancel()
+    elif source.exception() is not None:
+        target.set_exception(source.exception())
+    else:
+        target.set_result(source.result())
+
+class StageFailed(Exception):
+    """必須ステージが結果を返さなかったことを表す例外"""
+
+    def __init__(self, stage):
+        super().__init__(f"ステージ '{stage}' が失敗しました。")
+        self.stage = stage
+
+class Channel:
+    """
+    ステージ間で値を1つずつ受け渡すためのチャネル。
+    送り手はput()で値を送り、終わったら必ずclose()する。受け手はforで順に受け取る
+    （値が届くまで待ち、close()されると終了する）。
+    """
+
+    _CLOSED = object()
+
+    def __init__(self):
+        self._queue = queue.Queue()
+
+    def put(self, value):
+        self._queue.put(value)
+
+    def close(self):
+        self._queue.put(self._CLOSED)
+
+    def __iter__(self):
+        while True:
+            value = self._queue.get()
+            if value is self._CLOSED:
+                # 複数の受け手がいても全員が終了できるよう、終了の印を戻しておく
+                self._queue.put(value)
+                return
+            yield value
+
+class StageGraph:
+    """
+    1本の動画を構成するステージの依存関係グラフ。
+    依存するステージがすべて完了したステージから順に、スレッドプールで並行して実行する。
+    """
+
+    def __init__(self):
+        self._stages = {}
+        self._futures = {}
+
+    def add(self, name, fn, deps=(), required=True):
+        """
+        ステージを登録する。fnは依存ステージの結果の辞書を受け取り、結果を返す。
+        required=Trueのステージが偽の値を返した場合、グラフ全体を失敗として扱う。
+        """
+        self._stages[name] = {"fn": fn, "deps": tuple(deps), "required": required}
+        self._futures[name] = Future()
+        return self
+
+    def future(self, name):
+        """ステージの完了を待つためのFutureを返す（依存関係に含めずに結果を待ちたい場合に使う）"""
+        return self._futures[name]
+
+    def run(self):
+        """
+        すべてのステージを実行し、ステージ名をキーとする結果の辞書を返す。
+        必須ステージが失敗した場合はStageFailedを、ステージ内の例外はそのまま送出する。
+        """
+        results = {}
+        pending = dict(self._stages)
+        running = {}
+
+        # 全ステージを同時に実行できるだけのスレッドを用意する（ステージ内でfuture()を待っても詰まらないように）
+        executor = ThreadPoolExecutor(max_workers=max(1, len(self._stages)), thread_name_prefix="stage")
+        try:
+            while pending or running:
+                for name, stage in list(pending.items()):
+                    if all(dep in results for dep in stage["deps"]):
+                        deps = {dep: results[dep] for dep in stage["deps"]}
+                        # テーマなどのトレース属性をステージのスレッドに引き継ぐ
+                        ctx = contextvars.copy_context()
+                        running[executor.submit(ctx.run, _run_stage, name, stage["fn"], deps)] = name
+                        del pending[name]
+
+                if not running:
+                    unresolved = ", ".join(pending)
+                    raise RuntimeError(f"依存関係を解決できないステージがあります: {unresolved}")
+
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name = running.pop(future)
+                    stage_future = self._futures[name]
+                    error = future.exception()
+                    if error is not None:
+                        stage_future.set_exception(error)
+                        raise error
+                    value = future.result()
+                    stage_future.set_result(value)
+                    if self._stages[name]["required"] and not value:
+                        raise StageFailed(name)
+                    results[name] = value
+        finally:
+            # 失敗時は未着手のステージを取り消し、実行中のステージの終了を待つ
+            for name in pending:
+                self._futures[name].cancel()
+            for future, name in running.items():
+                future.add_done_callback(lambda f, target=self._futures[name]: _copy_outcome(f, target))
+            executor.shutdown(wait=True, cancel_futures=True)
+
+        return results
@@ -0,0 +1,171 @@
+# modules/planner.py
+import os
+import math
+import logging
+
+from modules.audio_manager import split_script_segments, splits_by_sentence, ssml_request_lengths
+from modules.image_manager import count_images_for_script
+from modules.script_generator import SCRIPT_LENGTH_CHARS
+
+logger = logging.getLogger(__name__)
+
+# 実行履歴がない場合に使う処理時間の目安（秒）
+_DEFAULT_SECONDS = {
+    "gemini.script": 15.0,
+    "gemini.image_prompts": 5.0,
+    "tts.segment": 1.0,
+    "tts.ssml": 5.0,
+    "sd.txt2img": 20.0,
+    "youtube.upload": 30.0,
+}
+# 動画1秒あたりの書き出し時間の目安（秒）
+_DEFAULT_RENDER_SECONDS_PER_VIDEO_SECOND = 2.0
+# 1セグメント（1文）あたりの文字数の目安
+_DEFAULT_CHARS_PER_SEGMENT = 25
+
+def _seconds(rates, name):
+    """1回あたりの処理時間（実績がなければ既定の目安）"""
+    if name in rates:
+        return rates[name]["per_call"]
+    return _DEFAULT_SECONDS[name]
+
+def plan_theme(theme, settings, rates):
+    """
+    1テーマ分の処理内容と所要時間を見積もる（有料APIは呼び出さない）。
+    台本ファイルが指定されている場合はその内容から、そうでなければ台本の長さ設定から見積もる。
+    """
+    script_settings = settings.get('script_generation', {})
+    script_path = settings.get('script', {}).get('path')
+    image_settings = settings.get('image', {})
+    video_settings = settings.get('video', {})
+    engine = settings.get('audio_engine', 'google')
+    posting = settings.get('youtube', {}).get('post_to_youtube', False)
+
+    if script_path and os.path.exists(script_path):
+        with open(script_path, 'r', encoding='utf-8') as f:
+            script_text = f.read()
+        chars = len(script_text)
+        segment_texts = split_script_segments(script_text, splits_by_sentence(settings))
+        segments = len(segment_texts)
+        images = count_images_for_script(script_text)
+        script_source = "file"
+    else:
+        low, high = SCRIPT_LENGTH_CHARS.get(script_settings.get('length', 'short'), SCRIPT_LENGTH_CHARS['short'])
+        chars = min((low + high) // 2, script_settings.get('max_script_length_chars', 1000))
+        chars_per_segment = rates.get("tts.segment", {}).get("units_per_call") or _DEFAULT_CHARS_PER_SEGMENT
+        segments = max(1, math.ceil(chars / chars_per_segment))
+        # SSMLのリクエスト数を数えるための仮の文（日本語の文字はUTF-8で3バイト）
+        segment_texts = ["あ" * math.ceil(chars / segments)] * segments
+        # Geminiの台本は1文1行で出力されるため、画像枚数（台本の行数）は文の数と同じと見なす
+        images = segments
+        script_source = "estimate"
+
+    # 台本と画像プロンプトをまとめて生成する場合、画像プロンプトのためのGemini呼び出しは不要になる
+    combined = script_source != "file" and script_settings.get('combined', False)
+    script_seconds = 0.0 if script_source == "file" else _seconds(rates, "gemini.script")
+    prompts_seconds = 0.0 if combined else _seconds(rates, "gemini.image_prompts")
+    if engine == 'google' and settings.get('google_tts', {}).get('ssml_marks', False):
+        # SSMLでまとめて合成する場合は、入力の上限ごとのリクエスト（チャンク）単位で合成される
+        ssml_lengths = ssml_request_lengths(segment_texts, settings)
+        tts_requests = len(ssml_lengths)
+        ssml_rate = rates.get("tts.ssml", {})
+        if ssml_rate.get("per_unit"):
+            tts_seconds = sum(ssml_lengths) * ssml_rate["per_unit"]
+        else:
+            tts_seconds = tts_requests * _seconds(rates, "tts.ssml")
+        tts_api_calls = tts_requests
+    else:
+        tts_requests = segments
+        tts_rate = rates.get("tts.segment", {})
+        if tts_rate.get("per_unit"):
+            tts_seconds = chars * tts_rate["per_unit"]
+        else:
+            tts_seconds = segments * _seconds(rates, "tts.segment")
+        tts_api_calls = segments * (2 if engine == 'voicevox' else 1)  # VOICEVOXはaudio_queryとsynthesisの2回
+    # 音声は google_tts.concurrency / voicevox.concurrency 件ずつ並行して合成される
+    tts_concurrency = settings.get('voicevox' if engine == 'voicevox' else 'google_tts', {}).get(
+        'concurrency', 2 if engine == 'voicevox' else 4)
+    tts_seconds /= max(1, min(int(tts_concurrency), tts_requests))
+    # 画像は sd.concurrency 件ずつ並行して生成される（実績は同時実行時の1枚あたりの時間）
+    sd_settings = image_settings.get('stable_diffusion', {})
+    sd_per_image = rates.get("sd.txt2img", {}).get("per_unit") or _seconds(rates, "sd.txt2img")
+    sd_seconds = images * sd_per_image / max(1, int(sd_settings.get('concurrency', 2)))
+    video_duration = images * video_settings.get('image_duration', 5.0)
+    render_rate = rates.get("video.write_videofile", {}).get("per_unit") or _DEFAULT_RENDER_SECONDS_PER_VIDEO_SECOND
+    render_seconds = video_duration * render_rate
+    upload_seconds = _seconds(rates, "youtube.upload") if posting else 0.0
+
+    sd_enabled = image_settings.get('enabled_apis', {}).get('stable_diffusion', False)
+    api_calls = {
+        "gemini": (0 if script_source == "file" else 1) + (0 if combined else 1),
+        "tts": tts_api_calls,
+        "stable_diffusion": images if sd_enabled else 0,
+        "youtube": 2 if posting else 0,  # 動画のアップロードとサムネイルの設定
+    }
+
+    # 音声合成と画像生成は並行して実行されるため、長い方がクリティカルパスになる
+    latency = script_seconds + max(tts_seconds, prompts_seconds + sd_seconds) + render_seconds + upload_seconds
+    return {
+        "theme": theme,
+        "script_source": script_source,
+        "script_chars": chars,
+        "tts_segments": segments,
+        "tts_chars": chars if engine == 'google' else 0,
+        "images": images,
+        "video_seconds": video_duration,
+        "render_seconds": render_seconds,
+        "latency_seconds": latency,
+        "api_calls": api_calls,
+    }
+
+def plan_batch(themes, settings, rates):
+    """バッチ全体の処理内容と所要時間を見積もる"""
+    batch_settings = settings.get('batch', {})
+    workers = max(1, int(batch_settings.get('workers', 1)))
+    cpu_count = os.cpu_count() or 1
+    compose_workers = max(1, min(int(batch_settings.get('compose_workers') or cpu_count), cpu_count, workers))
+
+    themes_plan = [plan_theme(theme, settings, rates) for theme in themes]
+    total_calls = {}
+    for p in themes_plan:
+        for api, count in p["api_calls"].items():
+            total_calls[api] = total_calls.get(api, 0) + count
+
+    # テーマの並列数と、エンコードプロセス数のどちらがボトルネックになるかで全体の時間が決まる
+    latencies = [p["latency_seconds"] for p in themes_plan]
+    wall = max(
+        sum(latencies) / workers,
+        sum(p["render_seconds"] for p in themes_plan) / compose_workers,
+        max(latencies, default=0.0),
+    )
+    return {
+        "themes": themes_plan,
+        "workers": workers,
+        "compose_workers": compose_workers,
+        "api_calls": total_calls,
+        "tts_chars": sum(p["tts_chars"] for p in themes_plan),
+        "wall_seconds": wall,
+        "history_spans": len(rates),
+    }
+
+def format_plan(plan):
+    """見積もり結果を表形式の文字列にする"""
+    lines = [
+        f"{'theme':<30} {'chars':>6} {'segs':>5} {'images':>6} {'video(s)':>9} {'render(s)':>10} {'total(s)':>9}",
+    ]
+    for p in plan["themes"]:
+        theme = p["theme"] if len(p["theme"]) <= 28 else p["theme"][:27] + "…"
+        lines.append(
+            f"{theme:<30} {p['script_chars']:>6} {p['tts_segments']:>5} {p['images']:>6} "
+            f"{p['video_seconds']:>9.0f} {p['render_seconds']:>10.0f} {p['latency_seconds']:>9.0f}"
+        )
+    lines.append("")
+    lines.append("API呼び出し回数: " + ", ".join(f"{api}={count}" for api, count in plan["api_calls"].items()))
+    if plan["tts_chars"]:
+        lines.append(f"Google Cloud TTS 合成文字数: {plan['tts_chars']}文字")
+    source = f"過去の実行履歴 ({plan['history_spans']}種類のスパン)" if plan["history_spans"] else "既定の目安（実行履歴なし）"
+    lines.append(
+        f"推定所要時間: {plan['wall_seconds'] / 60:.1f}分 "
+        f"(並列数={plan['workers']}, エンコードプロセス数={plan['compose_workers']}, 処理時間の根拠: {source})"
+    )
+    return "\n".join(lines)
@@ -35,12 +35,15 @@ def log_video(video_file, theme, settings):
         logger.error(f"ログの記録中にエラーが発生しました: {e}", exc_info=True)
 
 def post_to_sns(video_file, thumbnail_file, theme, script_text, settings):
-    """SNSプラットフォーム（現在はYouTube）に動画を投稿する"""
+    """
+    SNSプラットフォーム（現在はYouTube）に動画を投稿する。
+    投稿に成功した場合はTrueを返す。
+    """
     yt_settings = settings.get('youtube', {})
     
     if not yt_settings.get('post_to_youtube', False):
         logger.info("設定でYouTubeへの投稿が無効になっているため、スキップします。")
-        return
+        return False
 
     logger.info("YouTubeへの投稿を開始します...")
 
@@ -58,7 +61,7 @@ def post_to_sns(video_file, thumbnail_file, theme, script_text, settings):
         tags.append(theme)
 
     try:
-        upload_video(
+        return upload_video(
             video_path=video_file,
             thumbnail_path=thumbnail_file,
             title=title,
@@ -69,4 +72,5 @@ def post_to_sns(video_file, thumbnail_file, theme, script_text, settings):
             settings=settings
         )
     except Exception as e:
-        logger.critical(f"YouTubeへのアップロード処理中にエラーが発生しました: {e}", exc_info=True)
\ No newline at end of file
+        logger.critical(f"YouTubeへのアップロード処理中にエラーが発生しました: {e}", exc_info=True)
+        return False
\ No newline at end of file
@@ -0,0 +1,152 @@
+# modules/provider_health.py
+import time
+import logging
+import threading
+import urllib.parse
+
+from modules import clients
+
+logger = logging.getLogger(__name__)
+
+class CircuitBreaker:
+    """
+    バックエンドごとのサーキットブレーカー。
+    連続して failure_threshold 回失敗すると開き (open)、reset_seconds の間は呼び出しを即座に拒否する。
+    その後は1件だけ試行を許可し (half_open)、成功すれば閉じ、失敗すれば再び開く。
+    """
+
+    def __init__(self, name, failure_threshold=3, reset_seconds=60.0, clock=time.monotonic):
+        self.name = name
+        self.failure_threshold = max(1, int(failure_threshold))
+        self.reset_seconds = reset_seconds
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at = None
+        self._trial_running = False
+
+    @property
+    def state(self):
+        with self._lock:
+            return self._state()
+
+    def _state(self):
+        if self._opened_at is None:
+            return "closed"
+        if self._clock() - self._opened_at >= self.reset_seconds:
+            return "half_open"
+        return "open"
+
+    def allow(self):
+        """呼び出してよいかを返す。half_openの間は同時に1件だけ許可する"""
+        with self._lock:
+            state = self._state()
+            if state == "closed":
+                return True
+            if state == "half_open" and not self._trial_running:
+                self._trial_running = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            if self._opened_at is not None:
+                logger.info(f"バックエンド {self.name} が復旧しました。")
+            self._failures = 0
+            self._opened_at = None
+            self._trial_running = False
+
+    def release(self):
+        """結果を記録せずに呼び出しを終える（取り消された場合）。half_openの試行中なら次の試行を許可する"""
+        with self._lock:
+            self._trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            self._trial_running = False
+            if self._opened_at is not None or self._failures >= self.failure_threshold:
+                if self._opened_at is None:
+                    logger.warning(f"バックエンド {self.name} が{self._failures}回連続で失敗したため、{self.reset_seconds}秒間使用を停止します。")
+                self._opened_at = self._clock()
+
+def _failover_settings(settings):
+    return settings.get('image', {}).get('failover', {})
+
+def breaker(name, settings):
+    """バックエンドのサーキットブレーカー（プロセス全体で共有する）"""
+    failover_settings = _failover_settings(settings)
+    return clients.shared(("breaker", name), lambda: CircuitBreaker(
+        name,
+        failover_settings.get('failure_threshold', 3),
+        failover_settings.get('reset_seconds', 60),
+    ))
+
+# --- ヘルスチェック ---
+# 各関数は設定を受け取り、バックエンドが使える状態なら True を返す（短い時間で終わること）
+
+def _probe_stable_diffusion(settings, timeout):
+    api_url = settings.get('image', {}).get('stable_diffusion', {}).get('url')
+    if not api_url:
+        return False
+    # WebUIが起動していれば、モデルの読み込み状況に関わらず応答するエンドポイント
+    ping_url = urllib.parse.urljoin(api_url, "/internal/ping")
+    response = clients.http_session("stable_diffusion").get(ping_url, timeout=timeout)
+    return response.status_code == 200
+
+def _probe_stock(settings, timeout):
+    from modules.image_manager import load_manual_images, _stock_dir
+    return bool(load_manual_images(_stock_dir(settings)))
+
+def _probe_api_key(key_name):
+    def probe(settings, timeout):
+        api_key = settings.get('api_keys', {}).get(key_name)
+        return bool(api_key) and "ここに" not in api_key
+    return probe
+
+_PROBES = {
+    "stable_diffusion": _probe_stable_diffusion,
+    "stock": _probe_stock,
+    "dalle": _probe_api_key("openai"),
+    "google_search": _probe_api_key("google_search"),
+}
+
+# バックエンド名 -> (確認した時刻, 結果)
+_probe_results = {}
+_probe_lock = threading.Lock()
+
+def probe(name, settings, clock=time.monotonic):
+    """
+    バックエンドのヘルスチェックの結果を返す。結果は probe_interval 秒の間使い回し、
+    それを過ぎてから呼ばれた場合に改めて確認する（ヘルスチェックがないバックエンドは常にTrue）。
+    """
+    check = _PROBES.get(name)
+    if check is None:
+        return True
+    failover_settings = _failover_settings(settings)
+    interval = failover_settings.get('probe_interval', 30)
+    with _probe_lock:
+        cached = _probe_results.get(name)
+        if cached and clock() - cached[0] < interval:
+            return cached[1]
+    try:
+        healthy = bool(check(settings, failover_settings.get('probe_timeout', 2.0)))
+    except Exception as e:
+        logger.debug(f"ヘルスチェックに失敗しました ({name}): {e}")
+        healthy = False
+    with _probe_lock:
+        _probe_results[name] = (clock(), healthy)
+    if not healthy:
+        logger.warning(f"バックエンド {name} のヘルスチェックに失敗しました。")
+    return healthy
+
+def is_available(name, settings):
+    """サーキットブレーカーが閉じていて、ヘルスチェックにも成功したバックエンドかどうか"""
+    if breaker(name, settings).state == "open":
+        return False
+    return probe(name, settings)
+
+def reset():
+    """ヘルスチェックの結果を破棄する（ブレーカーは clients.reset() で破棄される）"""
+    with _probe_lock:
+        _probe_results.clear()
@@ -0,0 +1,72 @@
+# modules/run_history.py
+import os
+import json
+import logging
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+# スパン名ごとに、処理量として集計する属性（1文字あたり、動画1秒あたり、画像1枚あたりの時間を求めるため）
+_UNIT_ATTRS = {
+    "tts.segment": "chars",
+    "tts.ssml": "chars",
+    "video.write_videofile": "duration",
+    "sd.txt2img": "images",
+}
+
+def summarize_run(spans):
+    """1回の実行で記録したスパンを、スパン名ごとの回数・合計時間・処理量に集計する"""
+    stats = {}
+    for s in spans:
+        entry = stats.setdefault(s["name"], {"count": 0, "seconds": 0.0, "units": 0.0})
+        entry["count"] += 1
+        entry["seconds"] += s["dur"] / 1_000_000
+        unit_attr = _UNIT_ATTRS.get(s["name"])
+        if unit_attr:
+            entry["units"] += s["args"].get(unit_attr) or 0
+    return stats
+
+def record(spans, path="output/history/runs.jsonl"):
+    """実行結果の集計を履歴ファイルに1行追記する"""
+    stats = summarize_run(spans)
+    if not stats:
+        return
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'a', encoding='utf-8') as f:
+        f.write(json.dumps({"at": datetime.now().isoformat(), "stats": stats}, ensure_ascii=False) + "\n")
+
+def load_rates(path="output/history/runs.jsonl", max_runs=20):
+    """
+    直近 max_runs 回の実行履歴から、スパン名ごとの処理時間の実績を求める。
+
+    Returns:
+        dict: スパン名 -> {"per_call": 1回あたりの秒数, "per_unit": 処理量1あたりの秒数,
+              "units_per_call": 1回あたりの処理量, "samples": 回数}
+    """
+    if not os.path.exists(path):
+        return {}
+    runs = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                runs.append(json.loads(line))
+            except ValueError:
+                continue
+    totals = {}
+    for run in runs[-max_runs:]:
+        for name, entry in run.get("stats", {}).items():
+            total = totals.setdefault(name, {"count": 0, "seconds": 0.0, "units": 0.0})
+            for key in total:
+                total[key] += entry.get(key, 0)
+
+    rates = {}
+    for name, total in totals.items():
+        if not total["count"]:
+            continue
+        rates[name] = {
+            "per_call": total["seconds"] / total["count"],
+            "per_unit": total["seconds"] / total["units"] if total["units"] else None,
+            "units_per_call": total["units"] / total["count"] if total["units"] else None,
+            "samples": total["count"],
+        }
+    return rates
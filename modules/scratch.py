@@ -0,0 +1,162 @@
+# modules/scratch.py
+import os
+import json
+import time
+import uuid
+import shutil
+import logging
+import threading
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+# 実行中のジョブの作業領域 (ディレクトリ -> ScratchSpace)
+_active = {}
+_active_lock = threading.Lock()
+
+OWNER_FILE = ".owner.json"
+
+class ScratchQuotaExceeded(OSError):
+    """作業領域への書き込み量が上限を超えたことを表す例外"""
+
+def _dir_size(path):
+    total = 0
+    for dirpath, _, filenames in os.walk(path):
+        for name in filenames:
+            try:
+                total += os.path.getsize(os.path.join(dirpath, name))
+            except OSError:
+                continue
+    return total
+
+def _pid_alive(pid):
+    """
+    プロセスが存在するかを返す。Windowsでは os.kill(pid, 0) がプロセスを終了させてしまうため確認せず、
+    存在するものとして扱う（作業領域は作成からの経過時間だけで削除する）。
+    """
+    if os.name == 'nt':
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except (PermissionError, OSError):
+        return True
+    return True
+
+class ScratchSpace:
+    """
+    1ジョブ専用の作業ディレクトリ。
+    書き込んだファイルのサイズを記録して上限を超えたら例外を送出し、
+    withブロックを抜けるときに成功・失敗にかかわらずディレクトリごと削除する。
+    """
+
+    def __init__(self, root="temp/jobs", label="job", quota_bytes=None, keep=False):
+        safe_label = "".join(c for c in label if c.isalnum())[:32] or "job"
+        self.path = os.path.join(root, f"{safe_label}_{os.getpid()}_{uuid.uuid4().hex[:8]}")
+        self.quota_bytes = quota_bytes
+        self.keep = keep
+        self.bytes_written = 0
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        os.makedirs(self.path, exist_ok=True)
+        # 異常終了したプロセスの作業領域を掃除できるよう、所有プロセスを記録しておく
+        with open(os.path.join(self.path, OWNER_FILE), 'w', encoding='utf-8') as f:
+            json.dump({"pid": os.getpid(), "created_at": datetime.now().isoformat()}, f)
+        with _active_lock:
+            _active[self.path] = self
+        return self
+
+    def __exit__(self, *exc):
+        with _active_lock:
+            _active.pop(self.path, None)
+        if self.keep:
+            logger.info(f"作業領域を残します: {self.path}")
+        else:
+            shutil.rmtree(self.path, ignore_errors=True)
+        logger.debug(f"作業領域を解放しました: {self.path} (書き込み量: {self.bytes_written / 1024 / 1024:.1f}MB)")
+
+    def subdir(self, name):
+        path = os.path.join(self.path, name)
+        os.makedirs(path, exist_ok=True)
+        return path
+
+    def account(self, path):
+        """書き込んだファイルのサイズを加算し、上限を超えた場合はScratchQuotaExceededを送出する"""
+        try:
+            size = os.path.getsize(path)
+        except OSError:
+            return
+        with self._lock:
+            self.bytes_written += size
+            written = self.bytes_written
+        if self.quota_bytes and written > self.quota_bytes:
+            raise ScratchQuotaExceeded(
+                f"作業領域の書き込み量が上限を超えました ({written / 1024 / 1024:.1f}MB > {self.quota_bytes / 1024 / 1024:.1f}MB): {self.path}"
+            )
+
+    def usage(self):
+        """作業領域が現在ディスク上で使用しているバイト数"""
+        return _dir_size(self.path)
+
+def open_scratch(label, settings):
+    """設定に従ってジョブ用の作業領域を準備する（withで使う）"""
+    scratch_settings = settings.get('scratch', {})
+    quota_mb = scratch_settings.get('quota_mb', 2048)
+    return ScratchSpace(
+        root=scratch_settings.get('root', 'temp/jobs'),
+        label=label,
+        quota_bytes=int(quota_mb * 1024 * 1024) if quota_mb else None,
+        keep=scratch_settings.get('keep', False),
+    )
+
+def scratch_dir(settings, name, legacy_dir="temp"):
+    """
+    実行中のジョブの作業領域内のサブディレクトリを返す。
+    作業領域の外から呼ばれた場合（単体での呼び出しなど）は従来のディレクトリを使う。
+    """
+    root = settings.get('runtime_scratch_dir')
+    path = os.path.join(root, name) if root else legacy_dir
+    os.makedirs(path, exist_ok=True)
+    return path
+
+def account(settings, path):
+    """実行中のジョブの作業領域に書き込んだファイルを記録する（作業領域外なら何もしない）"""
+    root = settings.get('runtime_scratch_dir')
+    if not root:
+        return
+    with _active_lock:
+        space = _active.get(root)
+    if space:
+        space.account(path)
+
+def sweep_orphans(root="temp/jobs", max_age_hours=24):
+    """
+    異常終了したジョブが残した作業領域を削除する。
+    所有プロセスが存在しないもの、または作成から max_age_hours 時間以上経過したものが対象。
+    """
+    if not os.path.isdir(root):
+        return 0
+    cutoff = time.time() - max_age_hours * 3600
+    removed = 0
+    for name in os.listdir(root):
+        path = os.path.join(root, name)
+        if not os.path.isdir(path) or path in _active:
+            continue
+        owner_path = os.path.join(path, OWNER_FILE)
+        try:
+            with open(owner_path, 'r', encoding='utf-8') as f:
+                pid = json.load(f).get("pid")
+            orphaned = pid != os.getpid() and not _pid_alive(pid)
+            stale = os.path.getmtime(owner_path) < cutoff
+        except (OSError, ValueError):
+            # 所有者の記録がないディレクトリは作成途中の可能性があるため、古いものだけを削除する
+            orphaned = False
+            stale = os.path.getmtime(path) < cutoff
+        if orphaned or stale:
+            shutil.rmtree(path, ignore_errors=True)
+            removed += 1
+    if removed:
+        logger.info(f"残っていた作業領域を{removed}件削除しました。")
+    return removed
@@ -1,33 +1,113 @@
 # modules/script_generator.py
 import os
-import google.generativeai as genai
-from google.generativeai import types
 import re
+import json
+import time
 import logging # 追加
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from modules import tracing, llm_cache, clients
+from modules.clients import GEMINI_MODEL
 
 logger = logging.getLogger(__name__) # ロガーを取得
 
-# generate_script 関数の引数に settings を追加
-def generate_script(theme, settings):
+# API呼び出しに失敗した場合に返す台本の接頭辞
+SCRIPT_ERROR_PREFIX = "エラーにより台本を生成できませんでした。"
+
+# 応答から台本部分を取り出すパターン
+_SCRIPT_PATTERN = re.compile(r"【台本】(.*?)【文字数】", re.DOTALL)
+
+_SCRIPT_START = "【台本】"
+_SCRIPT_END = "【文字数】"
+
+# 台本の長さ設定ごとの目安の文字数（プロンプトで指示している範囲）
+SCRIPT_LENGTH_CHARS = {
+    "short": (300, 350),
+    "medium": (450, 525),
+    "long": (600, 700),
+}
+
+def _truncate_script(script_text, max_chars):
+    """max_script_length_chars を超える台本を切り詰める"""
+    if len(script_text) > max_chars:
+        return script_text[:max_chars] + "..."
+    return script_text
+
+class ScriptStreamParser:
     """
-    Gemini APIを使用して、指定されたテーマで「しくじり先生」風の台本を生成します。
-    成功した場合は台本テキストを、失敗した場合はNoneを返します。
+    ストリーミングで届くGeminiの応答から【台本】部分を逐次取り出し、書き終わった文を返す。
+    文の区切りは音声合成で1文ずつに分割する場合と同じ規則 (split_script_segments) で、返した文を順につなぐと
+    応答全体から抽出・切り詰めした台本を分割した結果と一致する。
     """
-    try:
-        api_key = settings['api_keys']['gemini']
-        if not api_key or "ここに" in api_key:
-            raise ValueError("設定ファイルに 'api_keys.gemini' が設定されていません。")
-    except KeyError:
-        raise ValueError("設定ファイルに 'api_keys.gemini' が設定されていません。")
 
-    genai.configure(api_key=api_key)
+    def __init__(self, max_chars):
+        self.max_chars = max_chars
+        self.text = ""
+        self.emitted = 0
+
+    def _segments(self, final):
+        """現時点で確定している文のリスト"""
+        from modules.audio_manager import split_script_segments, sentence_cuts
+        start = self.text.find(_SCRIPT_START)
+        if start < 0:
+            return []
+        body = self.text[start + len(_SCRIPT_START):]
+        end = body.find(_SCRIPT_END)
+        if end >= 0:
+            return split_script_segments(_truncate_script(body[:end].strip(), self.max_chars), by_sentence=True)
+        if final:
+            return []
+        body = body.lstrip()
+        # 終了の見出しが途中まで届いている場合、その部分は本文に含めない
+        for n in range(len(_SCRIPT_END) - 1, 0, -1):
+            if body.endswith(_SCRIPT_END[:n]):
+                body = body[:-n]
+                break
+        if len(body) > self.max_chars:
+            # 最大文字数を超えた時点で台本の内容は確定する
+            return split_script_segments(_truncate_script(body, self.max_chars), by_sentence=True)
+        # 最後に確定した区切り以降はまだ書きかけの文（閉じ括弧や句読点が続く可能性がある）
+        cuts = sentence_cuts(body)
+        return split_script_segments(body[:cuts[-1]], by_sentence=True) if cuts else []
+
+    def feed(self, chunk):
+        """届いた断片を追加し、新たに書き終わった文のリストを返す"""
+        self.text += chunk
+        segments = self._segments(final=False)
+        new = segments[self.emitted:]
+        self.emitted = max(self.emitted, len(segments))
+        return new
+
+    def finish(self):
+        """応答の終わりに、まだ返していない残りの文のリストを返す"""
+        new = self._segments(final=True)[self.emitted:]
+        self.emitted += len(new)
+        return new
+
+# 台本を【台本】形式のテキストで出力させる指示
+_SCRIPT_OUTPUT_FORMAT = """# 出力形式
+以下の形式で台本を作成してください：
+
+【台本】
+（ここに台本本文）
 
+【文字数】○○文字
+
+【構成メモ】
+- フック：（内容）
+- 問題提起：（内容）
+- 本編：（内容）
+- クライマックス：（内容）
+- 締め：（内容）
+"""
+
+def _script_prompt(theme, settings, output_format):
+    """台本生成のプロンプトを組み立てる（出力形式の指示は呼び出し元で指定する）"""
     # settingsからスクリプト生成パラメータを取得
     script_settings = settings.get('script_generation', {})
     length = script_settings.get('length', 'short')
     tone = script_settings.get('tone', 'educational_humorous')
     target_audience = script_settings.get('target_audience', 'general_public')
-    max_script_length_chars = script_settings.get('max_script_length_chars', 1000)
 
     # 長さに応じた文字数目安の調整
     if length == "short":
@@ -43,7 +123,7 @@ def generate_script(theme, settings):
         duration_text = "厳密に60秒になるように、文字数を調整してください。（日本語の場合、60秒のナレーションは約300文字から350文字程度が目安です。）"
         char_guideline = "合計：300-350文字"
 
-    prompt = f"""
+    return f"""
 あなたはプロの放送作家です。
 以下のテーマについて、視聴者が最後まで釘付けになる「しくじり先生」風のショート動画の台本を生成してください。
 動画の長さは{duration_text}
@@ -98,44 +178,207 @@ def generate_script(theme, settings):
 - 締め：30-40文字
 - {char_guideline}
 
-# 出力形式
-以下の形式で台本を作成してください：
+""" + output_format
 
-【台本】
-（ここに台本本文）
+def _check_api_key(settings):
+    """GeminiのAPIキーが設定されていなければValueErrorを送出する"""
+    try:
+        api_key = settings['api_keys']['gemini']
+        if not api_key or "ここに" in api_key:
+            raise ValueError("設定ファイルに 'api_keys.gemini' が設定されていません。")
+    except KeyError:
+        raise ValueError("設定ファイルに 'api_keys.gemini' が設定されていません。")
 
-【文字数】○○文字
+# generate_script 関数の引数に settings を追加
+def generate_script(theme, settings, on_sentence=None):
+    """
+    Gemini APIを使用して、指定されたテーマで「しくじり先生」風の台本を生成します。
+    成功した場合は台本テキストを、失敗した場合はNoneを返します。
+    on_sentenceを渡した場合はストリーミングで応答を受け取り、台本の文が書き終わるたびに
+    その文を渡して呼び出します（キャッシュから再利用した場合は呼び出しません）。
+    """
+    _check_api_key(settings)
 
-【構成メモ】
-- フック：（内容）
-- 問題提起：（内容）
-- 本編：（内容）
-- クライマックス：（内容）
-- 締め：（内容）
-"""
+    # google.generativeaiは読み込みに時間がかかるため、実際に台本を生成するときに読み込む
+    from google.generativeai import types
+
+    max_script_length_chars = settings.get('script_generation', {}).get('max_script_length_chars', 1000)
+    prompt = _script_prompt(theme, settings, _SCRIPT_OUTPUT_FORMAT)
 
     try:
-        model = genai.GenerativeModel('models/gemini-1.5-flash')
-        response = model.generate_content(prompt, request_options={"timeout": 120})
+        model = clients.gemini_model(settings, GEMINI_MODEL)
+
+        def call_gemini():
+            with tracing.span("gemini.script", prompt_chars=len(prompt)) as sp:
+                response = model.generate_content(prompt, request_options={"timeout": 120})
+                sp["response_chars"] = len(response.text)
+            return response.text
+
+        def stream_gemini():
+            parser = ScriptStreamParser(max_script_length_chars)
+            with tracing.span("gemini.script", prompt_chars=len(prompt), stream=True) as sp:
+                started = time.perf_counter()
+                response = model.generate_content(prompt, stream=True, request_options={"timeout": 120})
+                for chunk in response:
+                    for sentence in parser.feed(chunk.text):
+                        sp.setdefault("first_sentence_seconds", round(time.perf_counter() - started, 3))
+                        on_sentence(sentence)
+                for sentence in parser.finish():
+                    on_sentence(sentence)
+                sp["response_chars"] = len(parser.text)
+            return parser.text
+
+        # 同じプロンプトの応答はキャッシュから再利用する（台本を抽出できない応答はキャッシュしない）
+        response_text = llm_cache.generate_text(
+            settings, GEMINI_MODEL, prompt, stream_gemini if on_sentence else call_gemini,
+            validate=lambda text: _SCRIPT_PATTERN.search(text) is not None
+        )
         
         # レスポンスから台本部分のみを抽出
-        match = re.search(r"【台本】(.*?)【文字数】", response.text, re.DOTALL)
+        match = _SCRIPT_PATTERN.search(response_text)
         if match:
             script_text = match.group(1).strip()
             # max_script_length_chars を超える場合は切り詰める
             if len(script_text) > max_script_length_chars:
-                script_text = script_text[:max_script_length_chars] + "..."
+                script_text = _truncate_script(script_text, max_script_length_chars)
                 logger.warning(f"生成された台本が最大文字数({max_script_length_chars})を超えたため、切り詰めました。")
             return script_text
         
         logger.error("生成されたテキストから台本の抽出に失敗しました。")
         # 修正: f-stringの閉じ忘れを修正
-        logger.error(f"---{response.text[:500]}...")
+        logger.error(f"---{response_text[:500]}...")
         return None
 
     except types.BlockedPromptException as e:
         logger.error(f"Gemini APIが不適切なコンテンツを検出しました。テーマを変更してください: {e}", exc_info=True)
-        return f"エラーにより台本を生成できませんでした。テーマ: {theme}"
+        return f"{SCRIPT_ERROR_PREFIX}テーマ: {theme}"
     except Exception as e:
         logger.error(f"Gemini APIの呼び出し中に予期せぬエラーが発生しました: {e}", exc_info=True)
-        return f"エラーにより台本を生成できませんでした。テーマ: {theme}"
+        return f"{SCRIPT_ERROR_PREFIX}テーマ: {theme}"
+
+
+# 台本と画像プロンプトをJSONで出力させる指示
+_COMBINED_OUTPUT_FORMAT = """# 出力形式
+台本を1行1文のナレーションに分け、JSONで出力してください。
+各行には、その行の内容を表す画像生成AI用のプロンプトを添えてください。
+画像プロンプトは英語の簡潔な1文で、スタイルは「{style}」とし、行ごとに異なる構図・場面にしてください。
+"""
+
+# 台本と画像プロンプトをまとめて生成する際の応答のスキーマ
+_COMBINED_RESPONSE_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "lines": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "narration": {"type": "string"},
+                    "image_prompt": {"type": "string"},
+                },
+                "required": ["narration", "image_prompt"],
+            },
+        },
+    },
+    "required": ["lines"],
+}
+
+def _parse_combined_response(text):
+    """JSON形式の応答から (ナレーションの行のリスト, 画像プロンプトのリスト) を取り出す。形式が不正ならNone"""
+    try:
+        lines = json.loads(text)["lines"]
+        # 台本は1行1文として扱うため、ナレーション内の改行は取り除く
+        narrations = [line["narration"].replace("\n", "").strip() for line in lines]
+        prompts = [line["image_prompt"].strip() for line in lines]
+    except (ValueError, KeyError, TypeError, AttributeError):
+        return None
+    if not narrations or not all(narrations) or not all(prompts):
+        return None
+    return narrations, prompts
+
+def generate_script_with_prompts(theme, settings):
+    """
+    台本と、台本の各行に対応する画像プロンプトを1回のGemini呼び出しでまとめて生成する（JSON形式の応答）。
+    (台本テキスト, 画像プロンプトのリスト) を返す。台本は1行1文で、画像プロンプトは行と同じ順に並ぶ。
+    まとめての生成に失敗した場合は通常の台本生成 (generate_script) に切り替え、画像プロンプトはNoneを返す。
+    """
+    _check_api_key(settings)
+
+    max_script_length_chars = settings.get('script_generation', {}).get('max_script_length_chars', 1000)
+    style = settings.get('image', {}).get('style_prompt', 'cinematic')
+    prompt = _script_prompt(theme, settings, _COMBINED_OUTPUT_FORMAT.format(style=style))
+    generation_config = {"response_mime_type": "application/json", "response_schema": _COMBINED_RESPONSE_SCHEMA}
+
+    try:
+        model = clients.gemini_model(settings, GEMINI_MODEL)
+
+        def call_gemini():
+            with tracing.span("gemini.script", prompt_chars=len(prompt), combined=True) as sp:
+                response = model.generate_content(
+                    prompt, generation_config=generation_config, request_options={"timeout": 120}
+                )
+                sp["response_chars"] = len(response.text)
+            return response.text
+
+        response_text = llm_cache.generate_text(
+            settings, GEMINI_MODEL, prompt, call_gemini, params=generation_config,
+            validate=lambda text: _parse_combined_response(text) is not None
+        )
+        parsed = _parse_combined_response(response_text)
+    except Exception as e:
+        logger.error(f"台本と画像プロンプトのまとめての生成中にエラーが発生しました: {e}", exc_info=True)
+        parsed = None
+
+    if parsed is None:
+        logger.warning("台本と画像プロンプトをまとめて生成できなかったため、台本を通常の方法で生成します。")
+        return generate_script(theme, settings), None
+
+    narrations, prompts = parsed
+    script_text = "\n".join(narrations)
+    if len(script_text) > max_script_length_chars:
+        script_text = _truncate_script(script_text, max_script_length_chars)
+        logger.warning(f"生成された台本が最大文字数({max_script_length_chars})を超えたため、切り詰めました。")
+    # 切り詰めで減った行の分の画像プロンプトは使わない
+    prompts = prompts[:len([line for line in script_text.split('\n') if line.strip()])]
+    return script_text, prompts
+
+def _generate_script_result(theme, settings):
+    """
+    台本生成の結果を、例外を送出しない {theme, script, image_prompts, error} の形にする。
+    script_generation.combined が有効な場合は画像プロンプトもまとめて生成する。
+    """
+    image_prompts = None
+    try:
+        if settings.get('script_generation', {}).get('combined', False):
+            script_text, image_prompts = generate_script_with_prompts(theme, settings)
+        else:
+            script_text = generate_script(theme, settings)
+    except Exception as e:
+        return {"theme": theme, "script": None, "image_prompts": None, "error": str(e)}
+    if script_text is None:
+        return {"theme": theme, "script": None, "image_prompts": None, "error": "生成されたテキストから台本を抽出できませんでした。"}
+    if script_text.startswith(SCRIPT_ERROR_PREFIX):
+        return {"theme": theme, "script": None, "image_prompts": None, "error": script_text}
+    return {"theme": theme, "script": script_text, "image_prompts": image_prompts, "error": None}
+
+def generate_scripts(themes, settings):
+    """
+    複数テーマの台本を並行して生成する。
+    同時に発行するリクエスト数は script_generation.concurrency（デフォルト4）で制限する。
+
+    Returns:
+        list: テーマと同じ順序で並んだ {"theme", "script", "image_prompts", "error"} の辞書のリスト。
+              失敗したテーマは script が None で、error に理由が入る（例外は送出しない）。
+              image_prompts は台本と画像プロンプトをまとめて生成した場合のみ入る（それ以外はNone）。
+    """
+    if not themes:
+        return []
+    concurrency = max(1, int(settings.get('script_generation', {}).get('concurrency', 4)))
+    logger.info(f"{len(themes)}件のテーマの台本を並行して生成します (同時実行数: {concurrency})。")
+    with ThreadPoolExecutor(max_workers=min(concurrency, len(themes)), thread_name_prefix="script") as executor:
+        # テーマなどのトレース属性をワーカースレッドに引き継ぐ
+        futures = [
+            executor.submit(contextvars.copy_context().run, _generate_script_result, theme, settings)
+            for theme in themes
+        ]
+        return [future.result() for future in futures]
@@ -41,8 +41,9 @@ def generate_subtitles(theme, audio_segments_info, settings):
                 logger.warning(f"セグメント {i+1} に再生時間またはテキストがありません。スキップします。")
                 continue
 
-            start_time = current_time
-            end_time = current_time + duration
+            # ナレーションを1つにまとめた場合は、連結したときのサンプル位置から求めた開始・終了位置を使う
+            start_time = segment.get('start', current_time)
+            end_time = segment.get('end', start_time + duration)
             
             start_hms = _seconds_to_srt_timestamp(start_time)
             end_hms = _seconds_to_srt_timestamp(end_time)
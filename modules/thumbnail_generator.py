@@ -1,7 +1,6 @@
 import os
 import datetime
 from PIL import Image, ImageDraw, ImageFont
-from moviepy.editor import VideoFileClip
 import traceback
 import logging
 
@@ -52,6 +51,7 @@ def generate_thumbnail(video_file, theme, images, settings):
         frame_time = yt_settings.get('thumbnail_frame_time', 5)
         logger.info(f"動画の{frame_time}秒地点からサムネイル画像を抽出します。")
         try:
+            from moviepy.editor import VideoFileClip
             with VideoFileClip(video_file) as clip:
                 frame = clip.get_frame(frame_time)
                 base_image_pil = Image.fromarray(frame)
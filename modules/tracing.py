@@ -0,0 +1,149 @@
+# modules/tracing.py
+import os
+import json
+import time
+import logging
+import threading
+import contextvars
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+_enabled = False
+_lock = threading.Lock()
+_spans = []
+# テーマなど、スパンに共通して付与する属性（スレッドをまたいで引き継ぐためcontextvarsで保持する）
+_bound_attrs = contextvars.ContextVar("tracing_bound_attrs", default={})
+
+def enable():
+    global _enabled
+    _enabled = True
+
+def disable():
+    global _enabled
+    _enabled = False
+
+def is_enabled():
+    return _enabled
+
+def reset():
+    """記録済みのスパンを破棄する"""
+    with _lock:
+        _spans.clear()
+
+def drain():
+    """記録済みのスパンを取り出して破棄する（ワーカープロセスから親プロセスへ渡す用途）"""
+    with _lock:
+        spans = list(_spans)
+        _spans.clear()
+    return spans
+
+def get_spans():
+    with _lock:
+        return list(_spans)
+
+def add_spans(spans):
+    """別プロセスで記録されたスパンを取り込む"""
+    if not spans:
+        return
+    with _lock:
+        _spans.extend(spans)
+
+@contextmanager
+def bind(**attrs):
+    """このブロック内（およびコンテキストを引き継いだスレッド）で記録するスパンに属性を付与する"""
+    token = _bound_attrs.set({**_bound_attrs.get(), **attrs})
+    try:
+        yield
+    finally:
+        _bound_attrs.reset(token)
+
+@contextmanager
+def span(name, **attrs):
+    """
+    処理時間を計測するスパン。withで返される辞書に値を追加すると、スパンの属性として記録される。
+    トレースが無効な場合は何も記録しない。
+    """
+    args = {**_bound_attrs.get(), **attrs}
+    if not _enabled:
+        yield args
+        return
+    start_wall = time.time()
+    start = time.perf_counter()
+    error = None
+    try:
+        yield args
+    except BaseException as e:
+        error = e
+        raise
+    finally:
+        duration = time.perf_counter() - start
+        if error is not None:
+            args["error"] = f"{type(error).__name__}: {error}"
+        record = {
+            "name": name,
+            "ts": int(start_wall * 1_000_000),
+            "dur": int(duration * 1_000_000),
+            "pid": os.getpid(),
+            "tid": threading.get_ident(),
+            "thread": threading.current_thread().name,
+            "args": args,
+        }
+        with _lock:
+            _spans.append(record)
+
+def to_chrome_trace(spans):
+    """スパンをChromeのtrace event形式 (chrome://tracing, Perfetto) に変換する"""
+    events = []
+    thread_names = {}
+    for s in spans:
+        events.append({
+            "name": s["name"],
+            "cat": s["name"].split(".")[0],
+            "ph": "X",
+            "ts": s["ts"],
+            "dur": s["dur"],
+            "pid": s["pid"],
+            "tid": s["tid"],
+            "args": s["args"],
+        })
+        thread_names[(s["pid"], s["tid"])] = s.get("thread", "")
+    for (pid, tid), thread_name in thread_names.items():
+        events.append({"name": "thread_name", "ph": "M", "pid": pid, "tid": tid, "args": {"name": thread_name}})
+    return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+def summarize(spans):
+    """スパン名ごとの回数・合計・平均・最大時間（秒）を集計する"""
+    summary = {}
+    for s in spans:
+        entry = summary.setdefault(s["name"], {"count": 0, "total": 0.0, "max": 0.0})
+        seconds = s["dur"] / 1_000_000
+        entry["count"] += 1
+        entry["total"] += seconds
+        entry["max"] = max(entry["max"], seconds)
+    for entry in summary.values():
+        entry["mean"] = entry["total"] / entry["count"]
+    return summary
+
+def format_summary(summary):
+    """集計結果を表形式の文字列にする（合計時間の長い順）"""
+    lines = [f"{'span':<32} {'count':>6} {'total(s)':>10} {'mean(s)':>9} {'max(s)':>9}"]
+    for name, e in sorted(summary.items(), key=lambda item: item[1]["total"], reverse=True):
+        lines.append(f"{name:<32} {e['count']:>6} {e['total']:>10.2f} {e['mean']:>9.3f} {e['max']:>9.3f}")
+    return "\n".join(lines)
+
+def export(output_dir, run_name):
+    """
+    記録したスパンを <run_name>_trace.json (Chrome trace) と <run_name>_summary.json に書き出し、
+    集計表を返す。
+    """
+    spans = get_spans()
+    os.makedirs(output_dir, exist_ok=True)
+    trace_path = os.path.join(output_dir, f"{run_name}_trace.json")
+    with open(trace_path, "w", encoding="utf-8") as f:
+        json.dump(to_chrome_trace(spans), f, ensure_ascii=False)
+    summary = summarize(spans)
+    with open(os.path.join(output_dir, f"{run_name}_summary.json"), "w", encoding="utf-8") as f:
+        json.dump(summary, f, ensure_ascii=False, indent=2)
+    logger.info(f"トレースを書き出しました: {trace_path}")
+    return trace_path, format_summary(summary)
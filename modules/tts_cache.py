@@ -0,0 +1,63 @@
+# modules/tts_cache.py
+import json
+import struct
+import logging
+
+from modules.cache_store import open_cache, cache_key
+
+logger = logging.getLogger(__name__)
+
+# 値の先頭に音声の長さ（秒, double）を置き、続けて音声ファイルのバイト列を保存する
+_DURATION = struct.Struct(">d")
+
+def _open(settings):
+    """設定でキャッシュが有効な場合にキャッシュを開く"""
+    cache_settings = settings.get('tts_cache', {})
+    if not cache_settings.get('enabled', False):
+        return None
+    max_mb = cache_settings.get('max_mb', 512)
+    return open_cache(
+        cache_settings.get('path', 'output/cache/tts.sqlite'),
+        max_bytes=int(max_mb * 1024 * 1024) if max_mb else None,
+    )
+
+def segment_key(engine, text, params):
+    """
+    音声セグメントのキャッシュキー。文のテキスト、エンジン、声の設定（話者・声の名前、話速、抑揚、
+    音量、サンプリングレートなど、合成結果に影響するもの）から計算する。
+    """
+    return cache_key(engine, json.dumps(params, sort_keys=True, ensure_ascii=False), text)
+
+def fetch(settings, key, dest_path):
+    """キャッシュにある音声を dest_path に書き出して長さ（秒）を返す。なければNone"""
+    cache = _open(settings)
+    if not cache:
+        return None
+    value = cache.get(key)
+    if value is None:
+        return None
+    duration, = _DURATION.unpack_from(value)
+    try:
+        with open(dest_path, "wb") as f:
+            f.write(value[_DURATION.size:])
+    except OSError as e:
+        # 書き出せない場合は、キャッシュになかったものとして合成し直す
+        logger.debug(f"キャッシュの音声を書き出せませんでした: {dest_path} ({e})")
+        return None
+    return duration
+
+def store(settings, key, path, duration):
+    """合成した音声と長さをキャッシュに保存する（失敗しても音声生成は成功として扱う）"""
+    cache = _open(settings)
+    if not cache:
+        return
+    try:
+        with open(path, "rb") as f:
+            cache.set(key, _DURATION.pack(duration) + f.read())
+    except Exception as e:
+        logger.warning(f"合成した音声をキャッシュに保存できませんでした: {e}")
+
+def stats(settings):
+    """キャッシュのヒット数などを返す。キャッシュが無効な場合はNone"""
+    cache = _open(settings)
+    return cache.stats() if cache else None
@@ -0,0 +1,82 @@
+# modules/upscale.py
+import logging
+
+from modules import tracing
+
+logger = logging.getLogger(__name__)
+
+# SDの生成サイズは8の倍数でなければならない
+_SD_SIZE_STEP = 8
+_SD_MIN_SIZE = 64
+
+def _upscale_settings(settings):
+    """有効な場合にアップスケールの設定を返す。無効ならNone"""
+    upscale_settings = settings.get('image', {}).get('stable_diffusion', {}).get('upscale', {})
+    if not upscale_settings.get('enabled', False):
+        return None
+    return upscale_settings
+
+def _round_size(value):
+    return max(_SD_MIN_SIZE, int(value) // _SD_SIZE_STEP * _SD_SIZE_STEP)
+
+def render_size(settings):
+    """
+    SDに要求する生成サイズ (幅, 高さ)。
+    アップスケールが有効な場合は、設定のサイズに render_scale を掛けて8の倍数に切り下げたサイズにする。
+    """
+    sd_settings = settings.get('image', {}).get('stable_diffusion', {})
+    width, height = sd_settings.get('width', 1024), sd_settings.get('height', 1792)
+    upscale_settings = _upscale_settings(settings)
+    if not upscale_settings:
+        return width, height
+    scale = float(upscale_settings.get('render_scale', 0.5))
+    return _round_size(width * scale), _round_size(height * scale)
+
+def target_size(settings):
+    """
+    アップスケール後のサイズ (幅, 高さ)。幅は動画の解像度の幅に合わせ、縦横比はSDの設定のサイズに合わせる。
+    アップスケールが無効な場合はNone
+    """
+    if not _upscale_settings(settings):
+        return None
+    sd_settings = settings.get('image', {}).get('stable_diffusion', {})
+    width = settings.get('video', {}).get('resolution', [1080, 1920])[0]
+    height = round(width * sd_settings.get('height', 1792) / sd_settings.get('width', 1024))
+    return width, height
+
+def describe(settings):
+    """画像の内容に影響するアップスケールの設定（キャッシュキーに含める）。無効な場合はNone"""
+    upscale_settings = _upscale_settings(settings)
+    if not upscale_settings:
+        return None
+    return {
+        "size": list(target_size(settings)),
+        "sharpen": [
+            upscale_settings.get('sharpen_radius', 1.5),
+            upscale_settings.get('sharpen_percent', 80),
+            upscale_settings.get('sharpen_threshold', 2),
+        ],
+    }
+
+def upscale_image(path, settings):
+    """
+    低解像度で生成した画像をLanczosで拡大し、アンシャープマスクで輪郭を補って同じパスに上書きする。
+    アップスケールが無効な場合や、すでに目標のサイズ以上の場合は何もしない。
+    """
+    spec = describe(settings)
+    if not spec:
+        return path
+    from PIL import Image, ImageFilter
+    width, height = spec["size"]
+    radius, percent, threshold = spec["sharpen"]
+    with tracing.span("image.upscale", width=width, height=height) as sp:
+        with Image.open(path) as img:
+            sp["source_width"], sp["source_height"] = img.size
+            if img.width >= width:
+                return path
+            upscaled = img.convert("RGB").resize((width, height), Image.LANCZOS)
+        if percent:
+            upscaled = upscaled.filter(ImageFilter.UnsharpMask(radius=radius, percent=int(percent), threshold=int(threshold)))
+        # JPEGなどではなくPNGのまま保存する（動画のエンコードまで画質を落とさない）
+        upscaled.save(path, format="PNG", compress_level=1)
+    return path
@@ -1,10 +1,12 @@
 import os
+import uuid
 import datetime
 from moviepy.editor import *
 from moviepy.video.tools.subtitles import SubtitlesClip
 from moviepy.audio.fx import all as afx
 import traceback
 import logging
+from modules import tracing, scratch, frame_preprocessor
 
 logger = logging.getLogger(__name__)
 
@@ -28,6 +30,9 @@ def compose_video(theme, images, audio_segments_info, bgm_path, subtitle_file, s
 
     # リソース解放のためのリスト
     clips_to_close = []
+    image_clips = []
+    # すべての画像が前処理済みのフレームなら、背景との合成をせずにそのまま連結できる
+    all_frames = True
 
     try:
         # --- 1. 画像クリップを作成 ---
@@ -42,6 +47,13 @@ def compose_video(theme, images, audio_segments_info, bgm_path, subtitle_file, s
                 else:
                     continue # プレースホルダーもなければスキップ
             try:
+                if frame_preprocessor.is_frame(img_path, resolution):
+                    # 前処理で解像度に合わせて黒背景に配置済みのフレームはそのまま使う
+                    clip = ImageClip(img_path).set_duration(image_duration)
+                    clips_to_close.append(clip)
+                    image_clips.append(clip)
+                    continue
+                all_frames = False
                 clip = ImageClip(img_path).set_duration(image_duration)
                 # アスペクト比を保ったままリサイズし、黒背景の中央に配置
                 clip_resized = clip.resize(width=resolution[0])
@@ -59,21 +71,32 @@ def compose_video(theme, images, audio_segments_info, bgm_path, subtitle_file, s
             logging.error("有効な画像クリップが1枚も作成できませんでした。")
             return None
         
-        video_clip = concatenate_videoclips(image_clips, method="compose")
+        video_clip = concatenate_videoclips(image_clips, method="chain" if all_frames else "compose")
         video_duration = video_clip.duration
         clips_to_close.append(video_clip)
 
         # --- 2. 音声クリップを作成 ---
         logging.info("音声セグメントを結合し、長さを調整中...")
         valid_audio_clips = []
-        for seg in audio_segments_info:
-            if seg.get("path") and os.path.exists(seg["path"]):
-                try:
-                    audio_clip = AudioFileClip(seg["path"])
-                    valid_audio_clips.append(audio_clip)
-                    clips_to_close.append(audio_clip)
-                except Exception as e:
-                    logging.warning(f"音声ファイル ({seg['path']}) の読み込みエラー: {e}")
+        # 音声が1つのナレーションにまとめられている場合は、そのファイルだけを開く（ffmpegの読み込みプロセスが1つで済む）
+        narration_paths = {seg.get("narration_path") for seg in audio_segments_info}
+        narration_path = narration_paths.pop() if len(narration_paths) == 1 else None
+        if narration_path and os.path.exists(narration_path):
+            try:
+                audio_clip = AudioFileClip(narration_path)
+                valid_audio_clips.append(audio_clip)
+                clips_to_close.append(audio_clip)
+            except Exception as e:
+                logging.warning(f"ナレーション ({narration_path}) の読み込みエラー: {e}")
+        if not valid_audio_clips:
+            for seg in audio_segments_info:
+                if seg.get("path") and os.path.exists(seg["path"]):
+                    try:
+                        audio_clip = AudioFileClip(seg["path"])
+                        valid_audio_clips.append(audio_clip)
+                        clips_to_close.append(audio_clip)
+                    except Exception as e:
+                        logging.warning(f"音声ファイル ({seg['path']}) の読み込みエラー: {e}")
 
         if not valid_audio_clips:
             logging.error("有効な音声クリップがありません。")
@@ -143,8 +166,13 @@ def compose_video(theme, images, audio_segments_info, bgm_path, subtitle_file, s
         safe_theme = "".join(c for c in theme if c.isalnum())[:50]
         output_path = os.path.join(output_dir, f"{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}_{safe_theme}.mp4")
 
+        # 同時に複数の動画を書き出しても衝突しないよう、一時音声ファイルはジョブの作業領域に置く
+        temp_audiofile = os.path.join(scratch.scratch_dir(settings, "compose"), f"temp-audio_{uuid.uuid4().hex[:8]}.m4a")
+
         logging.info(f"動画ファイルに書き出し中: {output_path}")
-        final_clip.write_videofile(output_path, codec="libx264", audio_codec="aac", temp_audiofile='temp-audio.m4a', remove_temp=True, verbose=False, logger=None)
+        with tracing.span("video.write_videofile", theme=theme, images=len(image_clips), duration=video_duration, fps=output_fps) as sp:
+            final_clip.write_videofile(output_path, codec="libx264", audio_codec="aac", temp_audiofile=temp_audiofile, remove_temp=True, verbose=False, logger=None)
+            sp["bytes"] = os.path.getsize(output_path) if os.path.exists(output_path) else 0
         
         logging.info(f"動画生成完了: {output_path}")
         return output_path
@@ -1,11 +1,8 @@
 import os
 import pickle
 import webbrowser
-from google_auth_oauthlib.flow import InstalledAppFlow
-from google.auth.transport.requests import Request
-from googleapiclient.discovery import build
-from googleapiclient.http import MediaFileUpload
 import traceback
+from modules import tracing, clients
 
 # This scope allows for full access to the user's YouTube account.
 YOUTUBE_UPLOAD_SCOPE = ["https://www.googleapis.com/auth/youtube.upload"]
@@ -15,6 +12,9 @@ def get_credentials(token_path, client_secret_path):
     Handles OAuth 2.0 authentication.
     Loads existing credentials or initiates the OAuth 2.0 flow.
     """
+    from google_auth_oauthlib.flow import InstalledAppFlow
+    from google.auth.transport.requests import Request
+
     creds = None
     if os.path.exists(token_path):
         with open(token_path, 'rb') as token:
@@ -37,49 +37,30 @@ def get_credentials(token_path, client_secret_path):
     
     return creds
 
-# upload_video 関数の引数を変更し、settingsから情報を取得するようにする
-def upload_video(video_path, theme, script_text, settings):
+def upload_video(video_path, title, description, tags, category_id, privacy_status, settings, thumbnail_path=None):
     """
     Uploads a video to YouTube using settings from config/settings.yaml.
+    thumbnail_path may be a path or a callable returning a path; a callable is
+    resolved only after the video upload finishes, so the thumbnail can be
+    rendered while the upload is in progress.
     """
-    youtube_settings = settings.get('youtube', {})
-    
-    # settingsからタイトル、説明、タグ、カテゴリ、プライバシー設定を取得
-    title_prefix = youtube_settings.get('default_title_prefix', '')
-    description_suffix = youtube_settings.get('default_description_suffix', '')
-    default_tags = youtube_settings.get('default_tags', [])
-    category_id = youtube_settings.get('category_id', '28') # Default to Science & Technology
-    privacy_status = youtube_settings.get('privacy_status', 'private')
-
-    # タイトルと説明文を生成 (themeとscript_textを使用)
-    # ここでより高度なタイトル/説明文生成ロジックを実装可能
-    video_title = f"{title_prefix}{theme}"
-    video_description = f"{script_text}\n\n{description_suffix}"
-    video_tags = default_tags # 必要に応じてthemeやscript_textからタグを生成することも可能
-
-    # token_pathとclient_secret_pathはsettings.yamlに直接記述しない方が良いが、
-    # 現状のコードに合わせて一時的にここに記述。将来的には環境変数などから取得すべき。
-    # または、settings.yamlにパスを記述し、それを読み込む。
-    # 今回は、settings.yamlにパスを記述する前提で修正。
-    token_path = "youtube_token.json" # 固定値またはsettingsから取得
-    client_secret_path = "client_secret.json" # 固定値またはsettingsから取得
-
     if not os.path.exists(video_path):
         print(f"エラー: アップロードする動画ファイルが見つかりません: {video_path}")
         return False
 
-    credentials = get_credentials(token_path, client_secret_path)
-    if not credentials:
+    # 認証情報とサービスは共有のものを使う（token_pathとclient_secret_pathはsettings.yamlから取得）
+    youtube = clients.youtube_service(settings)
+    if not youtube:
         print("エラー: YouTubeの認証に失敗しました。")
         return False
 
-    youtube = build("youtube", "v3", credentials=credentials)
+    from googleapiclient.http import MediaFileUpload
 
     body = {
         "snippet": {
-            "title": video_title,
-            "description": video_description,
-            "tags": video_tags,
+            "title": title,
+            "description": description,
+            "tags": tags,
             "categoryId": category_id
         },
         "status": {
@@ -99,13 +80,16 @@ def upload_video(video_path, theme, script_text, settings):
         )
         
         response = None
-        while response is None:
-            status, response = request.next_chunk()
-            if status:
-                print(f"  - アップロード進捗: {int(status.progress() * 100)}%")
+        with tracing.span("youtube.upload", bytes=os.path.getsize(video_path)):
+            while response is None:
+                status, response = request.next_chunk()
+                if status:
+                    print(f"  - アップロード進捗: {int(status.progress() * 100)}%")
         
         print(f"アップロード完了！ 動画ID: {response.get('id')}")
         print(f"動画リンク: https://www.youtube.com/watch?v={response.get('id')}")
+
+        _set_thumbnail(youtube, response.get('id'), thumbnail_path)
         return True
 
     except Exception as e:
@@ -113,6 +97,23 @@ def upload_video(video_path, theme, script_text, settings):
         traceback.print_exc()
         return False
 
+def _set_thumbnail(youtube, video_id, thumbnail_path):
+    """アップロード済みの動画にサムネイルを設定する。失敗しても動画の投稿は成功扱いとする"""
+    if callable(thumbnail_path):
+        try:
+            thumbnail_path = thumbnail_path()
+        except Exception as e:
+            print(f"警告: サムネイルの生成を待機中にエラーが発生しました: {e}")
+            return
+    if not thumbnail_path or not os.path.exists(thumbnail_path):
+        return
+    from googleapiclient.http import MediaFileUpload
+    try:
+        youtube.thumbnails().set(videoId=video_id, media_body=MediaFileUpload(thumbnail_path)).execute()
+        print(f"  - サムネイルを設定しました: {thumbnail_path}")
+    except Exception as e:
+        print(f"警告: サムネイルの設定に失敗しました: {e}")
+
 # post_to_sns 関数は make_short.py から呼び出されるため、
 # ここでは upload_video を呼び出すように修正する。
 # make_short.py 側で post_to_sns の引数を調整する必要がある。
@@ -123,7 +124,15 @@ def post_to_sns(video_file, title, description, hashtags, args, settings):
     if args.post_to_youtube:
         print("  - YouTubeに投稿します。")
         # upload_video に必要な引数を渡す
-        return upload_video(video_file, title, description, settings)
+        return upload_video(
+            video_path=video_file,
+            title=title,
+            description=description,
+            tags=hashtags,
+            category_id=settings.get('youtube', {}).get('category_id', '28'),
+            privacy_status=settings.get('youtube', {}).get('privacy_status', 'private'),
+            settings=settings
+        )
     else:
         print("  - YouTubeへの投稿はスキップされました。")
         return False
\ No newline at end of file
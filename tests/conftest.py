@@ -0,0 +1,12 @@
+import pytest
+
+from modules import clients, provider_health
+
+@pytest.fixture(autouse=True)
+def reset_clients():
+    """テストごとに共有のAPIクライアントとヘルスチェックの結果を破棄する（モックしたクライアントが次のテストに残らないように）"""
+    clients.reset()
+    provider_health.reset()
+    yield
+    clients.reset()
+    provider_health.reset()
@@ -0,0 +1,84 @@
+import os
+import pytest
+from unittest.mock import MagicMock
+
+from modules.artifact_store import ArtifactStore, Checkpointer, make_key, text_digest
+
+@pytest.fixture
+def store(tmp_path):
+    return ArtifactStore(str(tmp_path / "artifacts"))
+
+def test_make_key_depends_on_inputs():
+    """入力が同じなら同じキー、設定が変われば別のキーになることをテスト"""
+    key1 = make_key("voice", {"script": "abc", "engine_settings": {"speaking_rate": 1.0}})
+    key2 = make_key("voice", {"engine_settings": {"speaking_rate": 1.0}, "script": "abc"})
+    key3 = make_key("voice", {"script": "abc", "engine_settings": {"speaking_rate": 1.2}})
+    assert key1 == key2
+    assert key1 != key3
+
+def test_save_copies_files_and_rewrites_paths(store, tmp_path):
+    """成果物ファイルがストアにコピーされ、値のパスが書き換えられることをテスト"""
+    src = tmp_path / "voice_1.wav"
+    src.write_bytes(b"RIFF")
+    value = [{"path": str(src), "duration": 1.5, "text": "テスト"}]
+
+    stored = store.save("k1", "voice", value, copy_files=[str(src)])
+    os.remove(src)  # 元ファイルが消えても復元できる
+
+    loaded = store.load("k1")
+    assert loaded == stored
+    assert loaded[0]["path"] != str(src)
+    assert os.path.exists(loaded[0]["path"])
+    assert loaded[0]["duration"] == 1.5
+
+def test_load_invalidates_missing_ref_files(store, tmp_path):
+    """参照ファイルが消えたチェックポイントは無効になることをテスト"""
+    video = tmp_path / "video.mp4"
+    video.write_bytes(b"data")
+    store.save("k2", "video", str(video), ref_files=[str(video)])
+    assert store.load("k2") == str(video)
+
+    os.remove(video)
+    assert store.load("k2") is None
+
+def test_checkpointer_resume_skips_unchanged_stage(store):
+    """resume時、入力が同じステージは再実行されないことをテスト"""
+    produce = MagicMock(return_value="台本")
+    Checkpointer(store, "テーマ").run("script", {"tone": "casual"}, produce)
+
+    resumed = Checkpointer(store, "テーマ", resume=True)
+    assert resumed.run("script", {"tone": "casual"}, produce) == "台本"
+    assert produce.call_count == 1
+
+    # 設定が変わったステージは再実行される
+    resumed.run("script", {"tone": "formal"}, produce)
+    assert produce.call_count == 2
+
+def test_checkpointer_without_resume_always_runs(store):
+    """resumeしない場合は毎回ステージを実行することをテスト"""
+    produce = MagicMock(return_value="台本")
+    Checkpointer(store, "テーマ").run("script", {}, produce)
+    Checkpointer(store, "テーマ").run("script", {}, produce)
+    assert produce.call_count == 2
+
+def test_checkpointer_skips_uncacheable_values(store):
+    """cacheableがFalseを返した成果物は保存されないことをテスト"""
+    produce = MagicMock(return_value=["placeholder.png"])
+    Checkpointer(store, "テーマ").run("images", {}, produce, cacheable=lambda paths: False)
+    Checkpointer(store, "テーマ", resume=True).run("images", {}, produce, cacheable=lambda paths: False)
+    assert produce.call_count == 2
+
+def test_upload_marker_is_recorded_in_manifest(store):
+    """投稿済みの記録がマニフェストに残り、再開時に参照できることをテスト"""
+    Checkpointer(store, "テーマ").mark_done("upload", "videokey")
+    resumed = Checkpointer(store, "テーマ", resume=True)
+    assert resumed.is_done("upload", "videokey")
+    assert not resumed.is_done("upload", "otherkey")
+
+def test_downstream_stage_is_not_reused_for_a_different_script(store):
+    """台本の内容をキーにした下流のステージは、代替台本で作った成果物を成功した台本で再利用しないことをテスト"""
+    produce_voice = MagicMock(return_value=[{"text": "音声"}])
+    Checkpointer(store, "テーマ").run("voice", {"script": text_digest("エラー: 台本を生成できませんでした")}, produce_voice)
+    resumed = Checkpointer(store, "テーマ", resume=True)
+    resumed.run("voice", {"script": text_digest("成功した台本")}, produce_voice)
+    assert produce_voice.call_count == 2
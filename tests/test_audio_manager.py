@@ -1,8 +1,9 @@
 import pytest
 from unittest.mock import patch, MagicMock, mock_open
 import os
+import time
 
-from modules.audio_manager import generate_voice
+from modules.audio_manager import generate_voice, split_script_segments, sentence_cuts
 
 # settingsのモック
 @pytest.fixture
@@ -83,3 +84,191 @@ def test_generate_voice_synthesis_error(mock_isfile, mock_exists, mock_file_open
     assert audio_segments_info[0]['path'] is None
     assert audio_segments_info[0]['duration'] == 0
     assert "テスト" in audio_segments_info[0]['text']
+
+def test_voicevox_segments_are_synthesized_concurrently_in_order(tmp_path):
+    """VOICEVOXの文ごとの合成が並行して行われ、結果が台本の文の順に並ぶことをテスト"""
+    from benchmarks.fake_services import FakeVoicevox
+    with FakeVoicevox(latency=0.2, seconds_per_char=0.01) as vv:
+        settings = {
+            "runtime_scratch_dir": str(tmp_path),
+            "audio_engine": "voicevox",
+            "script_generation": {"stream": True},  # 1文ずつに分割する
+            "voicevox": {"api_url": vv.url, "speaker_id": 1, "concurrency": 4},
+        }
+        texts = ["一文目です。", "二文目。", "三文目の文です。", "四。"]
+        start = time.perf_counter()
+        segments = generate_voice("".join(texts), settings)
+        elapsed = time.perf_counter() - start
+    assert [seg["text"] for seg in segments] == texts
+    assert all(os.path.exists(seg["path"]) and seg["duration"] > 0 for seg in segments)
+    # 直列なら 4文 x 2リクエスト x 0.2秒 = 1.6秒かかる
+    assert elapsed < 1.2
+
+def test_failed_segment_cancels_remaining_segments(tmp_path):
+    """1つの文の合成に失敗したら、残りの文を合成せずにNoneを返し、合成済みのファイルを削除することをテスト"""
+    from modules.audio_manager import _synthesize_segments
+    started = []
+
+    def synthesize(i, text):
+        started.append(i)
+        if i == 1:
+            return None
+        path = tmp_path / f"{i}.wav"
+        path.write_bytes(b"wav")
+        time.sleep(0.05)
+        return {"path": str(path), "duration": 1.0, "text": text}
+
+    assert _synthesize_segments([f"文{i}" for i in range(20)], synthesize, concurrency=2) is None
+    assert len(started) < 20
+    assert list(tmp_path.iterdir()) == []
+
+def test_cached_segments_skip_the_engine(tmp_path):
+    """同じ文と声の設定の音声はキャッシュから再利用し、VOICEVOXを呼び出さないことをテスト"""
+    from benchmarks.fake_services import FakeVoicevox
+    from modules import cache_store
+    with FakeVoicevox(seconds_per_char=0.01) as vv:
+        settings = {
+            "runtime_scratch_dir": str(tmp_path),
+            "audio_engine": "voicevox",
+            "script_generation": {"stream": True},  # 1文ずつに分割する
+            "voicevox": {"api_url": vv.url, "speaker_id": 1},
+            "tts_cache": {"enabled": True, "path": str(tmp_path / "tts.sqlite")},
+        }
+        first = generate_voice("こんにちは。今日の話題です。", settings)
+        assert vv.request_count == 4
+        second = generate_voice("こんにちは。明日の話題です。", settings)
+        # 変わった文だけが合成される
+        assert vv.request_count == 6
+        # 話速が変われば別のエントリになる
+        settings["voicevox"]["speed_scale"] = 1.2
+        generate_voice("こんにちは。", settings)
+        assert vv.request_count == 8
+    cache_store.close_all()
+    assert second[0]["duration"] == first[0]["duration"]
+    assert second[0]["path"] != first[0]["path"]
+    with open(first[0]["path"], "rb") as a, open(second[0]["path"], "rb") as b:
+        assert a.read() == b.read()
+
+def test_segments_are_assembled_into_one_narration(tmp_path, monkeypatch):
+    """narration.single_trackが有効な場合、文ごとの音声を1つのWAVに連結し、各文の開始・終了位置を返すことをテスト"""
+    import wave
+    from benchmarks.fake_services import FakeVoicevox
+    from modules.subtitle_generator import generate_subtitles
+    with FakeVoicevox(seconds_per_char=0.01) as vv:
+        settings = {
+            "runtime_scratch_dir": str(tmp_path),
+            "audio_engine": "voicevox",
+            "script_generation": {"stream": True},  # 1文ずつに分割する
+            "voicevox": {"api_url": vv.url, "speaker_id": 1},
+            "narration": {"single_track": True},
+        }
+        segments = generate_voice("一文目です。二文目の文です。", settings)
+    narration_path = segments[0]["narration_path"]
+    assert all(seg["narration_path"] == narration_path for seg in segments)
+    assert segments[0]["start"] == 0.0
+    assert segments[1]["start"] == segments[0]["end"]
+    assert segments[0]["end"] == pytest.approx(segments[0]["duration"], abs=1e-3)
+    with wave.open(narration_path, "rb") as w:
+        assert w.getnframes() / w.getframerate() == pytest.approx(segments[-1]["end"])
+
+    monkeypatch.chdir(tmp_path)
+    with open(generate_subtitles("テスト", segments, settings), encoding="utf-8") as f:
+        srt = f.read()
+    assert "00:00:00,000 --> " in srt
+
+def test_narration_is_not_assembled_from_mixed_formats(tmp_path):
+    """PCMのWAVでない音声が含まれる場合は連結せず、セグメント情報をそのまま返すことをテスト"""
+    from benchmarks.fake_services import make_wav
+    from modules.audio_manager import assemble_narration
+    wav = tmp_path / "a.wav"
+    wav.write_bytes(make_wav(0.5))
+    mp3 = tmp_path / "b.mp3"
+    mp3.write_bytes(b"\xff\xfb\x90\x00" + b"\x00" * 100)
+    segments = [{"path": str(wav), "duration": 0.5, "text": "a"}, {"path": str(mp3), "duration": 0.5, "text": "b"}]
+    settings = {"runtime_scratch_dir": str(tmp_path), "narration": {"single_track": True}}
+    assert assemble_narration(segments, settings) == segments
+
+def test_ssml_chunks_respect_input_limit():
+    """SSMLを入力の上限に収まるよう分割し、各文の前にmarkを置くことをテスト"""
+    from modules.audio_manager import _ssml_chunks
+    segments = [(i, f"{i}番目の文です。") for i in range(40)]
+    chunks = _ssml_chunks(segments, max_bytes=200)
+    assert len(chunks) > 1
+    assert all(len(ssml.encode("utf-8")) <= 200 for ssml, _ in chunks)
+    assert [i for _, indices in chunks for i in indices] == list(range(40))
+    ssml, indices = chunks[0]
+    assert ssml.startswith('<speak><mark name="s0"/>0番目の文です。<mark name="s1"/>')
+    # 特殊文字はエスケープする
+    assert _ssml_chunks([(0, "A&B<C>")])[0][0] == '<speak><mark name="s0"/>A&amp;B&lt;C&gt;</speak>'
+
+def test_split_wav_at_marks():
+    """markの時刻で音声を文ごとのWAVに切り分けることをテスト"""
+    import io
+    import wave
+    from benchmarks.fake_services import make_wav
+    from modules.audio_manager import _split_wav_at_marks
+    pieces = _split_wav_at_marks(make_wav(3.0, sampling_rate=8000), [0.1, 1.0, 2.5])
+    lengths = []
+    for piece in pieces:
+        with wave.open(io.BytesIO(piece), "rb") as w:
+            lengths.append(w.getnframes() / w.getframerate())
+    assert lengths == pytest.approx([1.0, 1.5, 0.5])
+
+def test_google_ssml_mode_sends_one_request(tmp_path):
+    """SSMLモードでは台本を1回のリクエストで合成し、markの時刻で文ごとの音声に切り分けることをテスト"""
+    pytest.importorskip("google.cloud.texttospeech_v1beta1")
+    from types import SimpleNamespace
+    from benchmarks.fake_services import make_wav
+    from modules.audio_manager import _generate_voice_google_ssml
+
+    client = MagicMock()
+    client.synthesize_speech.return_value = SimpleNamespace(
+        audio_content=make_wav(3.0),
+        timepoints=[SimpleNamespace(mark_name="s0", time_seconds=0.0),
+                    SimpleNamespace(mark_name="s1", time_seconds=1.2),
+                    SimpleNamespace(mark_name="s2", time_seconds=2.0)],
+    )
+    settings = {
+        "runtime_scratch_dir": str(tmp_path),
+        "google_tts": {"voice_name": "ja-JP-Neural2-B", "ssml_gender": "FEMALE", "speaking_rate": 1.0, "ssml_marks": True},
+    }
+    with patch("modules.clients.tts_client", return_value=client):
+        segments = _generate_voice_google_ssml(["一文目。", "二文目。", "三文目。"], settings, {"sample_rate_hertz": 24000})
+    assert client.synthesize_speech.call_count == 1
+    assert [seg["text"] for seg in segments] == ["一文目。", "二文目。", "三文目。"]
+    assert [seg["duration"] for seg in segments] == pytest.approx([1.2, 0.8, 1.0])
+
+def test_google_ssml_mode_skips_the_v1_client(tmp_path, monkeypatch):
+    """SSMLでまとめて合成する場合、使わないv1のクライアントを作らないことをテスト"""
+    from modules.audio_manager import _generate_voice_google_tts
+    credentials = tmp_path / "credentials.json"
+    credentials.write_text("{}")
+    monkeypatch.setenv("GOOGLE_APPLICATION_CREDENTIALS", str(credentials))
+    settings = {
+        "runtime_scratch_dir": str(tmp_path),
+        "google_tts": {"voice_name": "ja-JP-Neural2-B", "ssml_gender": "FEMALE", "speaking_rate": 1.0, "ssml_marks": True},
+    }
+    with patch("modules.clients.tts_client") as tts_client, \
+            patch("modules.audio_manager._generate_voice_google_ssml", return_value=["ok"]) as ssml:
+        assert _generate_voice_google_tts("一文目。。二文目", settings) == ["ok"]
+    ssml.assert_called_once()
+    tts_client.assert_not_called()
+
+def test_split_script_segments_keeps_the_original_rule_by_default():
+    """既定では従来どおり句読点が続く箇所でだけ区切ることをテスト"""
+    assert split_script_segments("こんにちは。今日は晴れ！\n次の行") == ["こんにちは。今日は晴れ！\n次の行"]
+    assert split_script_segments("こんにちは。。今日は晴れ") == ["こんにちは", "。。", "今日は晴れ"]
+
+def test_split_script_segments_by_sentence():
+    """1文ずつに分割する場合、続く句読点や閉じ括弧を文に含め、括弧の中では区切らないことをテスト"""
+    assert split_script_segments("こんにちは。今日は晴れ！\n次の行", by_sentence=True) == ["こんにちは。", "今日は晴れ！", "次の行"]
+    assert split_script_segments("「え、まって！城が…知ってる？」みんなはどう思う？", by_sentence=True) == [
+        "「え、まって！城が…知ってる？」", "みんなはどう思う？"]
+    assert split_script_segments("本当に！？驚きだよね。", by_sentence=True) == ["本当に！？", "驚きだよね。"]
+    assert split_script_segments("彼は「はい」と言った。次へ。", by_sentence=True) == ["彼は「はい」と言った。", "次へ。"]
+
+def test_sentence_cuts_wait_for_the_next_character():
+    """末尾の句読点の後は、閉じ括弧などが続く可能性があるため区切りとして確定しないことをテスト"""
+    assert sentence_cuts("「知ってる？") == []
+    assert sentence_cuts("本当に！") == []
+    assert sentence_cuts("本当に！？驚") == [5]
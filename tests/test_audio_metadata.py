@@ -0,0 +1,48 @@
+import struct
+from unittest.mock import patch
+
+import pytest
+
+from benchmarks.fake_services import make_wav
+from modules import audio_metadata
+
+# MPEG1 Layer III, 128kbps, 44.1kHz, ステレオ (フレーム長417バイト, 1152サンプル)
+_MP3_HEADER = bytes([0xFF, 0xFB, 0x90, 0x00])
+_FRAME_SECONDS = 1152 / 44100
+
+def _mp3_frames(count, first=b""):
+    frame = _MP3_HEADER + first
+    frames = [frame + b"\x00" * (417 - len(frame))]
+    frames += [_MP3_HEADER + b"\x00" * 413] * (count - 1)
+    return b"".join(frames)
+
+def _id3_tag(size):
+    syncsafe = bytes([(size >> shift) & 0x7F for shift in (21, 14, 7, 0)])
+    return b"ID3\x04\x00\x00" + syncsafe + b"\x00" * size
+
+def test_wav_duration_from_header(tmp_path):
+    """WAVの長さをfmt/dataチャンクから求めることをテスト"""
+    path = tmp_path / "a.wav"
+    path.write_bytes(make_wav(1.5, sampling_rate=16000))
+    assert audio_metadata.duration(str(path)) == pytest.approx(1.5)
+
+def test_mp3_duration_counts_frames_after_id3_tag(tmp_path):
+    """ID3タグを読み飛ばし、フレームヘッダを数えてMP3の長さを求めることをテスト"""
+    path = tmp_path / "a.mp3"
+    path.write_bytes(_id3_tag(20) + _mp3_frames(10))
+    assert audio_metadata.duration(str(path)) == pytest.approx(10 * _FRAME_SECONDS)
+
+def test_mp3_duration_uses_xing_frame_count(tmp_path):
+    """Xingタグがある場合は、タグに書かれた総フレーム数から長さを求めることをテスト"""
+    path = tmp_path / "a.mp3"
+    xing = b"\x00" * 32 + b"Xing" + struct.pack(">II", 1, 100)
+    path.write_bytes(_mp3_frames(3, first=xing))
+    assert audio_metadata.duration(str(path)) == pytest.approx(100 * _FRAME_SECONDS)
+
+def test_unknown_format_falls_back_to_probe(tmp_path):
+    """ヘッダから長さを求められない形式の場合だけffprobeで調べることをテスト"""
+    path = tmp_path / "a.ogg"
+    path.write_bytes(b"OggS" + b"\x00" * 100)
+    with patch("modules.audio_metadata._probe_duration", return_value=2.0) as mock_probe:
+        assert audio_metadata.duration(str(path)) == 2.0
+    mock_probe.assert_called_once_with(str(path))
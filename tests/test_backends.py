@@ -0,0 +1,33 @@
+import os
+import sys
+import json
+import subprocess
+from unittest.mock import MagicMock, patch
+
+from modules import backends
+from modules.audio_manager import generate_voice
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def test_heavy_modules_are_not_imported_at_startup():
+    """make_shortの読み込み時に重い依存ライブラリが読み込まれないことをテスト"""
+    heavy = ["moviepy", "google.generativeai", "google.cloud.texttospeech", "googleapiclient", "openai"]
+    code = f"import sys, json, make_short; print(json.dumps([m for m in {heavy!r} if m in sys.modules]))"
+    out = subprocess.run([sys.executable, "-c", code], cwd=ROOT, capture_output=True, text=True, check=True)
+    assert json.loads(out.stdout.strip().splitlines()[-1]) == []
+
+def test_get_resolves_registered_target():
+    """文字列で登録したバックエンドが初回取得時に読み込まれることをテスト"""
+    with patch.dict(backends._REGISTRY, {}):
+        backends.register("test", "dummy", "os.path:join")
+        assert backends.get("test", "dummy") is os.path.join
+        assert backends.get("test", "missing") is None
+    assert "test" not in backends._REGISTRY
+
+def test_generate_voice_uses_selected_engine():
+    """設定で選択したTTSエンジンだけが呼び出されることをテスト"""
+    engine = MagicMock(return_value=[{"path": "a.wav", "duration": 1.0, "text": "テスト"}])
+    with patch.dict(backends._REGISTRY["tts"], {"voicevox": engine}):
+        result = generate_voice("テスト。", {"audio_engine": "voicevox"})
+    engine.assert_called_once_with("テスト。", {"audio_engine": "voicevox"})
+    assert result[0]["path"] == "a.wav"
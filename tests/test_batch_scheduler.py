@@ -0,0 +1,58 @@
+import threading
+import pytest
+
+from modules.batch_scheduler import BatchScheduler
+
+@pytest.fixture
+def mock_settings():
+    return {
+        "batch": {
+            "workers": 3,
+            "compose_workers": 2
+        }
+    }
+
+def test_run_returns_results_in_theme_order(mock_settings):
+    """並列実行しても結果がテーマ順に並ぶことをテスト"""
+    scheduler = BatchScheduler(mock_settings)
+    results = scheduler.run(["a", "b", "c"], lambda theme, settings, sched: f"{theme}.mp4", mock_settings)
+    assert results == ["a.mp4", "b.mp4", "c.mp4"]
+
+def test_run_isolates_theme_failures(mock_settings, capsys):
+    """1テーマで例外が発生しても他のテーマは処理されることをテスト"""
+    def process(theme, settings, sched):
+        if theme == "bad":
+            raise RuntimeError("boom")
+        return f"{theme}.mp4"
+
+    scheduler = BatchScheduler(mock_settings)
+    results = scheduler.run(["ok1", "bad", "ok2"], process, mock_settings)
+
+    assert results == ["ok1.mp4", None, "ok2.mp4"]
+    captured = capsys.readouterr()
+    assert ">>> 進捗: 3/3件完了" in captured.out
+
+def test_run_processes_themes_concurrently(mock_settings):
+    """workers数までのテーマが同時に実行されることをテスト"""
+    barrier = threading.Barrier(3, timeout=5)
+
+    def process(theme, settings, sched):
+        barrier.wait()  # 3テーマが同時に走っていなければタイムアウトする
+        return theme
+
+    scheduler = BatchScheduler(mock_settings)
+    assert scheduler.run(["a", "b", "c"], process, mock_settings) == ["a", "b", "c"]
+
+def test_serial_mode_by_default(capsys):
+    """batch設定がない場合は1件ずつ順番に処理されることをテスト"""
+    order = []
+    scheduler = BatchScheduler({})
+    assert scheduler.workers == 1
+    scheduler.run(["a", "b"], lambda theme, settings, sched: order.append(theme), {})
+    assert order == ["a", "b"]
+    assert ">>> 進捗: 2/2件完了 <<<" in capsys.readouterr().out
+
+def test_compose_workers_bounded_by_workers():
+    """エンコードプロセス数がテーマ並列数を超えないことをテスト"""
+    scheduler = BatchScheduler({"batch": {"workers": 1, "compose_workers": 64}})
+    assert scheduler.compose_workers == 1
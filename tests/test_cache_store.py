@@ -0,0 +1,98 @@
+import os
+import time
+import pytest
+
+from modules import cache_store, llm_cache
+from modules.cache_store import SQLiteCache, cache_key
+
+@pytest.fixture(autouse=True)
+def close_caches():
+    yield
+    cache_store.close_all()
+
+def test_get_counts_hits_and_misses(tmp_path):
+    """ヒット数とミス数が記録されることをテスト"""
+    cache = SQLiteCache(str(tmp_path / "c.sqlite"))
+    assert cache.get("k") is None
+    cache.set("k", b"value")
+    assert cache.get("k") == b"value"
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["entries"], stats["bytes"]) == (1, 1, 1, 5)
+    cache.close()
+
+def test_expired_entry_is_not_returned(tmp_path):
+    """TTLを過ぎたエントリは返さないことをテスト"""
+    cache = SQLiteCache(str(tmp_path / "c.sqlite"), ttl_seconds=1)
+    cache.set("k", b"value")
+    cache._conn.execute("UPDATE entries SET created_at = ?", (time.time() - 10,))
+    assert cache.get("k") is None
+    assert cache.stats()["entries"] == 0
+    cache.close()
+
+def test_least_recently_used_entry_is_evicted(tmp_path):
+    """容量を超えたら最後に参照された時刻が古いものから削除されることをテスト"""
+    cache = SQLiteCache(str(tmp_path / "c.sqlite"), max_bytes=10)
+    cache.set("a", b"12345")
+    cache.set("b", b"12345")
+    cache._conn.execute("UPDATE entries SET accessed_at = accessed_at - 100 WHERE key = 'b'")
+    cache.set("c", b"12345")
+    assert cache.get("a") == b"12345"
+    assert cache.get("b") is None
+    assert cache.get("c") == b"12345"
+    cache.close()
+
+def test_cache_key_separates_parts():
+    """構成要素の区切りが異なれば別のキーになることをテスト"""
+    assert cache_key("ab", "c") != cache_key("a", "bc")
+    assert cache_key("model", "prompt") == cache_key("model", "prompt")
+
+def test_generate_text_reuses_valid_response(tmp_path):
+    """同じプロンプトは2回目以降APIを呼ばず、形式不正の応答はキャッシュしないことをテスト"""
+    settings = {"llm_cache": {"enabled": True, "path": str(tmp_path / "llm.sqlite")}}
+    calls = []
+
+    def generate():
+        calls.append(1)
+        return "応答" if len(calls) > 1 else ""
+
+    # 1回目は空の応答のためキャッシュされない
+    assert llm_cache.generate_text(settings, "m", "p", generate, validate=bool) == ""
+    assert llm_cache.generate_text(settings, "m", "p", generate, validate=bool) == "応答"
+    assert llm_cache.generate_text(settings, "m", "p", generate, validate=bool) == "応答"
+    assert len(calls) == 2
+    # モデル名やパラメータが違えば別のエントリになる
+    llm_cache.generate_text(settings, "m", "p", generate, params={"temperature": 0.5})
+    assert len(calls) == 3
+    assert llm_cache.stats(settings)["hits"] == 1
+
+def test_generate_text_bypass_refreshes_entry(tmp_path):
+    """bypass時はキャッシュを読まずに呼び出し、結果で上書きすることをテスト"""
+    path = str(tmp_path / "llm.sqlite")
+    llm_cache.generate_text({"llm_cache": {"enabled": True, "path": path}}, "m", "p", lambda: "古い")
+    bypass = {"llm_cache": {"enabled": True, "path": path, "bypass": True}}
+    assert llm_cache.generate_text(bypass, "m", "p", lambda: "新しい") == "新しい"
+    assert llm_cache.generate_text({"llm_cache": {"enabled": True, "path": path}}, "m", "p", lambda: "x") == "新しい"
+
+def test_generate_text_disabled_by_default(tmp_path):
+    """設定で有効にしていない場合は毎回APIを呼ぶことをテスト"""
+    calls = []
+    for _ in range(2):
+        llm_cache.generate_text({}, "m", "p", lambda: calls.append(1) or "応答")
+    assert len(calls) == 2
+    assert llm_cache.stats({}) is None
+
+def test_file_cache_evicts_least_recently_used(tmp_path):
+    """ファイルキャッシュが容量を超えたら最後に参照された時刻が古いものから削除することをテスト"""
+    cache = cache_store.FileCache(str(tmp_path / "files"), max_bytes=10)
+    src = tmp_path / "src"
+    src.write_bytes(b"12345")
+    path_a = cache.put("aa", str(src))
+    path_b = cache.put("bb", str(src))
+    old = time.time() - 100
+    os.utime(path_b, (old, old))
+    assert cache.get("aa") == path_a
+    cache.put("cc", str(src))
+    assert cache.get("bb") is None
+    assert cache.get("aa") == path_a
+    assert cache.stats()["bytes"] == 10
+    assert cache.stats()["hits"] == 2
@@ -0,0 +1,71 @@
+import threading
+from unittest.mock import MagicMock, patch
+
+from modules import clients
+
+@patch('google.generativeai.GenerativeModel')
+@patch('google.generativeai.configure')
+def test_gemini_model_is_created_once(mock_configure, mock_GenerativeModel):
+    """Geminiのモデルとconfigureが複数回の呼び出しで使い回されることをテスト"""
+    settings = {"api_keys": {"gemini": "key"}}
+    first = clients.gemini_model(settings)
+    second = clients.gemini_model(settings)
+    assert first is second
+    mock_configure.assert_called_once_with(api_key="key")
+    mock_GenerativeModel.assert_called_once_with(clients.GEMINI_MODEL)
+
+def test_client_is_created_once_under_concurrency():
+    """複数スレッドから同時に取得してもクライアントは1度だけ作成されることをテスト"""
+    created = []
+
+    def factory():
+        created.append(1)
+        return object()
+
+    barrier = threading.Barrier(8)
+    results = []
+
+    def worker():
+        barrier.wait()
+        results.append(clients._get_or_create(("test",), factory))
+
+    threads = [threading.Thread(target=worker) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len(created) == 1
+    assert all(r is results[0] for r in results)
+
+def test_failed_creation_is_not_cached():
+    """作成に失敗した（Noneを返した）クライアントは次回改めて作成されることをテスト"""
+    factory = MagicMock(side_effect=[None, "client"])
+    assert clients._get_or_create(("test",), factory) is None
+    assert clients._get_or_create(("test",), factory) == "client"
+
+def test_youtube_service_is_built_once_per_thread():
+    """YouTubeのサービスがスレッドごとに1度だけ作成されることをテスト"""
+    with patch('modules.youtube_uploader.get_credentials', return_value=MagicMock()) as mock_credentials, \
+         patch('googleapiclient.discovery.build_from_document', side_effect=lambda doc, credentials: object()) as mock_build:
+        first = clients.youtube_service({})
+        assert clients.youtube_service({}) is first
+        other = []
+        thread = threading.Thread(target=lambda: other.append(clients.youtube_service({})))
+        thread.start()
+        thread.join()
+    assert other[0] is not first
+    assert mock_build.call_count == 2
+    mock_credentials.assert_called_once()
+
+def test_warm_up_selects_clients_in_use(tmp_path, monkeypatch):
+    """この実行で使うクライアントだけを事前に接続することをテスト"""
+    monkeypatch.delenv('GOOGLE_APPLICATION_CREDENTIALS', raising=False)
+    settings = {
+        "api_keys": {"gemini": "key"},
+        "audio_engine": "google",
+        "youtube": {"post_to_youtube": True, "token_path": str(tmp_path / "missing.json")},
+    }
+    assert [name for name, _ in clients._warmers(settings)] == ["gemini"]
+    settings["api_keys"]["gemini"] = "ここにAPIキー"
+    assert clients._warmers(settings) == []
+    assert clients.warm_up({"clients": {"warm_up": False}, "api_keys": {"gemini": "key"}}) == []
@@ -0,0 +1,44 @@
+import io
+import wave
+import base64
+import requests
+from PIL import Image
+
+from benchmarks.fake_services import FakeStableDiffusion, FakeVoicevox, FakeYouTubeUpload, FakeGenerativeModel
+
+def test_fake_sd_returns_png_of_requested_size():
+    """SDの代替サーバーが要求サイズのPNGを返すことをテスト"""
+    with FakeStableDiffusion() as sd:
+        r = requests.post(f"{sd.url}/sdapi/v1/txt2img", json={"prompt": "p", "width": 64, "height": 96})
+        r.raise_for_status()
+        image = Image.open(io.BytesIO(base64.b64decode(r.json()["images"][0])))
+        assert image.size == (64, 96)
+        assert sd.request_count == 1
+
+def test_fake_voicevox_returns_wav():
+    """VOICEVOXの代替サーバーがaudio_query→synthesisでWAVを返すことをテスト"""
+    with FakeVoicevox(seconds_per_char=0.1) as vv:
+        query = requests.post(f"{vv.url}/audio_query", params={"text": "テストです", "speaker": 1}).json()
+        r = requests.post(f"{vv.url}/synthesis", params={"speaker": 1, "outputSamplingRate": 16000}, json=query)
+        with wave.open(io.BytesIO(r.content)) as w:
+            assert w.getframerate() == 16000
+            assert abs(w.getnframes() / w.getframerate() - 0.5) < 0.01
+
+def test_fake_youtube_resumable_upload():
+    """アップロードの代替サーバーが分割アップロードを受け付けることをテスト"""
+    with FakeYouTubeUpload() as yt:
+        start = requests.post(f"{yt.url}/upload/youtube/v3/videos?uploadType=resumable", json={"snippet": {}})
+        session = start.headers["Location"]
+        first = requests.put(session, data=b"a" * 10, headers={"Content-Range": "bytes 0-9/20"})
+        assert first.status_code == 308
+        last = requests.put(session, data=b"b" * 10, headers={"Content-Range": "bytes 10-19/20"})
+        assert last.json()["id"] == yt.completed[0]
+
+def test_fake_generative_model_script_and_prompts():
+    """Geminiスタブが台本形式と指定件数のプロンプトを返すことをテスト"""
+    FakeGenerativeModel.configure(latency=0, sentences=3)
+    model = FakeGenerativeModel("models/gemini-1.5-flash")
+    assert "【台本】" in model.generate_content("台本を書いて").text
+    assert len(model.generate_content("Generate exactly 4 distinct prompts").text.split("\n")) == 4
+    streamed = "".join(chunk.text for chunk in model.generate_content("台本を書いて", stream=True))
+    assert streamed == model.generate_content("台本を書いて").text
@@ -0,0 +1,56 @@
+import os
+import pytest
+from PIL import Image
+
+from modules import cache_store
+from modules.frame_preprocessor import prepare_frames, is_frame
+
+@pytest.fixture(autouse=True)
+def close_caches():
+    yield
+    cache_store.close_all()
+
+def _settings(tmp_path, **preprocess):
+    return {
+        "runtime_scratch_dir": str(tmp_path / "job"),
+        "video": {
+            "resolution": [40, 80],
+            "preprocess": {"enabled": True, "cache_dir": str(tmp_path / "frames"), **preprocess},
+        },
+    }
+
+def _image(path, size, mode="RGB", color=(200, 10, 10)):
+    Image.new(mode, size, color if mode == "RGB" else color + (255,)).save(path)
+    return str(path)
+
+def test_frames_are_letterboxed_to_resolution(tmp_path):
+    """幅を解像度に合わせて縮小し、黒背景の中央に配置したRGBのフレームになることをテスト"""
+    src = _image(tmp_path / "wide.png", (80, 40), mode="RGBA")
+    frames = prepare_frames([src], _settings(tmp_path))
+    assert is_frame(frames[0], (40, 80))
+    with Image.open(frames[0]) as frame:
+        assert frame.mode == "RGB"
+        # 上下は黒帯、中央は元画像
+        assert frame.getpixel((20, 0)) == (0, 0, 0)
+        assert frame.getpixel((20, 40)) == (200, 10, 10)
+
+def test_frames_keep_order_and_reuse_cache(tmp_path):
+    """フレームが画像の順に並び、同じ内容の画像は2回目以降キャッシュから取得されることをテスト"""
+    sources = [_image(tmp_path / f"{i}.png", (20, 20), color=(i * 50, 0, 0)) for i in range(3)]
+    settings = _settings(tmp_path, workers=3)
+    first = prepare_frames(sources, settings)
+    assert [os.path.basename(p) for p in first] == ["0001.png", "0002.png", "0003.png"]
+    with Image.open(first[2]) as frame:
+        assert frame.getpixel((20, 40)) == (100, 0, 0)
+
+    settings["runtime_scratch_dir"] = str(tmp_path / "job2")
+    prepare_frames(sources, settings)
+    assert cache_store.open_file_cache(str(tmp_path / "frames")).stats()["hits"] == 3
+
+def test_unconvertible_images_are_passed_through(tmp_path):
+    """無効な場合や変換できない画像は、元のパスのまま返すことをテスト"""
+    broken = tmp_path / "broken.png"
+    broken.write_bytes(b"not an image")
+    missing = str(tmp_path / "missing.png")
+    assert prepare_frames([str(broken), missing], _settings(tmp_path)) == [str(broken), missing]
+    assert prepare_frames([str(broken)], {"video": {}}) == [str(broken)]
@@ -0,0 +1,76 @@
+import pytest
+from unittest.mock import MagicMock
+
+from modules.job_queue import JobQueue
+from modules.daemon import open_queue, run_daemon
+
+@pytest.fixture
+def mock_settings(tmp_path):
+    return {
+        "batch": {"workers": 1},
+        "checkpoint": {"enabled": False},
+        "daemon": {"queue_dir": str(tmp_path / "queue"), "exit_when_empty": True, "max_attempts": 2},
+    }
+
+def test_pending_excludes_acknowledged_jobs(tmp_path):
+    """完了を記録したジョブが未処理に含まれないことをテスト"""
+    queue = JobQueue(str(tmp_path))
+    first = queue.enqueue("テーマA")
+    queue.enqueue("テーマB")
+    queue.ack(first, "done", "a.mp4")
+
+    # 別インスタンス（再起動後）からも同じ状態が見えること
+    pending = JobQueue(str(tmp_path)).pending()
+    assert [job["theme"] for job in pending] == ["テーマB"]
+
+def test_failed_jobs_are_retried_until_max_attempts(tmp_path):
+    """失敗したジョブがmax_attempts回まで再実行対象になることをテスト"""
+    queue = JobQueue(str(tmp_path), max_attempts=2)
+    job_id = queue.enqueue("テーマA")
+    queue.ack(job_id, "failed")
+    assert queue.pending()[0]["attempts"] == 1
+    queue.ack(job_id, "failed")
+    assert queue.pending() == []
+    assert queue.stats()["gave_up"] == 1
+
+def test_torn_line_is_skipped(tmp_path):
+    """書き込み途中で壊れた末尾の行を読み飛ばすことをテスト"""
+    queue = JobQueue(str(tmp_path))
+    queue.enqueue("テーマA")
+    with open(queue.jobs_path, "a", encoding="utf-8") as f:
+        f.write('{"job_id": "abc", "the')
+    assert [job["theme"] for job in queue.pending()] == ["テーマA"]
+
+def test_run_daemon_processes_and_acks_jobs(mock_settings):
+    """常駐モードがキューのジョブを処理して完了を記録することをテスト"""
+    queue = open_queue(mock_settings)
+    queue.enqueue("ok")
+    queue.enqueue("bad")
+    process = MagicMock(side_effect=lambda theme, settings, sched: f"{theme}.mp4" if theme == "ok" else None)
+
+    completed = run_daemon(mock_settings, process)
+
+    assert completed == 1
+    # 失敗したジョブはmax_attempts回まで再実行される
+    assert [c.args[0] for c in process.call_args_list] == ["ok", "bad", "bad"]
+    # 再開時に二重投稿しないよう、チェックポイントからの再開が有効になっている
+    assert process.call_args.args[1]["checkpoint"]["resume"] is True
+    assert queue.stats() == {"total": 2, "done": 1, "gave_up": 1, "pending": 0}
+
+def test_jobs_are_acked_as_each_theme_finishes(mock_settings):
+    """バッチ全体の完了を待たず、テーマが終わるたびに完了が記録されることをテスト"""
+    mock_settings["daemon"]["batch_size"] = 2
+    queue = open_queue(mock_settings)
+    queue.enqueue("first")
+    queue.enqueue("crash")
+
+    def process(theme, settings, sched):
+        if theme == "crash":
+            # 1件目の完了は、バッチの途中でも記録済みになっている
+            assert queue.stats()["done"] == 1
+            raise KeyboardInterrupt  # バッチの途中でのクラッシュ
+        return f"{theme}.mp4"
+
+    with pytest.raises(KeyboardInterrupt):
+        run_daemon(mock_settings, process)
+    assert [job["theme"] for job in queue.pending()] == ["crash"]
@@ -0,0 +1,58 @@
+import threading
+import pytest
+from unittest.mock import patch
+
+from modules.memory_budget import MemoryBudget, estimate_compose_bytes, MB
+
+@pytest.fixture
+def mock_settings():
+    return {
+        "video": {"resolution": [1080, 1920]},
+        "image": {"stable_diffusion": {"width": 1024, "height": 1792}},
+    }
+
+@pytest.fixture(autouse=True)
+def no_system_memory_check():
+    # 空きメモリはテスト環境に依存するため、予算だけで判定させる
+    with patch("modules.memory_budget.available_memory_bytes", return_value=None):
+        yield
+
+def test_estimate_grows_with_images_and_resolution(mock_settings):
+    """画像枚数と解像度に応じて見積もりが増えることをテスト"""
+    segments = [{"duration": 10.0}]
+    small = estimate_compose_bytes(["a.png"], segments, mock_settings)
+    more_images = estimate_compose_bytes(["a.png", "b.png"], segments, mock_settings)
+    mock_settings["video"]["resolution"] = [2160, 3840]
+    larger = estimate_compose_bytes(["a.png"], segments, mock_settings)
+    assert small < more_images
+    assert small < larger
+
+def test_over_budget_job_waits_for_release():
+    """予算を超える合成は、実行中の合成が終わるまで待たされることをテスト"""
+    budget = MemoryBudget(100 * MB, poll_interval=0.05)
+    admitted = threading.Event()
+
+    def second():
+        with budget.reserve(60 * MB):
+            admitted.set()
+
+    with budget.reserve(60 * MB):
+        thread = threading.Thread(target=second)
+        thread.start()
+        assert not admitted.wait(0.2)
+    assert admitted.wait(2)
+    thread.join()
+    assert budget.in_use == 0
+
+def test_oversized_job_runs_alone():
+    """予算より大きい合成でも、他に実行中のものがなければ実行されることをテスト"""
+    budget = MemoryBudget(10 * MB)
+    with budget.reserve(50 * MB) as reserved:
+        assert reserved == 50 * MB
+        assert budget.running == 1
+
+def test_observe_adjusts_future_estimates():
+    """実測値が見積もりより大きい場合、以降の見積もりが増えることをテスト"""
+    budget = MemoryBudget(None)
+    budget.observe(100 * MB, 300 * MB)
+    assert budget.adjusted(100 * MB) > 100 * MB
@@ -0,0 +1,89 @@
+import threading
+import pytest
+from unittest.mock import MagicMock
+
+from modules.pipeline_graph import StageGraph, StageFailed, Channel
+
+def test_independent_stages_run_concurrently():
+    """依存関係のないステージが並行して実行されることをテスト"""
+    barrier = threading.Barrier(2, timeout=5)
+
+    def wait_for_peer(deps):
+        barrier.wait()  # 2つのステージが同時に走っていなければタイムアウトする
+        return True
+
+    graph = StageGraph()
+    graph.add('script', lambda deps: "台本")
+    graph.add('voice', wait_for_peer, deps=('script',))
+    graph.add('images', wait_for_peer, deps=('script',))
+    results = graph.run()
+
+    assert results == {'script': "台本", 'voice': True, 'images': True}
+
+def test_stage_receives_dependency_results():
+    """ステージに依存ステージの結果が渡されることをテスト"""
+    graph = StageGraph()
+    graph.add('script', lambda deps: "台本")
+    graph.add('voice', lambda deps: deps['script'] + "の音声", deps=('script',))
+    assert graph.run()['voice'] == "台本の音声"
+
+def test_required_stage_failure_stops_dependents():
+    """必須ステージが失敗した場合、依存するステージは実行されないことをテスト"""
+    video_stage = MagicMock(return_value="video.mp4")
+    graph = StageGraph()
+    graph.add('voice', lambda deps: None)
+    graph.add('video', video_stage, deps=('voice',))
+
+    with pytest.raises(StageFailed) as excinfo:
+        graph.run()
+
+    assert excinfo.value.stage == 'voice'
+    video_stage.assert_not_called()
+
+def test_optional_stage_failure_continues():
+    """必須でないステージの失敗では処理が継続することをテスト"""
+    graph = StageGraph()
+    graph.add('subtitles', lambda deps: None, required=False)
+    graph.add('video', lambda deps: "video.mp4", deps=('subtitles',))
+    assert graph.run()['video'] == "video.mp4"
+
+def test_stage_exception_is_propagated():
+    """ステージ内の例外が呼び出し元に送出されることをテスト"""
+    graph = StageGraph()
+    graph.add('script', MagicMock(side_effect=RuntimeError("boom")))
+    with pytest.raises(RuntimeError, match="boom"):
+        graph.run()
+
+def test_future_allows_waiting_without_dependency():
+    """future()で依存関係に含めずに他ステージの結果を待てることをテスト"""
+    graph = StageGraph()
+    graph.add('video', lambda deps: "video.mp4")
+    graph.add('thumbnail', lambda deps: "thumb.jpg", required=False)
+    graph.add('post', lambda deps: (deps['video'], graph.future('thumbnail').result(timeout=5)), deps=('video',))
+    assert graph.run()['post'] == ("video.mp4", "thumb.jpg")
+
+def test_channel_streams_values_between_stages():
+    """チャネルで送った値を、送り手の完了を待たずに受け手が順に受け取れることをテスト"""
+    channel = Channel()
+    first_received = threading.Event()
+
+    def producer(deps):
+        try:
+            channel.put("文1")
+            assert first_received.wait(timeout=5)  # 受け手が1件目を受け取るまで2件目を送らない
+            channel.put("文2")
+        finally:
+            channel.close()
+        return "台本"
+
+    def consumer(deps):
+        received = []
+        for value in channel:
+            received.append(value)
+            first_received.set()
+        return received
+
+    graph = StageGraph()
+    graph.add('script', producer)
+    graph.add('voice', consumer)
+    assert graph.run()['voice'] == ["文1", "文2"]
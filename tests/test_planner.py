@@ -0,0 +1,82 @@
+import pytest
+
+from modules import run_history
+from modules.planner import plan_theme, plan_batch, format_plan
+
+@pytest.fixture
+def mock_settings(tmp_path):
+    script = tmp_path / "script.txt"
+    script.write_text("最初の文です。次の文です！\n三つ目の文？\n四つ目", encoding="utf-8")
+    return {
+        "script": {"path": str(script)},
+        "audio_engine": "voicevox",
+        "script_generation": {"stream": True},  # 台本を1文ずつに分割する
+        "image": {"enabled_apis": {"stable_diffusion": True}},
+        "video": {"image_duration": 4.0},
+        "youtube": {"post_to_youtube": False},
+        "batch": {"workers": 2, "compose_workers": 1},
+    }
+
+def _span(name, seconds, **args):
+    return {"name": name, "ts": 0, "dur": int(seconds * 1_000_000), "pid": 1, "tid": 1, "args": args}
+
+def test_plan_theme_uses_script_file(mock_settings):
+    """台本ファイルがある場合、その内容から音声セグメント数と画像枚数を求めることをテスト"""
+    plan = plan_theme("テーマ", mock_settings, {})
+    assert plan["tts_segments"] == 4
+    assert plan["images"] == 3
+    assert plan["video_seconds"] == 12.0
+    assert plan["api_calls"] == {"gemini": 1, "tts": 8, "stable_diffusion": 3, "youtube": 0}
+
+def test_plan_uses_historical_timings(mock_settings, tmp_path):
+    """実行履歴の処理時間が見積もりに使われることをテスト"""
+    history = str(tmp_path / "runs.jsonl")
+    run_history.record([
+        _span("sd.txt2img", 2.0, images=1), _span("sd.txt2img", 4.0, images=1),
+        _span("tts.segment", 0.5, chars=10),
+        _span("video.write_videofile", 6.0, duration=12.0),
+    ], history)
+    rates = run_history.load_rates(history)
+    assert rates["sd.txt2img"]["per_call"] == pytest.approx(3.0)
+
+    plan = plan_theme("テーマ", mock_settings, rates)
+    # 画像生成 3枚 x 3秒 / 同時実行数2 + プロンプト生成(既定値5秒) と 動画書き出し 12秒 x 0.5
+    assert plan["render_seconds"] == pytest.approx(6.0)
+    assert plan["latency_seconds"] == pytest.approx(5.0 + 4.5 + 6.0)
+
+def test_plan_batch_totals(mock_settings):
+    """バッチ全体のAPI呼び出し回数と表示をテスト"""
+    plan = plan_batch(["A", "B"], mock_settings, {})
+    assert plan["api_calls"]["stable_diffusion"] == 6
+    assert "推定所要時間" in format_plan(plan)
+
+def test_plan_combined_generation_saves_gemini_call(mock_settings):
+    """台本と画像プロンプトをまとめて生成する場合、Geminiの呼び出しが1回になることをテスト"""
+    mock_settings["script"] = {}
+    assert plan_theme("テーマ", mock_settings, {})["api_calls"]["gemini"] == 2
+    mock_settings["script_generation"] = {"combined": True}
+    assert plan_theme("テーマ", mock_settings, {})["api_calls"]["gemini"] == 1
+
+def test_plan_tts_time_accounts_for_concurrency(mock_settings, tmp_path):
+    """音声合成の時間が、エンジンごとの同時実行数で割って見積もられることをテスト"""
+    rates = {"tts.segment": {"per_call": 10.0, "per_unit": None}, "sd.txt2img": {"per_call": 0.0, "per_unit": None}}
+    mock_settings["voicevox"] = {"concurrency": 1}
+    serial = plan_theme("テーマ", mock_settings, rates)["latency_seconds"]
+    mock_settings["voicevox"] = {"concurrency": 4}
+    concurrent = plan_theme("テーマ", mock_settings, rates)["latency_seconds"]
+    # 4文 x 10秒 を直列なら40秒、4件並行なら10秒
+    assert serial - concurrent == pytest.approx(30.0)
+
+def test_plan_counts_ssml_requests(mock_settings, tmp_path):
+    """SSMLモードでは、音声合成のAPI呼び出しを入力の上限ごとのリクエスト数で数えることをテスト"""
+    mock_settings["audio_engine"] = "google"
+    assert plan_theme("テーマ", mock_settings, {})["api_calls"]["tts"] == 4
+    mock_settings["google_tts"] = {"ssml_marks": True}
+    assert plan_theme("テーマ", mock_settings, {})["api_calls"]["tts"] == 1
+    mock_settings["google_tts"]["ssml_max_bytes"] = 100
+    assert plan_theme("テーマ", mock_settings, {})["api_calls"]["tts"] == 2
+
+    # SSMLのリクエストの実績は、SSMLの文字数あたりの時間として集計される
+    history = str(tmp_path / "runs.jsonl")
+    run_history.record([_span("tts.ssml", 2.0, chars=400)], history)
+    assert run_history.load_rates(history)["tts.ssml"]["per_unit"] == pytest.approx(0.005)
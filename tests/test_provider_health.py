@@ -0,0 +1,135 @@
+import time
+import threading
+from unittest.mock import MagicMock, patch
+
+import requests
+from PIL import Image
+
+from benchmarks.fake_services import FakeStableDiffusion
+from modules import provider_health
+from modules.provider_health import CircuitBreaker
+from modules.image_manager import generate_images, _generate_images_sd
+
+class _Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+def test_breaker_opens_and_allows_one_trial_after_reset():
+    """連続した失敗で開き、reset_seconds経過後は1件だけ試行を許可することをテスト"""
+    clock = _Clock()
+    breaker = CircuitBreaker("sd", failure_threshold=2, reset_seconds=10, clock=clock)
+    breaker.record_failure()
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == "open" and not breaker.allow()
+
+    clock.now = 10
+    assert breaker.state == "half_open"
+    assert breaker.allow()
+    assert not breaker.allow()
+    # 試行が失敗すると再び開き、成功すると閉じる
+    breaker.record_failure()
+    assert breaker.state == "open"
+    clock.now = 20
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.state == "closed"
+
+def test_probe_result_is_reused_within_interval():
+    """ヘルスチェックの結果がprobe_intervalの間は使い回されることをテスト"""
+    clock = _Clock()
+    check = MagicMock(return_value=True)
+    settings = {"image": {"failover": {"probe_interval": 30}}}
+    with patch.dict(provider_health._PROBES, {"test": check}):
+        assert provider_health.probe("test", settings, clock=clock)
+        clock.now = 29
+        provider_health.probe("test", settings, clock=clock)
+        assert check.call_count == 1
+        clock.now = 31
+        provider_health.probe("test", settings, clock=clock)
+        assert check.call_count == 2
+
+def test_sd_requests_stop_after_breaker_opens(tmp_path):
+    """SDへの接続が失敗し続けた場合、ブレーカーが開いた後のリクエストは送らないことをテスト"""
+    session = MagicMock()
+    session.post.side_effect = requests.ConnectionError("refused")
+    settings = {
+        "runtime_scratch_dir": str(tmp_path),
+        "image": {
+            "stable_diffusion": {"url": "http://sd/sdapi/v1/txt2img", "concurrency": 1},
+            "failover": {"failure_threshold": 3},
+        },
+    }
+    with patch("modules.clients.http_session", return_value=session):
+        assert _generate_images_sd([f"p{i}" for i in range(6)], settings) == []
+    assert session.post.call_count == 3
+
+def _stock(tmp_path, count=2):
+    stock_dir = tmp_path / "stock"
+    stock_dir.mkdir()
+    for i in range(count):
+        Image.new("RGB", (8, 8)).save(stock_dir / f"{i}.png")
+    return str(stock_dir)
+
+def _image_settings(tmp_path, sd_url, **failover):
+    return {
+        "runtime_scratch_dir": str(tmp_path),
+        "image": {
+            "api_priority": ["stable_diffusion", "stock"],
+            "enabled_apis": {"stable_diffusion": True, "stock": True},
+            "stable_diffusion": {"url": sd_url, "width": 8, "height": 8},
+            "stock": {"dir": _stock(tmp_path)},
+            "failover": failover,
+        },
+    }
+
+def test_unhealthy_backend_is_skipped(tmp_path):
+    """ヘルスチェックに失敗したバックエンドは呼び出さず、次の候補を使うことをテスト"""
+    sd = FakeStableDiffusion().start()
+    url = f"{sd.url}/sdapi/v1/txt2img"
+    sd.stop()
+    settings = _image_settings(tmp_path, url)
+    with patch("modules.image_manager._generate_images_sd") as mock_sd:
+        images = generate_images("テーマ", "1行目\n2行目\n3行目", settings, prompts=["a", "b", "c"])
+    mock_sd.assert_not_called()
+    assert len(images) == 3
+    assert all("stock" in path for path in images)
+
+def test_slow_backend_is_hedged(tmp_path):
+    """最初のバックエンドが遅い場合、次の候補にも要求して先にそろった画像を使うことをテスト"""
+    with FakeStableDiffusion(latency=2.0) as sd:
+        settings = _image_settings(tmp_path, f"{sd.url}/sdapi/v1/txt2img", hedge_after_seconds=0.1)
+        start = time.perf_counter()
+        images = generate_images("テーマ", "1行目\n2行目", settings, prompts=["a", "b"])
+        elapsed = time.perf_counter() - start
+    assert elapsed < 1.5
+    assert len(images) == 2
+    assert all("stock" in path for path in images)
+
+def test_hedge_loser_stops_requests_and_leaves_no_files(tmp_path):
+    """ヘッジで使われなかったSDは以降のリクエストを送らず、作業領域に画像を残さないことをテスト"""
+    with FakeStableDiffusion(latency=1.0) as sd:
+        settings = _image_settings(tmp_path, f"{sd.url}/sdapi/v1/txt2img", hedge_after_seconds=0.1)
+        settings["image"]["stable_diffusion"]["concurrency"] = 1
+        images = generate_images("テーマ", "1行目\n2行目\n3行目", settings, prompts=["a", "b", "c"])
+        assert all("stock" in path for path in images)
+        requests_sent = sd.request_count
+        # 実行中だった1件目のリクエストが終わるのを待つ
+        time.sleep(1.5)
+        assert sd.request_count == requests_sent
+    assert not list((tmp_path / "images").glob("*.png"))
+    assert provider_health.breaker("stable_diffusion", settings).state == "closed"
+
+def test_hedge_loser_does_not_block_on_inflight_request(tmp_path):
+    """取り消されたSDは実行中のリクエストの応答を待たずに戻ることをテスト"""
+    with FakeStableDiffusion(latency=3.0) as sd:
+        cancel = threading.Event()
+        settings = _image_settings(tmp_path, f"{sd.url}/sdapi/v1/txt2img")
+        settings["runtime_cancel"] = cancel
+        threading.Timer(0.3, cancel.set).start()
+        start = time.perf_counter()
+        assert _generate_images_sd(["a"], settings) == []
+        assert time.perf_counter() - start < 1.5
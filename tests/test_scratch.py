@@ -0,0 +1,44 @@
+import os
+import json
+import pytest
+
+from modules import scratch
+from modules.scratch import ScratchSpace, ScratchQuotaExceeded, sweep_orphans
+
+def test_scratch_is_removed_on_failure(tmp_path):
+    """処理が失敗しても作業領域が削除されることをテスト"""
+    with pytest.raises(RuntimeError):
+        with ScratchSpace(root=str(tmp_path), label="テーマ") as space:
+            with open(os.path.join(space.subdir("voice"), "a.wav"), "wb") as f:
+                f.write(b"\x00" * 10)
+            raise RuntimeError("boom")
+    assert os.listdir(tmp_path) == []
+
+def test_quota_is_enforced(tmp_path):
+    """書き込み量が上限を超えるとScratchQuotaExceededが送出されることをテスト"""
+    with ScratchSpace(root=str(tmp_path), quota_bytes=15) as space:
+        settings = {"runtime_scratch_dir": space.path}
+        path = os.path.join(scratch.scratch_dir(settings, "images"), "1.png")
+        with open(path, "wb") as f:
+            f.write(b"\x00" * 10)
+        scratch.account(settings, path)
+        with pytest.raises(ScratchQuotaExceeded):
+            scratch.account(settings, path)
+        assert space.bytes_written == 20
+
+def test_scratch_dir_without_job_uses_legacy_dir(tmp_path):
+    """作業領域の外から呼ばれた場合は従来のディレクトリを使うことをテスト"""
+    legacy = str(tmp_path / "temp")
+    assert scratch.scratch_dir({}, "voice", legacy_dir=legacy) == legacy
+    assert os.path.isdir(legacy)
+
+def test_sweep_removes_dirs_of_dead_processes(tmp_path):
+    """所有プロセスが終了した作業領域だけを削除することをテスト"""
+    dead = tmp_path / "dead"
+    dead.mkdir()
+    (dead / scratch.OWNER_FILE).write_text(json.dumps({"pid": 2 ** 22 + 12345}))
+
+    with ScratchSpace(root=str(tmp_path)) as space:
+        assert sweep_orphans(str(tmp_path)) == 1
+        assert os.path.isdir(space.path)
+    assert not dead.exists()
@@ -1,7 +1,10 @@
 # tests/test_script_generator.py
+import threading
 from unittest.mock import patch, MagicMock, call
 import pytest
-from modules.script_generator import generate_script
+import json
+from modules.script_generator import generate_script, generate_scripts, generate_script_with_prompts, ScriptStreamParser
+from modules.audio_manager import split_script_segments
 from google.generativeai import types
 
 @pytest.fixture
@@ -121,4 +124,127 @@ def test_generate_script_generic_exception(mock_configure, mock_GenerativeModel,
 
     result = generate_script("テストテーマ", mock_settings)
 
-    assert result == "エラーにより台本を生成できませんでした。テーマ: テストテーマ"
\ No newline at end of file
+    assert result == "エラーにより台本を生成できませんでした。テーマ: テストテーマ"
+
+@patch('modules.script_generator.generate_script')
+def test_generate_scripts_returns_results_in_theme_order(mock_generate_script, mock_settings):
+    """並行生成の結果がテーマ順に並び、失敗が例外ではなく値として返ることをテスト"""
+    def fake_generate(theme, settings):
+        if theme == "例外":
+            raise ValueError("APIキーがありません")
+        if theme == "ブロック":
+            return f"エラーにより台本を生成できませんでした。テーマ: {theme}"
+        return f"{theme}の台本"
+    mock_generate_script.side_effect = fake_generate
+
+    results = generate_scripts(["A", "例外", "ブロック", "B"], mock_settings)
+
+    assert [r["theme"] for r in results] == ["A", "例外", "ブロック", "B"]
+    assert results[0] == {"theme": "A", "script": "Aの台本", "image_prompts": None, "error": None}
+    assert results[1]["script"] is None and "APIキー" in results[1]["error"]
+    assert results[2]["script"] is None and results[2]["error"].startswith("エラーにより")
+    assert results[3]["script"] == "Bの台本"
+
+@patch('modules.script_generator.generate_script')
+def test_generate_scripts_runs_concurrently(mock_generate_script, mock_settings):
+    """concurrencyの数までリクエストが同時に発行されることをテスト"""
+    barrier = threading.Barrier(3, timeout=5)
+
+    def fake_generate(theme, settings):
+        barrier.wait()  # 3テーマが同時に生成されていなければタイムアウトする
+        return theme
+    mock_generate_script.side_effect = fake_generate
+    mock_settings['script_generation']['concurrency'] = 3
+
+    results = generate_scripts(["a", "b", "c"], mock_settings)
+
+    assert [r["script"] for r in results] == ["a", "b", "c"]
+
+def _feed_in_chunks(parser, text, step):
+    sentences = []
+    for i in range(0, len(text), step):
+        sentences.extend(parser.feed(text[i:i + step]))
+    return sentences + parser.finish()
+
+@pytest.mark.parametrize("step", [1, 3, 7, 100])
+def test_stream_parser_matches_whole_response(step):
+    """ストリーミングで取り出した文が、応答全体から抽出した台本の分割結果と一致することをテスト"""
+    response = "前置き\n【台本】\n最初の文です。次の文！\nそして最後の文\n\n【文字数】20文字\n\n【構成メモ】\n- フック：あ。"
+    sentences = _feed_in_chunks(ScriptStreamParser(1000), response, step)
+    assert sentences == ["最初の文です。", "次の文！", "そして最後の文"]
+
+@pytest.mark.parametrize("step", [1, 2, 5])
+def test_stream_parser_keeps_closing_brackets_with_sentence(step):
+    """閉じ括弧や続く句読点が後の断片で届いても、文の途中で区切らないことをテスト"""
+    response = "【台本】\n「え、まって！城が…知ってる？」みんなはどう思う？本当に！？驚きだよね。\n【文字数】"
+    sentences = _feed_in_chunks(ScriptStreamParser(1000), response, step)
+    assert sentences == ["「え、まって！城が…知ってる？」", "みんなはどう思う？", "本当に！？", "驚きだよね。"]
+
+def test_stream_parser_emits_sentences_before_response_ends():
+    """文が書き終わった時点で、応答の完了を待たずに返されることをテスト"""
+    parser = ScriptStreamParser(1000)
+    assert parser.feed("【台本】\n最初の文で") == []
+    assert parser.feed("す。次の") == ["最初の文です。"]
+    assert parser.feed("文。\n【文字") == ["次の文。"]
+    assert parser.feed("数】10文字") == []
+    assert parser.finish() == []
+
+def test_stream_parser_applies_max_chars():
+    """最大文字数で切り詰めた台本と同じ文を返すことをテスト"""
+    body = "一つ目の文です。二つ目の長い文がここに続きます。"
+    sentences = _feed_in_chunks(ScriptStreamParser(12), f"【台本】{body}【文字数】", 4)
+    assert sentences == split_script_segments(body[:12] + "...", by_sentence=True)
+
+@patch('google.generativeai.GenerativeModel')
+@patch('google.generativeai.configure')
+def test_generate_script_stream_calls_on_sentence(mock_configure, mock_GenerativeModel, mock_settings):
+    """ストリーミング時、書き終わった文ごとにon_sentenceが呼ばれることをテスト"""
+    text = "【台本】\n文その1。\n文その2。\n\n【文字数】10文字"
+    chunks = [MagicMock(text=text[i:i + 5]) for i in range(0, len(text), 5)]
+    mock_model_instance = MagicMock()
+    mock_model_instance.generate_content.return_value = iter(chunks)
+    mock_GenerativeModel.return_value = mock_model_instance
+    received = []
+
+    result = generate_script("テストテーマ", mock_settings, on_sentence=received.append)
+
+    assert result == "文その1。\n文その2。"
+    assert received == ["文その1。", "文その2。"]
+    assert mock_model_instance.generate_content.call_args.kwargs["stream"] is True
+
+@patch('google.generativeai.GenerativeModel')
+@patch('google.generativeai.configure')
+def test_generate_script_with_prompts_aligns_lines(mock_configure, mock_GenerativeModel, mock_settings):
+    """1回の呼び出しで、台本の各行と同じ順の画像プロンプトが得られることをテスト"""
+    lines = [
+        {"narration": "え、まって！", "image_prompt": "A surprised face."},
+        {"narration": "城は実は\n木造だった。", "image_prompt": "A wooden castle."},
+    ]
+    mock_model_instance = MagicMock()
+    mock_model_instance.generate_content.return_value = MagicMock(text=json.dumps({"lines": lines}))
+    mock_GenerativeModel.return_value = mock_model_instance
+
+    script_text, prompts = generate_script_with_prompts("テストテーマ", mock_settings)
+
+    assert script_text == "え、まって！\n城は実は木造だった。"
+    assert prompts == ["A surprised face.", "A wooden castle."]
+    mock_model_instance.generate_content.assert_called_once()
+    config = mock_model_instance.generate_content.call_args.kwargs["generation_config"]
+    assert config["response_mime_type"] == "application/json"
+
+@patch('google.generativeai.GenerativeModel')
+@patch('google.generativeai.configure')
+def test_generate_script_with_prompts_falls_back_on_invalid_json(mock_configure, mock_GenerativeModel, mock_settings):
+    """JSONとして解釈できない応答の場合、通常の台本生成に切り替わることをテスト"""
+    mock_model_instance = MagicMock()
+    mock_model_instance.generate_content.side_effect = [
+        MagicMock(text="not json"),
+        MagicMock(text="【台本】\n通常の台本\n\n【文字数】5文字"),
+    ]
+    mock_GenerativeModel.return_value = mock_model_instance
+
+    script_text, prompts = generate_script_with_prompts("テストテーマ", mock_settings)
+
+    assert script_text == "通常の台本"
+    assert prompts is None
+    assert mock_model_instance.generate_content.call_count == 2
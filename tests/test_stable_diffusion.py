@@ -0,0 +1,100 @@
+import os
+import json
+import time
+import base64
+
+from PIL import Image
+
+from benchmarks.fake_services import FakeStableDiffusion, make_png
+from modules.image_manager import _generate_images_sd, _group_sd_requests, _stream_sd_images
+
+def _settings(sd, tmp_path, **sd_settings):
+    return {
+        "runtime_scratch_dir": str(tmp_path),
+        "image": {"stable_diffusion": {"url": f"{sd.url}/sdapi/v1/txt2img", "width": 8, "height": 8, **sd_settings}},
+    }
+
+def test_group_sd_requests_batches_identical_prompts():
+    """同じプロンプトがbatch_sizeの上限ごとに1つのリクエストにまとめられることをテスト"""
+    groups = _group_sd_requests(["a", "b", "a", "a", "c"], max_batch_size=2)
+    assert groups == [("a", [0, 2]), ("a", [3]), ("b", [1]), ("c", [4])]
+
+def test_images_keep_prompt_order(tmp_path):
+    """並行して生成しても、画像のパスがプロンプトの順に並ぶことをテスト"""
+    with FakeStableDiffusion() as sd:
+        paths = _generate_images_sd(["p1", "p2", "p1", "p3"], _settings(sd, tmp_path, concurrency=3))
+        assert [os.path.basename(p) for p in paths] == ["0001.png", "0002.png", "0003.png", "0004.png"]
+        assert all(os.path.exists(p) for p in paths)
+        # 同じプロンプトの2枚は1回のリクエストで生成される
+        assert sd.request_count == 3
+
+def test_requests_run_concurrently(tmp_path):
+    """sd.concurrency件までのリクエストが並行して送られることをテスト"""
+    with FakeStableDiffusion(latency=0.3) as sd:
+        start = time.perf_counter()
+        paths = _generate_images_sd([f"p{i}" for i in range(4)], _settings(sd, tmp_path, concurrency=4))
+        elapsed = time.perf_counter() - start
+    assert len(paths) == 4
+    assert elapsed < 0.3 * 4 * 0.6
+
+def test_cached_images_skip_the_api(tmp_path):
+    """同じ内容の画像はキャッシュから取得し、SDを呼び出さないことをテスト"""
+    with FakeStableDiffusion() as sd:
+        settings = _settings(sd, tmp_path / "job1")
+        settings["image_cache"] = {"enabled": True, "path": str(tmp_path / "cache")}
+        os.makedirs(settings["runtime_scratch_dir"])
+        first = _generate_images_sd(["p1", "p1", "p2"], settings)
+        assert sd.request_count == 2
+
+        settings["runtime_scratch_dir"] = str(tmp_path / "job2")
+        os.makedirs(settings["runtime_scratch_dir"])
+        second = _generate_images_sd(["p1", "p1", "p2", "p3"], settings)
+        # p3だけが新たに生成される
+        assert sd.request_count == 3
+    assert len(second) == 4
+    for a, b in zip(first, second):
+        with open(a, "rb") as fa, open(b, "rb") as fb:
+            assert fa.read() == fb.read()
+
+def test_cache_key_depends_on_payload():
+    """モデルやシード、同じプロンプトの何枚目かが違えば別のキーになることをテスト"""
+    from modules.image_cache import image_key
+    payload = {"prompt": "p", "seed": -1, "width": 8, "height": 8}
+    assert image_key(payload) == image_key({**payload, "batch_size": 2})
+    assert image_key(payload) != image_key({**payload, "seed": 1})
+    assert image_key(payload) != image_key({**payload, "override_settings": {"sd_model_checkpoint": "m"}})
+    assert image_key(payload, 0) != image_key(payload, 1)
+    assert image_key(payload) != image_key(payload, postprocess={"size": [16, 28]})
+
+class _ChunkedResponse:
+    def __init__(self, body, size):
+        self.chunks = [body[i:i + size] for i in range(0, len(body), size)]
+
+    def iter_content(self, chunk_size):
+        return iter(self.chunks)
+
+def test_stream_sd_images_decodes_across_chunks(tmp_path):
+    """応答を細かく分割して受信しても、base64をデコードした画像が元と一致することをテスト"""
+    pngs = [make_png(4, 4, padding_bytes=n) for n in (0, 5, 11)]
+    encoded = [base64.b64encode(png).decode("ascii").replace("/", "\\/") for png in pngs]
+    body = ('{"images": [' + ", ".join(f'"{e}"' for e in encoded) + '], "info": "{}"}').encode("ascii")
+    for size in (1, 3, 7, 64):
+        out_paths = [str(tmp_path / f"{size}_{i}.png") for i in range(2)]
+        written, received = _stream_sd_images(_ChunkedResponse(body, size), out_paths)
+        # out_pathsより多い画像は読み捨てる
+        assert written == out_paths
+        assert received == len(body)
+        for path, png in zip(out_paths, pngs):
+            with open(path, "rb") as f:
+                assert f.read() == png
+
+def test_upscale_renders_small_and_resizes_to_video_width(tmp_path):
+    """アップスケールが有効な場合、縮小したサイズで生成して動画の幅まで拡大することをテスト"""
+    with FakeStableDiffusion() as sd:
+        settings = _settings(sd, tmp_path, upscale={"enabled": True, "render_scale": 0.5})
+        settings["image"]["stable_diffusion"].update({"width": 256, "height": 448})
+        settings["video"] = {"resolution": [256, 448]}
+        paths = _generate_images_sd(["p1"], settings)
+        assert sd.pixels_rendered == 128 * 224
+    with Image.open(paths[0]) as img:
+        assert img.size == (256, 448)
@@ -0,0 +1,72 @@
+import json
+import threading
+import pytest
+
+from modules import tracing
+
+@pytest.fixture(autouse=True)
+def enabled_tracing():
+    tracing.reset()
+    tracing.enable()
+    yield
+    tracing.disable()
+    tracing.reset()
+
+def test_span_records_duration_and_attributes():
+    """スパンに処理時間と属性が記録されることをテスト"""
+    with tracing.span("tts.segment", index=3) as sp:
+        sp["bytes"] = 1024
+
+    spans = tracing.get_spans()
+    assert len(spans) == 1
+    assert spans[0]["name"] == "tts.segment"
+    assert spans[0]["args"] == {"index": 3, "bytes": 1024}
+    assert spans[0]["dur"] >= 0
+
+def test_span_records_error():
+    """例外が発生したスパンにはエラー内容が記録されることをテスト"""
+    with pytest.raises(ValueError):
+        with tracing.span("sd.txt2img"):
+            raise ValueError("timeout")
+    assert tracing.get_spans()[0]["args"]["error"] == "ValueError: timeout"
+
+def test_bind_attributes_propagate_to_spans():
+    """bindした属性がブロック内のスパンに付与されることをテスト"""
+    with tracing.bind(theme="日本の城"):
+        with tracing.span("stage.voice"):
+            pass
+    with tracing.span("stage.video"):
+        pass
+
+    spans = tracing.get_spans()
+    assert spans[0]["args"]["theme"] == "日本の城"
+    assert "theme" not in spans[1]["args"]
+
+def test_disabled_tracing_records_nothing():
+    """トレースが無効な場合は何も記録されないことをテスト"""
+    tracing.disable()
+    with tracing.span("stage.script"):
+        pass
+    assert tracing.get_spans() == []
+
+def test_export_writes_chrome_trace_and_summary(tmp_path):
+    """Chromeトレース形式のJSONと集計表が出力されることをテスト"""
+    def work():
+        with tracing.span("tts.segment"):
+            pass
+    threads = [threading.Thread(target=work) for _ in range(3)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    trace_path, table = tracing.export(str(tmp_path), "run")
+
+    with open(trace_path, encoding="utf-8") as f:
+        trace = json.load(f)
+    complete_events = [e for e in trace["traceEvents"] if e["ph"] == "X"]
+    assert len(complete_events) == 3
+    assert all(e["name"] == "tts.segment" for e in complete_events)
+    assert "tts.segment" in table
+    summary = json.loads((tmp_path / "run_summary.json").read_text(encoding="utf-8"))
+    assert summary["tts.segment"]["count"] == 3